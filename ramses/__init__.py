@@ -17,6 +17,10 @@ def includeme(config):
     if config.registry.database_acls:
         config.include('nefertari_guards')
 
+    config.registry.mget_parents = Settings.asbool('ramses.mget_parents')
+    config.registry.bulk_chunk_size = Settings.asint(
+        'ramses.bulk_chunk_size', 0)
+
     config.include('nefertari')
     config.include('nefertari.view')
     config.include('nefertari.json_httpexceptions')
@@ -55,6 +59,14 @@ def includeme(config):
 
     config.include('nefertari.elasticsearch')
 
+    from .indexing import setup_refresh_policies
+    setup_refresh_policies()
+
+    if Settings.asbool('ramses.index_queue'):
+        from .indexing import setup_write_behind
+        log.info('Starting write-behind indexing queue')
+        setup_write_behind(config)
+
     log.info('Starting server generation')
     generate_server(raml_root, config)
 
@@ -9,6 +9,7 @@ from nefertari.acl import CollectionACL
 from nefertari.resource import PERMISSIONS
 from nefertari.elasticsearch import ES
 
+from .cache import copy_documents
 from .utils import resolve_to_callable, is_callable_tag
 
 
@@ -108,9 +109,25 @@ def parse_acl(acl_string):
 
 
 class BaseACL(CollectionACL):
-    """ ACL Base class. """
+    """ ACL Base class.
+
+    When `_item_cache` is set, it is a :class:`ramses.cache.LRUCache`
+    of `item_model` ES documents which are read through it. ACLs of
+    cached documents are still generated on each request.
+
+    When `_single_flight` is set, it is a :class:`ramses.cache.SingleFlight`
+    which shares a single ES fetch between concurrent requests of the same
+    item.
+
+    When `_exists_fields` is set, it is a list of names of fields of ES
+    documents fetched for HEAD requests, which only check the item
+    exists.
+    """
 
     es_based = False
+    _item_cache = None
+    _single_flight = None
+    _exists_fields = None
     _collection_acl = (ALLOW_ALL, )
     _item_acl = (ALLOW_ALL, )
 
@@ -172,16 +189,57 @@ class BaseACL(CollectionACL):
         """ Get item using method depending on value of `self.es_based` """
         if not self.es_based:
             return super(BaseACL, self).__getitem__(key)
-        return self.getitem_es(self.item_db_id(key))
+        fields = None
+        if self.request.method == 'HEAD':
+            fields = self._exists_fields
+        return self.getitem_es(self.item_db_id(key), fields=fields)
 
-    def getitem_es(self, key):
-        es = ES(self.item_model.__name__)
-        obj = es.get_item(id=key)
+    def getitem_es(self, key, fields=None):
+        """ Get ES document by :key: and set its ACL.
+
+        :param fields: List of names of fields to fetch. Full document is
+            fetched if item ACL has callable principals, as they may
+            check any of its fields.
+        """
+        if any(six.callable(ace[1]) for ace in self._item_acl):
+            fields = None
+        obj = self.get_es_document(key, fields=fields)
         obj.__acl__ = self.item_acl(obj)
         obj.__parent__ = self
         obj.__name__ = key
         return obj
 
+    def get_es_document(self, key, fields=None):
+        """ Get ES document by :key: from `_item_cache` or from ES on
+        cache miss.
+
+        Copies of cached documents are returned, so ACL and request
+        processing don't change cached data. Only :fields: of the
+        document are fetched when there is no cache; otherwise full
+        documents are fetched so they can be cached.
+        """
+        cache = self._item_cache
+        if cache is None:
+            return self._fetch_es_document(key, fields=fields)
+        obj = cache.get(str(key))
+        if obj is None:
+            obj = self._fetch_es_document(key)
+            cache.set(str(key), copy_documents(obj))
+            return obj
+        return copy_documents(obj)
+
+    def _fetch_es_document(self, key, fields=None):
+        es = ES(self.item_model.__name__)
+        params = {'id': key}
+        flight_key = ('item', str(key))
+        if fields is not None:
+            params['_source_include'] = list(fields)
+            flight_key += (tuple(fields),)
+        if self._single_flight is None:
+            return es.get_item(**params)
+        return self._single_flight.do(
+            flight_key, lambda: es.get_item(**params))
+
 
 class DatabaseACLMixin(object):
     """ Mixin to be used when ACLs are stored in database. """
@@ -195,11 +253,12 @@ class DatabaseACLMixin(object):
             return get_es_item_acl(item)
         return super(DatabaseACLMixin, self).item_acl(item)
 
-    def getitem_es(self, key):
+    def getitem_es(self, key, fields=None):
         """ Override to support ACL filtering.
 
         To do so: passes `self.request` to `get_item` and uses
-        `ACLFilterES`.
+        `ACLFilterES`. Full documents are fetched regardless of
+        :fields:, as their ACLs are read from them.
         """
         from nefertari_guards.elasticsearch import ACLFilterES
         es = ACLFilterES(self.item_model.__name__)
@@ -248,6 +307,8 @@ def generate_acl(config, model_cls, raml_resource, es_based=True):
 
     class GeneratedACLBase(object):
         item_model = model_cls
+        _item_cache = getattr(model_cls, '_item_cache', None)
+        _single_flight = getattr(model_cls, '_single_flight', None)
 
         def __init__(self, request, es_based=es_based):
             super(GeneratedACLBase, self).__init__(request=request)
@@ -0,0 +1,159 @@
+"""
+In-process caches of collection responses and of ES documents, and
+coalescing of identical concurrent reads.
+
+Caches are size-bounded: least recently used entries are evicted when
+they are full. Entries expire after a TTL and are invalidated by model
+events of requests which change objects of the cached model.
+
+Hits, misses and evictions are counted to measure cache hit rate.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from nefertari.utils import dict2obj
+
+
+class LRUCache(object):
+    """ Thread-safe LRU cache with TTL.
+
+    :param max_size: Max number of entries in cache.
+    :param ttl: Number of seconds after which entries expire.
+    """
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """ Get value stored under :key: or None if it's missing or
+        expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """ Store :value: under :key:, evicting least recently used
+        entries if cache is full.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            while self._entries and len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[key] = (time.time() + self.ttl, value)
+
+    def delete(self, key):
+        """ Remove entry stored under :key: if it exists. """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """ Remove all entries. """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """ Get dict of cache metrics. """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            }
+
+
+class _Call(object):
+    """ Call in progress of :class:`SingleFlight`. """
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight(object):
+    """ Coalesce identical concurrent calls into a single call.
+
+    Callers which call `do` with a key of a call in progress wait for
+    it to finish and get copies of its result instead of making calls
+    of their own.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, func):
+        """ Call :func: unless a call under :key: is in progress, in
+        which case wait for it and return a copy of its result.
+
+        If the call in progress fails, waiting callers call :func:
+        themselves.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.failed:
+                return func()
+            return copy_documents(call.result)
+
+        try:
+            result = func()
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if not call.failed and call.waiters:
+                # Result is processed further by the caller, so waiters
+                # copy a snapshot of it
+                call.result = copy_documents(result)
+            call.done.set()
+        return result
+
+
+def copy_documents(value):
+    """ Deep copy ES documents or a list of them.
+
+    Documents returned by `nefertari.elasticsearch.ES` are rebuilt from
+    copies of their data, as their attributes can't be deep copied.
+    Nefertari meta of lists of documents is copied too.
+    """
+    if isinstance(value, list):
+        copied = type(value)(copy_documents(item) for item in value)
+        meta = getattr(value, '_nefertari_meta', None)
+        if meta is not None:
+            copied._nefertari_meta = copy.deepcopy(meta)
+        return copied
+    data = getattr(value, '_data', None)
+    if data is not None:
+        return dict2obj(copy.deepcopy(dict(data)))
+    return copy.deepcopy(value)
@@ -10,10 +10,13 @@ from .utils import (
     generate_model_name,
     dynamic_part_name,
     attr_subresource,
+    attr_subresource_type,
+    dict_key_view_attrs,
     singular_subresource,
     get_static_parent,
     get_route_name,
     get_resource_uri,
+    get_backref_name,
 )
 
 
@@ -29,6 +32,38 @@ def _get_nefertari_parent_resource(
     return default
 
 
+def _get_ancestry_chain(raml_resource, resource):
+    """ Get relationship chain which links objects of `resource` to
+    objects of its ancestor resources.
+
+    Chain is built while each resource is a relationship field of its
+    parent resource model that defines a back reference.
+
+    :param raml_resource: Instance of ramlfications.raml.ResourceNode.
+    :param resource: Nefertari resource generated for :raml_resource:.
+    :returns: List of (id_name, ancestor model, backrefs, collections)
+        tuples ordered from the closest ancestor up. 'backrefs' lead from
+        `resource` model to ancestor and 'collections' lead from ancestor
+        down to `resource` model.
+    """
+    chain = []
+    backrefs = []
+    collections = []
+    parent = resource.parent
+    while raml_resource is not None and not parent.is_root:
+        route_name = get_route_name(get_resource_uri(raml_resource))
+        backref = get_backref_name(raml_resource, route_name)
+        if backref is None:
+            break
+        backrefs = backrefs + [backref]
+        collections = [resource.collection_name] + collections
+        chain.append((parent.id_name, parent.view.Model,
+                      backrefs, collections))
+        raml_resource = get_static_parent(raml_resource)
+        resource, parent = parent, parent.parent
+    return chain
+
+
 def generate_resource(config, raml_resource, parent_resource):
     """ Perform complete one resource configuration process
 
@@ -52,7 +87,7 @@ def generate_resource(config, raml_resource, parent_resource):
     :param raml_resource: Instance of ramlfications.raml.ResourceNode.
     :param parent_resource: Parent nefertari resource object.
     """
-    from .models import get_existing_model
+    from .models import get_existing_model, setup_ancestry
 
     # Don't generate resources for dynamic routes as they are already
     # generated by their parent
@@ -71,6 +106,8 @@ def generate_resource(config, raml_resource, parent_resource):
     # we don't need to get model
     is_singular = singular_subresource(raml_resource, route_name)
     is_attr_res = attr_subresource(raml_resource, route_name)
+    is_dict_attr = is_attr_res and attr_subresource_type(
+        raml_resource, route_name) == 'dict'
     if not parent_resource.is_root and (is_attr_res or is_singular):
         model_cls = parent_resource.view.Model
     else:
@@ -86,16 +123,19 @@ def generate_resource(config, raml_resource, parent_resource):
         model_cls=model_cls,
         raml_resource=raml_resource)
 
-    # Generate dynamic part name
+    # Generate dynamic part name. Item routes of dict attribute
+    # resources represent keys of the dict
     if not is_singular:
         resource_kwargs['id_name'] = dynamic_part_name(
             raml_resource=raml_resource,
             route_name=route_name,
-            pk_field=model_cls.pk_field())
+            pk_field='key' if is_dict_attr else model_cls.pk_field())
 
     # Generate REST view
     log.info('Generating view for `{}`'.format(route_name))
     view_attrs = resource_view_attrs(raml_resource, is_singular)
+    if is_dict_attr:
+        view_attrs = dict_key_view_attrs(view_attrs)
     resource_kwargs['view'] = generate_rest_view(
         config,
         model_cls=model_cls,
@@ -112,6 +152,12 @@ def generate_resource(config, raml_resource, parent_resource):
         view_cls._parent_model = view_cls.Model
         view_cls.Model = get_existing_model(model_name)
 
+    # Nested collection items are checked to belong to parent object
+    # using back reference field which points to it
+    if not (is_singular or is_attr_res or parent_resource.is_root):
+        resource_kwargs['view']._parent_backref = get_backref_name(
+            raml_resource, route_name)
+
     # Create new nefertari resource
     log.info('Creating new resource for `{}`'.format(route_name))
     clean_uri = resource_uri.strip('/')
@@ -119,7 +165,24 @@ def generate_resource(config, raml_resource, parent_resource):
     if not is_singular:
         resource_args += (clean_uri,)
 
-    return parent_resource.add(*resource_args, **resource_kwargs)
+    new_resource = parent_resource.add(*resource_args, **resource_kwargs)
+
+    # Denormalize ancestry of nested collection items into their
+    # ES documents if model asks for it
+    is_collection = not (is_singular or is_attr_res)
+    if is_collection and getattr(model_cls, '_es_ancestry', False):
+        chain = _get_ancestry_chain(raml_resource, new_resource)
+        if chain:
+            setup_ancestry(config, model_cls, chain)
+            new_resource.view._es_ancestry = True
+
+    # HEAD requests of collection items only fetch fields of ES
+    # documents needed to check the items exist
+    if is_collection:
+        resource_kwargs['factory']._exists_fields = (
+            new_resource.view.exists_fields())
+
+    return new_resource
 
 
 def generate_server(raml_root, config):
@@ -0,0 +1,356 @@
+"""
+Refresh policies of resources and write-behind indexing of documents
+in Elasticsearch.
+
+Resources which declare a refresh policy send bulk actions of their
+requests with the matching `refresh` param of the ES bulk API, so that
+only requests of resources which need changes to be visible to the
+next read pay for index refreshes.
+
+When write-behind indexing is enabled, bulk actions which engines run
+to index and delete documents of objects changed by requests are put
+in a queue instead of being sent to ES before the response. For
+requests processed in a transaction, actions are queued after it is
+committed. A background worker sends queued actions with the ES bulk
+API when `flush_size` actions are queued or the oldest of them has
+waited `flush_interval` seconds, retrying failed batches.
+
+When the queue is full, writers wait for up to `put_timeout` seconds
+for the worker to free it up and then index their documents
+synchronously. Requests which refresh the index, either because of
+the refresh policy of the resource or the `_refresh_index` query param,
+and actions run without a request (e.g. by scripts) are always indexed
+synchronously.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque, OrderedDict
+
+from nefertari.utils import dictset
+
+
+log = logging.getLogger(__name__)
+
+
+# Values of ES bulk API `refresh` param of refresh policies
+REFRESH_POLICIES = {
+    'none': False,
+    'immediate': True,
+}
+
+
+class IndexQueue(object):
+    """ Bounded queue of ES bulk actions flushed by a background worker.
+
+    :param send: Callable which sends a list of bulk actions to ES.
+    :param flush_size: Max number of actions sent in a single batch.
+    :param flush_interval: Number of seconds after which queued actions
+        are sent even if there are less than `flush_size` of them.
+    :param max_size: Max number of queued actions.
+    :param max_retries: Number of times failed batch is retried.
+    :param retry_delay: Number of seconds before the first retry of a
+        batch. It is doubled on each retry.
+    :param put_timeout: Number of seconds `put` waits for free space in
+        full queue.
+    """
+    def __init__(self, send, flush_size=500, flush_interval=1.0,
+                 max_size=10000, max_retries=3, retry_delay=1.0,
+                 put_timeout=5.0):
+        self.send = send
+        self.flush_size = int(flush_size)
+        self.flush_interval = float(flush_interval)
+        self.max_size = int(max_size)
+        self.max_retries = int(max_retries)
+        self.retry_delay = float(retry_delay)
+        self.put_timeout = float(put_timeout)
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stopped = False
+        self._thread = None
+        self.flushed = 0
+        self.failed = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def start(self):
+        """ Start the background worker. """
+        self._thread = threading.Thread(
+            target=self._run, name='ramses-index-queue')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """ Stop the worker after it sends all queued actions. """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def put(self, actions):
+        """ Queue bulk :actions:.
+
+        Waits for free space if queue is full. Returns False if actions
+        weren't queued, in which case caller should send them itself.
+        """
+        actions = list(actions)
+        deadline = time.time() + self.put_timeout
+        with self._cond:
+            while len(self._items) + len(actions) > self.max_size:
+                remaining = deadline - time.time()
+                if self._stopped or remaining <= 0:
+                    self.rejected += len(actions)
+                    return False
+                self._cond.wait(remaining)
+            if self._stopped:
+                self.rejected += len(actions)
+                return False
+            now = time.time()
+            self._items.extend((now, action) for action in actions)
+            self._cond.notify_all()
+        return True
+
+    def join(self, timeout=None):
+        """ Wait until all queued actions are sent.
+
+        Returns False if they weren't sent in :timeout: seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._items or self._in_flight:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        """ Get dict of queue metrics.
+
+        'lag' is the number of seconds the oldest queued action has been
+        waiting for.
+        """
+        with self._cond:
+            lag = time.time() - self._items[0][0] if self._items else 0.0
+            return {
+                'depth': len(self._items),
+                'in_flight': self._in_flight,
+                'lag': lag,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'retries': self.retries,
+                'rejected': self.rejected,
+            }
+
+    def _take(self):
+        """ Wait for and take a batch of actions to send.
+
+        Returns None when worker is stopped and queue is empty.
+        """
+        with self._cond:
+            while not self._items and not self._stopped:
+                self._cond.wait()
+            while self._items and not self._stopped:
+                if len(self._items) >= self.flush_size:
+                    break
+                remaining = (self._items[0][0] + self.flush_interval -
+                             time.time())
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self._items:
+                return None
+            size = min(self.flush_size, len(self._items))
+            batch = [self._items.popleft()[1] for _ in range(size)]
+            self._in_flight = len(batch)
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            try:
+                self._flush(batch)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+
+    def _flush(self, batch):
+        """ Send :batch: of actions, retrying on failure. """
+        actions = merge_actions(batch)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                self.send(actions)
+            except Exception:
+                log.exception('Failed to send {} Elasticsearch action(s) '
+                              '(attempt {})'.format(len(actions), attempt + 1))
+            else:
+                self.flushed += len(actions)
+                return
+        self.failed += len(actions)
+        log.error('Gave up sending {} Elasticsearch action(s): {}'.format(
+            len(actions), [(a['_op_type'], a['_type'], a['_id'])
+                           for a in actions]))
+
+
+def merge_actions(actions):
+    """ Drop :actions: of documents which are overridden by later
+    actions.
+
+    Index and delete actions override all earlier actions of their
+    documents, while partial updates are applied on top of them.
+    """
+    merged = OrderedDict()
+    for action in actions:
+        key = (action['_index'], action['_type'], str(action['_id']))
+        if action['_op_type'] in ('index', 'delete'):
+            merged.pop(key, None)
+            merged[key] = [action]
+        else:
+            merged.setdefault(key, []).append(action)
+    return [action for doc_actions in merged.values()
+            for action in doc_actions]
+
+
+def get_refresh(request):
+    """ Get value of ES `refresh` param of bulk actions run by
+    :request:.
+
+    Refresh policy of the requested resource, stored in
+    `request.es_refresh` by its view, takes precedence over
+    `_refresh_index` query param. Returns None if neither is set.
+    """
+    from nefertari.elasticsearch import ES
+    if request is None:
+        return None
+    policy = getattr(request, 'es_refresh', None)
+    if policy in REFRESH_POLICIES:
+        return REFRESH_POLICIES[policy]
+    query_params = dictset(request.params.mixed())
+    if ('_refresh_index' in query_params and
+            ES.settings.asbool('enable_refresh_query')):
+        return query_params.asbool('_refresh_index')
+    return None
+
+
+def send_bulk(documents_actions, refresh=None):
+    """ Run :documents_actions: with ES bulk API.
+
+    :param refresh: Value of `refresh` param of the request.
+    """
+    from elasticsearch import helpers
+    from nefertari.elasticsearch import ES
+    kwargs = {'client': ES.api, 'actions': documents_actions}
+    if refresh is not None:
+        kwargs['refresh'] = refresh
+    executed_num, errors = helpers.bulk(**kwargs)
+    log.info('Successfully executed {} Elasticsearch action(s)'.format(
+        executed_num))
+    if errors:
+        raise Exception('Errors happened when executing Elasticsearch '
+                        'actions: {}'.format(errors))
+
+
+def refresh_policies(send):
+    """ Make a replacement of `nefertari.elasticsearch._bulk_body` which
+    applies refresh policies of resources.
+
+    :param send: Original `_bulk_body` used for requests of resources
+        without a refresh policy.
+    """
+    def bulk_body(documents_actions, request):
+        if getattr(request, 'es_refresh', None) not in REFRESH_POLICIES:
+            return send(documents_actions, request)
+        send_bulk(documents_actions, refresh=get_refresh(request))
+
+    return bulk_body
+
+
+def setup_refresh_policies():
+    """ Make ES bulk actions of requests apply refresh policies of
+    requested resources.
+
+    Policies are only installed when some model declares `_es_refresh`,
+    and only once per process: installation is marked by
+    `nefertari.elasticsearch._ramses_refresh_policies`.
+    """
+    from nefertari import engine
+    import nefertari.elasticsearch as es_module
+    if getattr(es_module, '_ramses_refresh_policies', False):
+        return
+    models = engine.get_document_classes().values()
+    if not any(getattr(model, '_es_refresh', None) for model in models):
+        return
+    es_module._bulk_body = refresh_policies(es_module._bulk_body)
+    es_module._ramses_refresh_policies = True
+
+
+def write_behind(queue, send_now):
+    """ Make a replacement of `nefertari.elasticsearch._bulk_body` which
+    puts actions in :queue:.
+
+    :param queue: Instance of :class:`IndexQueue`.
+    :param send_now: Original `_bulk_body` used for synchronous indexing.
+    """
+    def enqueue(documents_actions, request):
+        if not queue.put(documents_actions):
+            log.warning('Indexing queue is full, indexing {} document(s) '
+                        'synchronously'.format(len(documents_actions)))
+            send_now(documents_actions, request)
+
+    def bulk_body(documents_actions, request):
+        if request is None or get_refresh(request):
+            return send_now(documents_actions, request)
+
+        tm = getattr(request, 'tm', None)
+        if tm is None:
+            return enqueue(documents_actions, request)
+
+        def after_commit(success):
+            if success:
+                enqueue(documents_actions, request)
+        tm.get().addAfterCommitHook(after_commit)
+
+    return bulk_body
+
+
+def setup_write_behind(config):
+    """ Route ES bulk actions of requests through an :class:`IndexQueue`
+    configured with `ramses.index_queue_*` settings.
+
+    The queue is stored in `config.registry.index_queue`. It is set up
+    once per process: repeated calls reuse the running queue, which is
+    stored in `nefertari.elasticsearch._ramses_index_queue`.
+    """
+    import nefertari.elasticsearch as es_module
+    queue = getattr(es_module, '_ramses_index_queue', None)
+    if queue is None:
+        settings = dictset(config.registry.settings)
+        send_now = es_module._bulk_body
+        queue = IndexQueue(
+            send=lambda actions: send_now(actions, None),
+            flush_size=settings.asint('ramses.index_queue_flush_size', 500),
+            flush_interval=settings.asfloat(
+                'ramses.index_queue_flush_interval', 1.0),
+            max_size=settings.asint('ramses.index_queue_max_size', 10000),
+            max_retries=settings.asint('ramses.index_queue_max_retries', 3),
+            put_timeout=settings.asfloat(
+                'ramses.index_queue_put_timeout', 5.0),
+        )
+        queue.start()
+        atexit.register(queue.stop)
+        es_module._bulk_body = write_behind(queue, send_now)
+        es_module._ramses_index_queue = queue
+    config.registry.index_queue = queue
+    return queue
@@ -0,0 +1,295 @@
+"""
+Atomic updates and paged reads of list and dict fields.
+
+Values are added to and removed from a field with database-side
+operations, so the object isn't loaded and the field isn't rewritten.
+ES documents are then updated with a partial update of the field.
+Slices of list fields and keys of dict fields are read from the
+database without loading the rest of the object or of the field.
+
+Params have the format accepted by engines' `update_iterables`: list
+values or dict keys prefixed with '-' are removed, others are added.
+Empty params remove all values.
+
+Supported fields are list and dict fields of nefertari_mongodb models
+and list fields of nefertari_sqla models (PostgreSQL arrays).
+`update_iterable`, `get_slice` and `get_keys` return None for other
+fields, in which case the object should be loaded and its field used.
+"""
+import logging
+
+from nefertari.elasticsearch import ES
+from nefertari.json_httpexceptions import JHTTPBadRequest, JHTTPNotFound
+
+
+log = logging.getLogger(__name__)
+
+
+def split_keys(keys):
+    """ Split :keys: into lists of values to add and to remove.
+
+    Keys starting with '__' are ignored.
+    """
+    positive, negative = [], []
+    for key in keys:
+        if key.startswith('__'):
+            continue
+        if key.startswith('-'):
+            negative.append(key[1:])
+        else:
+            positive.append(key.strip())
+    return positive, negative
+
+
+def update_iterable(model_cls, pk, attr, params, unique=True,
+                    request=None):
+    """ Atomically update list or dict field :attr: of object with
+    primary key :pk: and reindex the field in ES.
+
+    :param model_cls: Model class of the object.
+    :param pk: Primary key value of the object.
+    :param attr: Name of list or dict field.
+    :param params: List of values or dict of keys to add and remove.
+    :param unique: Boolean indicating whether values which are already
+        present in list should not be added.
+    :param request: Current request.
+    :returns: New value of the field or None if the field can't be
+        updated atomically.
+    """
+    if hasattr(model_cls, '_get_collection'):
+        value = _update_mongo(model_cls, pk, attr, params, unique)
+    elif hasattr(model_cls, '__table__'):
+        value = _update_sqla(model_cls, pk, attr, params, unique)
+    else:
+        value = None
+    if value is not None:
+        index_field(model_cls, pk, attr, value, request=request)
+    return value
+
+
+def get_slice(model_cls, pk, attr, start, limit):
+    """ Get :limit: values of list field :attr: of object with primary
+    key :pk: starting at index :start:.
+
+    :returns: List of values or None if the field can't be sliced in
+        the database.
+    """
+    if hasattr(model_cls, '_get_collection'):
+        return _slice_mongo(model_cls, pk, attr, start, limit)
+    elif hasattr(model_cls, '__table__'):
+        return _slice_sqla(model_cls, pk, attr, start, limit)
+    return None
+
+
+def get_keys(model_cls, pk, attr, keys):
+    """ Get :keys: of dict field :attr: of object with primary key :pk:.
+
+    :returns: Dict of those of :keys: which are present in the field or
+        None if the keys can't be read from the database separately.
+    """
+    if hasattr(model_cls, '_get_collection'):
+        return _get_keys_mongo(model_cls, pk, attr, keys)
+    return None
+
+
+def index_field(model_cls, pk, attr, value, request=None):
+    """ Set :attr: of ES document of object with primary key :pk: to
+    :value: with partial document update.
+
+    Update is sent as a bulk action like documents indexed by engines,
+    so it is queued with them by write-behind indexing.
+    """
+    from nefertari import elasticsearch
+    if not getattr(model_cls, '_index_enabled', False):
+        return
+    es = ES(model_cls.__name__)
+    action = {
+        '_op_type': 'update',
+        '_index': es.index_name,
+        '_type': es.doc_type,
+        '_id': pk,
+        'doc': {attr: value},
+    }
+    elasticsearch._bulk_body([action], request)
+
+
+def _list_changes(params):
+    """ Get lists of values to add to and remove from list field.
+
+    Returns None if all values should be removed.
+    """
+    if params is None or params == '':
+        return None
+    keys = list(params.keys()) if isinstance(params, dict) else params
+    positive, negative = split_keys(keys)
+    if not (positive + negative):
+        raise JHTTPBadRequest('Missing params')
+    return positive, negative
+
+
+def _dict_changes(params):
+    """ Get dict of keys to set and list of keys to remove from dict
+    field.
+
+    Returns None if all keys should be removed.
+    """
+    if params is None or params == '' or not params:
+        return None
+    positive, negative = split_keys(list(params.keys()))
+    values = {str(key): params[key] for key in positive}
+    negative = [key for key in negative if key not in values]
+    return values, negative
+
+
+def mongo_list_updates(db_field, params, unique=True):
+    """ Get MongoDB update documents that change list field. """
+    changes = _list_changes(params)
+    if changes is None:
+        return [{'$set': {db_field: []}}]
+    positive, negative = changes
+    updates = []
+    if positive:
+        operator = '$addToSet' if unique else '$push'
+        updates.append({operator: {db_field: {'$each': positive}}})
+    if negative:
+        updates.append({'$pullAll': {db_field: negative}})
+    return updates
+
+
+def mongo_dict_updates(db_field, params):
+    """ Get MongoDB update documents that change dict field. """
+    changes = _dict_changes(params)
+    if changes is None:
+        return [{'$set': {db_field: {}}}]
+    values, negative = changes
+    update = {}
+    if values:
+        update['$set'] = {
+            '{}.{}'.format(db_field, key): val
+            for key, val in values.items()}
+    if negative:
+        update['$unset'] = {
+            '{}.{}'.format(db_field, key): '' for key in negative}
+    return [update] if update else []
+
+
+def _update_mongo(model_cls, pk, attr, params, unique):
+    import mongoengine as mongo
+    field = model_cls._fields.get(attr)
+    if isinstance(field, mongo.DictField):
+        updates = mongo_dict_updates(field.db_field, params)
+        default = {}
+    elif isinstance(field, mongo.ListField):
+        updates = mongo_list_updates(field.db_field, params, unique)
+        default = []
+    else:
+        return None
+
+    pk_field = model_cls._fields[model_cls.pk_field()]
+    query = {pk_field.db_field: pk_field.to_mongo(pk)}
+    collection = model_cls._get_collection()
+    document = None
+    # Adding and removing values of the same field in a single update
+    # conflicts, so they are separate updates
+    for update in updates:
+        document = collection.find_and_modify(
+            query, update, new=True, fields={field.db_field: True})
+        if document is None:
+            raise JHTTPNotFound('{}({}) not found'.format(
+                model_cls.__name__, pk))
+    if document is None:
+        document = collection.find_one(query, {field.db_field: True})
+        if document is None:
+            raise JHTTPNotFound('{}({}) not found'.format(
+                model_cls.__name__, pk))
+    return document.get(field.db_field, default)
+
+
+def _update_sqla(model_cls, pk, attr, params, unique):
+    from sqlalchemy import case, func, literal
+    from pyramid_sqlalchemy import Session
+    from nefertari_sqla.fields import ListField
+
+    table = model_cls.__table__
+    column = table.c.get(attr)
+    if not isinstance(column, ListField):
+        return None
+
+    changes = _list_changes(params)
+    if changes is None:
+        value = []
+    else:
+        positive, negative = changes
+        value = column
+        for val in positive:
+            appended = func.array_append(value, val)
+            if unique:
+                appended = case(
+                    [(literal(val) == func.any(value), value)],
+                    else_=appended)
+            value = appended
+        for val in negative:
+            value = func.array_remove(value, val)
+
+    pk_column = table.c[model_cls.pk_field()]
+    stmt = table.update().where(pk_column == pk).values(
+        {column: value}).returning(column)
+    row = Session().execute(stmt).fetchone()
+    if row is None:
+        raise JHTTPNotFound('{}({}) not found'.format(
+            model_cls.__name__, pk))
+    return list(row[0] or [])
+
+
+def _slice_mongo(model_cls, pk, attr, start, limit):
+    import mongoengine as mongo
+    field = model_cls._fields.get(attr)
+    if not isinstance(field, mongo.ListField):
+        return None
+    pk_field = model_cls._fields[model_cls.pk_field()]
+    query = {pk_field.db_field: pk_field.to_mongo(pk)}
+    projection = {
+        pk_field.db_field: True,
+        field.db_field: {'$slice': [start, limit]},
+    }
+    document = model_cls._get_collection().find_one(query, projection)
+    if document is None:
+        raise JHTTPNotFound('{}({}) not found'.format(
+            model_cls.__name__, pk))
+    return document.get(field.db_field) or []
+
+
+def _slice_sqla(model_cls, pk, attr, start, limit):
+    from sqlalchemy import select
+    from pyramid_sqlalchemy import Session
+    from nefertari_sqla.fields import ListField
+
+    table = model_cls.__table__
+    column = table.c.get(attr)
+    if not isinstance(column, ListField):
+        return None
+    # PostgreSQL arrays are indexed from 1 and slice bounds are inclusive
+    pk_column = table.c[model_cls.pk_field()]
+    stmt = select([column[start + 1:start + limit]]).where(pk_column == pk)
+    row = Session().execute(stmt).fetchone()
+    if row is None:
+        raise JHTTPNotFound('{}({}) not found'.format(
+            model_cls.__name__, pk))
+    return list(row[0] or [])
+
+
+def _get_keys_mongo(model_cls, pk, attr, keys):
+    import mongoengine as mongo
+    field = model_cls._fields.get(attr)
+    if not isinstance(field, mongo.DictField):
+        return None
+    pk_field = model_cls._fields[model_cls.pk_field()]
+    query = {pk_field.db_field: pk_field.to_mongo(pk)}
+    projection = {pk_field.db_field: True}
+    for key in keys:
+        projection['{}.{}'.format(field.db_field, key)] = True
+    document = model_cls._get_collection().find_one(query, projection)
+    if document is None:
+        raise JHTTPNotFound('{}({}) not found'.format(
+            model_cls.__name__, pk))
+    return document.get(field.db_field) or {}
@@ -8,6 +8,8 @@ from .utils import (
     resource_schema, generate_model_name,
     get_events_map)
 from . import registry
+from .cache import LRUCache, SingleFlight
+from .indexing import REFRESH_POLICIES
 
 
 log = logging.getLogger(__name__)
@@ -42,6 +44,80 @@ type_fields = {
 }
 
 
+class ESAncestryMixin(object):
+    """ Model mixin that stores IDs of object's ancestors in its ES
+    document.
+
+    Ancestors are objects under which the object is accessible in nested
+    routes. E.g. for route /users/{user_username}/stories/{story_id}/comments
+    ancestors of 'Comment' are the 'Story' and the 'User' it belongs to.
+
+    `_ancestry` is a map of {ancestor id_name: [backref names]}, where
+    backref names lead from the object to the ancestor. It is populated
+    by `setup_ancestry` when server is generated. IDs of ancestors are
+    stored under the '_ancestors' key of document as
+    {ancestor id_name: [ancestor IDs]}.
+    """
+    _es_ancestry = True
+    _ancestry = None
+
+    def get_ancestors(self):
+        """ Get map of {ancestor id_name: [ancestor IDs]}. """
+        ancestors = {}
+        for id_name, backrefs in (self._ancestry or {}).items():
+            objects = follow_relationships([self], backrefs)
+            ancestors[id_name] = sorted(set(
+                str(getattr(obj, obj.pk_field())) for obj in objects))
+        return ancestors
+
+    def to_dict(self, **kwargs):
+        """ Add ancestors to top-level documents being indexed only.
+
+        Objects are serialized with `request` for API responses, which
+        must not expose the internal '_ancestors' field.
+        """
+        data = super(ESAncestryMixin, self).to_dict(**kwargs)
+        if kwargs.get('_depth') is None and 'request' not in kwargs:
+            data['_ancestors'] = self.get_ancestors()
+        return data
+
+    @classmethod
+    def get_es_mapping(cls, **kwargs):
+        mapping = super(ESAncestryMixin, cls).get_es_mapping(**kwargs)
+        properties = list(mapping.values())[0]['properties']
+        properties['_ancestors'] = {
+            'type': 'object',
+            'properties': {
+                id_name: {'type': 'string', 'index': 'not_analyzed'}
+                for id_name in (cls._ancestry or {})
+            },
+        }
+        return mapping
+
+
+def follow_relationships(objects, fields):
+    """ Get objects related to :objects: through the chain of
+    relationship :fields:.
+
+    Values of relationship fields may be single objects or lists of
+    objects. Lists are flattened, None values are skipped.
+
+    :param objects: Sequence of DB objects.
+    :param fields: Names of relationship fields to follow in order.
+    """
+    objects = list(objects)
+    for field in fields:
+        related = []
+        for obj in objects:
+            value = getattr(obj, field, None)
+            if isinstance(value, (list, tuple)):
+                related += value
+            elif value is not None:
+                related.append(value)
+        objects = related
+    return objects
+
+
 def get_existing_model(model_name):
     """ Try to find existing model class named `model_name`.
 
@@ -102,6 +178,7 @@ def generate_model_cls(config, schema, model_name, raml_resource,
     model_name = str(model_name)
     metaclass = type(base_cls)
     auth_model = schema.get('_auth_model', False)
+    es_ancestry = es_based and schema.get('_es_ancestry', False)
 
     bases = []
     if config.registry.database_acls:
@@ -109,6 +186,8 @@ def generate_model_cls(config, schema, model_name, raml_resource,
         bases.append(guards_engine.DocumentACLMixin)
     if auth_model:
         bases.append(AuthModelMethodsMixin)
+    if es_ancestry:
+        bases.append(ESAncestryMixin)
     bases.append(base_cls)
 
     attrs = {
@@ -120,6 +199,22 @@ def generate_model_cls(config, schema, model_name, raml_resource,
     }
     if '_nesting_depth' in schema:
         attrs['_nesting_depth'] = schema.get('_nesting_depth')
+    if es_ancestry:
+        attrs['_es_ancestry'] = True
+    if schema.get('_set_based_bulk'):
+        attrs['_set_based_bulk'] = True
+    if es_based and schema.get('_es_reads'):
+        attrs['_es_reads'] = True
+    if schema.get('_coalesce_reads'):
+        attrs['_single_flight'] = SingleFlight()
+    for cache_option in ('_cache_control', '_cache_validator'):
+        if schema.get(cache_option):
+            attrs[cache_option] = schema[cache_option]
+    if schema.get('_es_refresh'):
+        if schema['_es_refresh'] not in REFRESH_POLICIES:
+            raise ValueError('Unknown refresh policy: {}'.format(
+                schema['_es_refresh']))
+        attrs['_es_refresh'] = schema['_es_refresh']
 
     # Generate fields from properties
     properties = schema.get('properties', {})
@@ -166,6 +261,11 @@ def generate_model_cls(config, schema, model_name, raml_resource,
     model_cls = metaclass(model_name, tuple(bases), attrs)
     setup_model_event_subscribers(config, model_cls, schema)
     setup_fields_processors(config, model_cls, schema)
+    if schema.get('_collection_cache'):
+        setup_collection_cache(
+            config, model_cls, schema['_collection_cache'])
+    if schema.get('_item_cache'):
+        setup_item_cache(config, model_cls, schema['_item_cache'])
     return model_cls, auth_model
 
 
@@ -272,3 +372,214 @@ def setup_fields_processors(config, model_cls, schema):
             }
             config.add_field_processors(
                 backref_processors, **setup_kwargs)
+
+
+def setup_collection_cache(config, model_cls, settings):
+    """ Set up in-process cache of `model_cls` collection responses.
+
+    Cache is stored at `model_cls._collection_cache` and is cleared
+    after each request which creates, updates or deletes objects of
+    `model_cls`.
+
+    :param config: Pyramid Configurator instance.
+    :param model_cls: Model class collection responses of which are
+        cached.
+    :param settings: Dict of `LRUCache` kwargs ('max_size',
+        'ttl') or True to use defaults.
+    """
+    from nefertari import events
+    if not isinstance(settings, dict):
+        settings = {}
+    cache = LRUCache(**settings)
+    model_cls._collection_cache = cache
+
+    def invalidate(event):
+        cache.clear()
+        log.debug('{} collection cache invalidated'.format(
+            model_cls.__name__))
+
+    change_events = [
+        events.AfterCreate, events.AfterUpdate, events.AfterReplace,
+        events.AfterDelete, events.AfterUpdateMany, events.AfterDeleteMany,
+    ]
+    config.subscribe_to_events(invalidate, change_events, model=model_cls)
+    return cache
+
+
+def setup_item_cache(config, model_cls, settings):
+    """ Set up in-process cache of `model_cls` ES documents.
+
+    Cache is stored at `model_cls._item_cache` and is keyed by string
+    IDs of documents. Cached document is removed after a request which
+    updates or deletes its object; cache is cleared after collection
+    updates and deletes.
+
+    :param config: Pyramid Configurator instance.
+    :param model_cls: Model class ES documents of which are cached.
+    :param settings: Dict of `LRUCache` kwargs ('max_size', 'ttl') or
+        True to use defaults.
+    """
+    from nefertari import events
+    if not isinstance(settings, dict):
+        settings = {}
+    cache = LRUCache(**settings)
+    model_cls._item_cache = cache
+
+    def invalidate_item(event):
+        if event.instance is None:
+            cache.clear()
+            return
+        pk = getattr(event.instance, model_cls.pk_field(), None)
+        cache.delete(str(pk))
+
+    def invalidate(event):
+        cache.clear()
+
+    item_events = [events.AfterUpdate, events.AfterReplace, events.AfterDelete]
+    config.subscribe_to_events(invalidate_item, item_events, model=model_cls)
+    collection_events = [events.AfterUpdateMany, events.AfterDeleteMany]
+    config.subscribe_to_events(
+        invalidate, collection_events, model=model_cls)
+    return cache
+
+
+def setup_ancestry(config, model_cls, chain):
+    """ Set up denormalized ancestry of `model_cls` ES documents.
+
+    Backref paths to ancestors are stored at `model_cls._ancestry` and
+    subscribers are connected to update events of ancestor models, so
+    affected documents are reindexed when relationships that link them
+    to ancestors change.
+
+    Collection updates (PATCH/PUT of collection) are handled when they
+    change a back reference field, in which case descendants of the new
+    ancestor are reindexed.
+
+    :param config: Pyramid Configurator instance.
+    :param model_cls: Model class which is a subclass of ESAncestryMixin.
+    :param chain: List of (id_name, ancestor model, backrefs, collections)
+        tuples ordered from the closest ancestor up. 'backrefs' lead
+        from `model_cls` to ancestor and 'collections' lead from
+        ancestor down to `model_cls`.
+    """
+    from nefertari import events
+    update_events = (events.AfterUpdate, events.AfterReplace)
+    ancestry = dict(model_cls._ancestry or {})
+    previous = None
+
+    for id_name, ancestor_model, backrefs, collections in chain:
+        ancestry[id_name] = backrefs
+        subscriber = _ancestry_reindexer(model_cls, id_name, collections)
+        for evt in update_events:
+            config.add_subscriber(
+                subscriber, evt, model=ancestor_model,
+                field=collections[0])
+
+        if previous is not None:
+            # Descendants of previous ancestor are moved to another
+            # ancestor when backref of previous ancestor changes
+            prev_id_name, prev_model, prev_collections = previous
+            subscriber = _ancestry_reindexer(
+                model_cls, prev_id_name, prev_collections)
+            for evt in update_events:
+                config.add_subscriber(
+                    subscriber, evt, model=prev_model, field=backrefs[-1])
+            subscriber = _ancestry_bulk_reindexer(
+                model_cls, ancestor_model, id_name, collections)
+            config.add_subscriber(
+                subscriber, events.AfterUpdateMany, model=prev_model,
+                field=backrefs[-1])
+        previous = (id_name, ancestor_model, collections)
+
+    model_cls._ancestry = ancestry
+
+
+def _ancestry_reindexer(model_cls, id_name, collections):
+    def reindex(event):
+        pk_field = event.model.pk_field()
+        ancestor = event.model.get_item(
+            **{pk_field: getattr(event.instance, pk_field)})
+        reindex_descendants(
+            model_cls, ancestor, id_name, collections,
+            request=event.view.request)
+    return reindex
+
+
+def _ancestry_bulk_reindexer(model_cls, ancestor_model, id_name,
+                             collections):
+    """ Reindex descendants of the ancestor to which objects were moved
+    by collection update.
+
+    Updated objects themselves are not known at this point, but all of
+    them now reference the same new ancestor. Descendants which were
+    moved are found by following :collections: from it.
+    """
+    def reindex(event):
+        value = event.field.new_value
+        if value is None:
+            return
+        pk_field = ancestor_model.pk_field()
+        ancestor_id = getattr(value, pk_field, value)
+        ancestor = ancestor_model.get_item(
+            **{pk_field: ancestor_id, '_raise_on_empty': False})
+        if ancestor is not None:
+            reindex_descendants(
+                model_cls, ancestor, id_name, collections,
+                request=event.view.request)
+    return reindex
+
+
+def reindex_descendants(model_cls, ancestor, id_name, collections,
+                        request=None, chunk_size=500):
+    """ Reindex ES documents of `model_cls` objects that are or were
+    descendants of `ancestor`.
+
+    Former descendants are found in ES by `ancestor` ID stored in their
+    ancestry. Current descendants are loaded from DB by following
+    :collections: relationships from `ancestor`. IDs of former
+    descendants are collected page by page before any document is
+    reindexed, then documents are loaded from DB and indexed in chunks
+    of :chunk_size:.
+
+    :param model_cls: Model class which is a subclass of ESAncestryMixin.
+    :param ancestor: DB object which is an ancestor of `model_cls` objects.
+    :param id_name: `id_name` of ancestor's resource.
+    :param collections: Names of relationship fields which lead from
+        `ancestor` to `model_cls` objects.
+    :param request: Pyramid Request instance.
+    :param chunk_size: Number of documents to query and index at once.
+    """
+    from nefertari.elasticsearch import ES
+    from nefertari.utils import to_dicts
+    es = ES(model_cls.__name__)
+    pk_field = model_cls.pk_field()
+    ancestor_id = getattr(ancestor, ancestor.pk_field())
+
+    indexed = []
+    start = 0
+    while True:
+        page = es.get_collection(**{
+            '_ancestors.' + id_name: ancestor_id,
+            '_fields': [pk_field],
+            '_limit': chunk_size,
+            '_start': start,
+        })
+        page = list(page or [])
+        indexed += page
+        if len(page) < chunk_size:
+            break
+        start += chunk_size
+
+    descendants = follow_relationships([ancestor], collections)
+    current_ids = set(str(getattr(obj, pk_field)) for obj in descendants)
+    former = [doc for doc in indexed
+              if str(getattr(doc, pk_field)) not in current_ids]
+
+    for index in range(0, len(former), chunk_size):
+        objects = model_cls.filter_objects(
+            former[index:index + chunk_size])
+        es.index(to_dicts(objects), request=request)
+    for index in range(0, len(descendants), chunk_size):
+        es.index(
+            to_dicts(descendants[index:index + chunk_size]),
+            request=request)
@@ -1,5 +1,6 @@
 import re
 import logging
+import warnings
 from contextlib import contextmanager
 
 import six
@@ -156,6 +157,24 @@ def resource_view_attrs(raml_resource, singular=False):
     return set(filter(bool, attrs))
 
 
+def dict_key_view_attrs(attrs):
+    """ Add view method names needed for key routes of a dict attribute
+    resource to its view method names :attrs:.
+
+    Keys can be read if the dict can be read and can be changed if the
+    dict can be changed.
+
+    :param attrs: Set of view method names of the dict attribute
+        resource.
+    """
+    attrs = set(attrs)
+    if 'index' in attrs:
+        attrs.add('show')
+    if 'create' in attrs:
+        attrs.update(['replace', 'update', 'delete'])
+    return attrs
+
+
 def resource_schema(raml_resource):
     """ Get schema properties of RAML resource :raml_resource:.
 
@@ -217,18 +236,33 @@ def get_static_parent(raml_resource, method=None):
 def attr_subresource(raml_resource, route_name):
     """ Determine if :raml_resource: is an attribute subresource.
 
+    :param raml_resource: Instance of ramlfications.raml.ResourceNode.
+    :param route_name: Name of the :raml_resource:.
+    """
+    return attr_subresource_type(raml_resource, route_name) is not None
+
+
+def attr_subresource_type(raml_resource, route_name):
+    """ Get type of field represented by attribute subresource
+    :raml_resource:.
+
+    Returns 'dict', 'list' or None if :raml_resource: is not an
+    attribute subresource.
+
     :param raml_resource: Instance of ramlfications.raml.ResourceNode.
     :param route_name: Name of the :raml_resource:.
     """
     static_parent = get_static_parent(raml_resource, method='POST')
     if static_parent is None:
-        return False
+        return None
     schema = resource_schema(static_parent) or {}
     properties = schema.get('properties', {})
     if route_name in properties:
         db_settings = properties[route_name].get('_db_settings', {})
-        return db_settings.get('type') in ('dict', 'list')
-    return False
+        field_type = db_settings.get('type')
+        if field_type in ('dict', 'list'):
+            return field_type
+    return None
 
 
 def singular_subresource(raml_resource, route_name):
@@ -251,6 +285,29 @@ def singular_subresource(raml_resource, route_name):
     return is_obj and single_obj
 
 
+def get_backref_name(raml_resource, route_name):
+    """ Get name of the back reference field of relationship which
+    :raml_resource: represents.
+
+    E.g. for resource /users/{username}/stories, where 'stories' is
+    a relationship field of 'User' with 'backref_name' set to 'owner',
+    'owner' is returned. None is returned when :raml_resource: doesn't
+    represent a relationship or relationship has no back reference.
+
+    :param raml_resource: Instance of ramlfications.raml.ResourceNode.
+    :param route_name: Name of the :raml_resource:.
+    """
+    static_parent = get_static_parent(raml_resource, method='POST')
+    if static_parent is None:
+        return None
+    schema = resource_schema(static_parent) or {}
+    properties = schema.get('properties', {})
+    field_props = properties.get(route_name) or {}
+    db_settings = field_props.get('_db_settings', {})
+    if db_settings.get('type') == 'relationship':
+        return db_settings.get('backref_name')
+
+
 def is_callable_tag(tag):
     """ Determine whether :tag: is a valid callable string tag.
 
@@ -328,11 +385,17 @@ def get_events_map():
 def patch_view_model(view_cls, model_cls):
     """ Patches view_cls.Model with model_cls.
 
+    Deprecated: patching is not thread-safe, as the view class is shared
+    by concurrent requests.
+
     :param view_cls: View class "Model" param of which should be
         patched
     :param model_cls: Model class which should be used to patch
         view_cls.Model
     """
+    warnings.warn(
+        'patch_view_model is deprecated and will be removed in a future '
+        'release', DeprecationWarning, stacklevel=3)
     original_model = view_cls.Model
     view_cls.Model = model_cls
 
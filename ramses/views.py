@@ -1,10 +1,23 @@
+import base64
+import hashlib
+import itertools
+import json
 import logging
+from datetime import datetime
 
 import six
+from pyramid.httpexceptions import HTTPError, HTTPNotModified
+from pyramid.response import Response
 from nefertari.view import BaseView as NefertariBaseView
-from nefertari.json_httpexceptions import JHTTPNotFound
+from nefertari.json_httpexceptions import (
+    JHTTPNotFound, JHTTPBadRequest, JHTTPForbidden, exception_response)
+from nefertari.utils import (
+    DataProxy, FieldData, dictset, json_dumps, process_limit, split_strip)
+from nefertari import events, wrappers
+from webob.datetime_utils import UTC
 
-from .utils import patch_view_model
+from .cache import copy_documents
+from .iterables import get_keys, get_slice, update_iterable
 
 
 log = logging.getLogger(__name__)
@@ -32,6 +45,157 @@ item_methods = {
     'options':  'item_options',
 }
 
+"""
+Query params which request a page of collection
+
+"""
+page_params = ('_limit', '_start', '_page')
+
+"""
+Query params which can only be applied by ES
+
+"""
+es_only_params = ('q', '_search_fields')
+
+"""
+Map of {stream format: content type} of streamed collection responses
+
+"""
+stream_formats = {
+    'ndjson':   'application/x-ndjson',
+    'json':     'application/json',
+}
+
+
+def _references(obj, field, parent_obj, pk_field):
+    """ Check :field: of :obj: references :parent_obj:.
+
+    Referenced value may be an object (DB object or nested ES
+    document), a primary key of :parent_obj: (ES document) or a list
+    of those when the field is a list.
+    """
+    related = getattr(obj, field, None)
+    if not isinstance(related, (list, tuple)):
+        related = [related]
+    related_ids = [getattr(val, pk_field, val) for val in related]
+    parent_id = str(getattr(parent_obj, pk_field, None))
+    return parent_id in [str(id_) for id_ in related_ids
+                         if id_ is not None]
+
+
+def _pk_after_queryset(model_cls, value):
+    """ Get DB queryset of :model_cls: objects with primary key greater
+    than :value:.
+
+    Returns None if the engine of :model_cls: is not supported.
+    """
+    pk_field = model_cls.pk_field()
+    if hasattr(model_cls, '_get_collection'):
+        return model_cls.objects(**{pk_field + '__gt': value})
+    elif hasattr(model_cls, '__table__'):
+        from pyramid_sqlalchemy import Session
+        pk_column = getattr(model_cls, pk_field)
+        return Session().query(model_cls).filter(pk_column > value)
+    return None
+
+
+def encode_cursor(values, sort=None):
+    """ Encode list of sort :values: of a document and :sort: spec of
+    the request into an opaque cursor token.
+    """
+    data = json.dumps({'values': values, 'sort': sort}).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(token, length, sort=None):
+    """ Decode cursor :token: into a list of :length: sort values.
+
+    :param token: Cursor token created with `encode_cursor`.
+    :param length: Number of sort values cursor must contain.
+    :param sort: Sort spec of the request, which must match the sort
+        spec cursor was created with.
+    """
+    try:
+        data = base64.urlsafe_b64decode(str(token).encode('ascii'))
+        data = json.loads(data.decode('utf-8'))
+    except (ValueError, TypeError):
+        data = None
+    if not isinstance(data, dict):
+        raise JHTTPBadRequest('Invalid _cursor value')
+    values = data.get('values')
+    if not isinstance(values, list) or len(values) != length:
+        raise JHTTPBadRequest('Invalid _cursor value')
+    if data.get('sort') != sort:
+        raise JHTTPBadRequest(
+            '_cursor was created with different _sort value')
+    return values
+
+
+def plain_value(value):
+    """ Get plain JSON :value: of a field of ES document.
+
+    Dicts of ES documents are DataProxy objects, which would be
+    serialized with a bogus '_type' key.
+    """
+    if isinstance(value, DataProxy):
+        value = value._data
+    if isinstance(value, dict):
+        return {key: plain_value(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [plain_value(val) for val in value]
+    return value
+
+
+def _add_filter(query, doc_filter):
+    """ Get ES :query: with documents also filtered by :doc_filter:.
+
+    Filter is added to the filter of `filtered` queries.
+    """
+    if 'filtered' not in query:
+        return {'filtered': {'query': query, 'filter': doc_filter}}
+    filtered = dict(query['filtered'])
+    if 'filter' in filtered:
+        doc_filter = {'bool': {'must': [filtered['filter'], doc_filter]}}
+    filtered['filter'] = doc_filter
+    return {'filtered': filtered}
+
+
+def hide_ancestors(**kwargs):
+    """ Remove internal '_ancestors' field of ES documents from response
+    `result`.
+    """
+    result = kwargs['result']
+    if not isinstance(result, dict):
+        return result
+    data = result.get('data', result)
+    documents = data if isinstance(data, list) else [data]
+    for document in documents:
+        if isinstance(document, dict):
+            document.pop('_ancestors', None)
+    return result
+
+
+class _ValuesPage(list):
+    """ Page of list field values with pagination metadata. """
+
+
+def to_datetime(value):
+    """ Convert :value: to a UTC datetime.
+
+    :value: may be a datetime or a string in the format datetimes are
+    serialized to in JSON. Returns None if :value: is neither.
+    """
+    if isinstance(value, six.string_types):
+        try:
+            value = datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.replace(microsecond=0)
+
 
 class SetObjectACLMixin(object):
     def set_object_acl(self, obj):
@@ -47,7 +211,138 @@ class BaseView(object):
 
     Use `self.get_collection` and `self.get_item` to get access to set of
     objects and object respectively which are valid at current level.
+
+    When `_parent_backref` is set, it is a name of the `self.Model` field
+    that references the parent object in nested routes. It is used to
+    check an item belongs to its parent without loading all the
+    parent's children.
+
+    When `_cache_validator` is set, it is a name of the `self.Model`
+    field (e.g. a version or an updated-at field) used to compute ETag
+    and Last-Modified validators of responses. `_cache_control` is a
+    value of Cache-Control header of GET responses.
+
+    When a collection POST or PATCH request body is a JSON array, its
+    items are stored in `self._json_items` and `self._json_params` is
+    left empty. Items of PATCH request bodies look like
+    `{"id": 1, "changes": {}}`; their IDs are stored in
+    `self._json_item_ids` and their changes in `self._json_items`. JSON
+    array bodies of other requests are rejected.
+
+    `_db_fetches` is the number of items loaded from the database by the
+    view while processing the request, including items loaded by views
+    of its parents.
+
+    When `_es_refresh` is set, it is a refresh policy ('none' or
+    'immediate') applied to ES bulk actions of the request. It is stored
+    in `request.es_refresh`.
     """
+    _parent_backref = None
+    _db_fetches = 0
+    _es_refresh = None
+    _json_items = None
+    _json_item_ids = None
+    _cache_control = None
+    _cache_validator = None
+
+    def __init__(self, *args, **kwargs):
+        super(BaseView, self).__init__(*args, **kwargs)
+        if self._es_refresh is not None:
+            self.request.es_refresh = self._es_refresh
+
+    def prepare_request_params(self, _query_params, _json_params):
+        """ Store items of JSON array request bodies in
+        `self._json_items`.
+
+        Other request bodies are processed by nefertari.
+        """
+        is_json = self.request.content_type == 'application/json'
+        if self.request.method in ('POST', 'PATCH') and is_json:
+            try:
+                body = self.request.json
+            except ValueError:
+                body = None
+            if isinstance(body, list):
+                if not self._accepts_json_items():
+                    raise JHTTPBadRequest(
+                        'JSON array body is only accepted by collection '
+                        'POST and PATCH requests')
+                return self._prepare_json_items(_query_params, body)
+        return super(BaseView, self).prepare_request_params(
+            _query_params, _json_params)
+
+    def _accepts_json_items(self):
+        """ Check request is made to a collection route of
+        CollectionView.
+        """
+        if not isinstance(self, CollectionView):
+            return False
+        resource = getattr(self, '_resource', None)
+        if resource is None:
+            return True
+        return resource.id_name not in (self.request.matchdict or {})
+
+    def _prepare_json_items(self, _query_params, items):
+        """ Prepare request params when request body is a JSON array.
+
+        :param _query_params: Dict of query params.
+        :param items: List of items of JSON array request body.
+        """
+        if not all(isinstance(item, dict) for item in items):
+            raise JHTTPBadRequest('Items of JSON array must be objects')
+        if self.request.method == 'PATCH':
+            valid = all('id' in item and isinstance(item.get('changes'), dict)
+                        for item in items)
+            if not valid:
+                raise JHTTPBadRequest(
+                    'Items of JSON array must have "id" and "changes" keys')
+            self._json_item_ids = [item['id'] for item in items]
+            items = [item['changes'] for item in items]
+        self._json_items = [
+            NefertariBaseView.convert_dotted(item) for item in items]
+        self._query_params = NefertariBaseView.convert_dotted(
+            _query_params or self.request.params.mixed())
+        self._json_params = dictset()
+        self._params = self._query_params.copy()
+
+    def convert_ids2objects(self):
+        """ Convert IDs to objects in each item of `self._json_items`. """
+        if self._json_items is None:
+            return super(BaseView, self).convert_ids2objects()
+        json_params = self._json_params
+        for item in self._json_items:
+            self._json_params = item
+            super(BaseView, self).convert_ids2objects()
+        self._json_params = json_params
+
+    def _process_json_item(self, params, action, instance=None):
+        """ Process item :params: of JSON array request body as a
+        request of :action:.
+
+        Request privacy is applied to the item and the before event of
+        :action: is fired for it, so field processors and event handlers
+        see the item in `self._json_params`. Returns processed item.
+
+        :param params: Dict of item fields.
+        :param action: Name of view action, e.g. 'create' or 'update'.
+        :param instance: Object affected by the item, if any.
+        """
+        if self._auth_enabled:
+            wrappers.apply_request_privacy(self.Model, params)(
+                request=self.request)
+        if getattr(self, '_silent', False):
+            return params
+        json_params = self._json_params
+        self._json_params = dictset(params)
+        try:
+            event = events.BEFORE_EVENTS[action](
+                model=self.Model, view=self, instance=instance,
+                fields=FieldData.from_dict(self._json_params, self.Model))
+            self.request.registry.notify(event)
+            return self._json_params
+        finally:
+            self._json_params = json_params
+
     @property
     def clean_id_name(self):
         id_name = self._resource.id_name
@@ -82,24 +377,55 @@ class BaseView(object):
             self._resource.uid,
             **{self._resource.id_name: getattr(obj, field_name)})
 
+    def _parent_item(self, es_based=False):
+        """ Get object of parent view.
+
+        :param es_based: Boolean. Whether to get the object from ES or DB.
+        """
+        parent = self._resource.parent
+        if hasattr(parent, 'view'):
+            parent_view = self._parent_view(parent.view._factory)
+            kwargs = {parent.id_name: self.request.matchdict.get(
+                parent.id_name)}
+            if es_based:
+                return parent_view.get_item_es(**kwargs)
+            obj = parent_view.get_item(**kwargs)
+            self._db_fetches += parent_view._db_fetches
+            return obj
+
+    def _parent_view(self, context):
+        """ Get instance of view of parent resource with :context:.
+
+        View gets a blank request with matchdict of the current request,
+        so it can check its items belong to their parents.
+        """
+        req = self.request.blank(self.request.path)
+        req.registry = self.request.registry
+        req.matchdict = dict(self.request.matchdict or {})
+        return self._resource.parent.view(context, req)
+
     def _parent_queryset(self):
         """ Get queryset of parent view.
 
         Generated queryset is used to run queries in the current level view.
+        Item subresources have no queryset, as their item is the parent
+        item itself.
         """
+        if isinstance(self, ItemSubresourceBaseView):
+            return
         parent = self._resource.parent
         if hasattr(parent, 'view'):
-            req = self.request.blank(self.request.path)
-            req.registry = self.request.registry
-            req.matchdict = {
-                parent.id_name: self.request.matchdict.get(parent.id_name)}
-            parent_view = parent.view(parent.view._factory, req)
-            obj = parent_view.get_item(**req.matchdict)
-            if isinstance(self, ItemSubresourceBaseView):
-                return
+            obj = self._parent_item()
             prop = self._resource.collection_name
             return getattr(obj, prop, None)
 
+    def _belongs_to_parent(self, obj, parent_obj):
+        """ Check :obj: references :parent_obj: in its `_parent_backref`
+        field.
+        """
+        pk_field = self._resource.parent.view.Model.pk_field()
+        return _references(obj, self._parent_backref, parent_obj, pk_field)
+
     def get_collection(self, **kwargs):
         """ Get objects collection taking into account generated queryset
         of parent view.
@@ -130,14 +456,199 @@ class BaseView(object):
         if six.callable(self.context):
             self.reload_context(es_based=False, **kwargs)
 
-        objects = self._parent_queryset()
-        if objects is not None and self.context not in objects:
+        if self._parent_backref is not None:
+            parent_obj = self._parent_item()
+            not_found = (parent_obj is not None and
+                         not self._belongs_to_parent(self.context, parent_obj))
+        else:
+            objects = self._parent_queryset()
+            not_found = objects is not None and self.context not in objects
+        if not_found:
             raise JHTTPNotFound('{}({}) not found'.format(
-                self.Model.__name__,
+                self._get_item_model().__name__,
                 self._get_context_key(**kwargs)))
 
         return self.context
 
+    def _get_item_model(self):
+        """ Get model class of objects returned by `self.get_item`. """
+        return self.Model
+
+    def _etag(self, *values):
+        """ Get ETag of response from :values: identifying its state.
+
+        Query params and authenticated user are taken into account too,
+        as they affect the response body.
+        """
+        data = [self.Model.__name__, self._query_params,
+                self.request.authenticated_userid] + list(values)
+        data = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+    def conditional_response(self, etag, last_modified=None):
+        """ Set validators and Cache-Control of response and check them
+        against conditional request headers.
+
+        Returns HTTPNotModified response if the client has the current
+        representation already. Returns None otherwise.
+
+        :param etag: ETag of the response.
+        :param last_modified: Datetime of the last modification of the
+            response data.
+        """
+        response = self.request.response
+        response.etag = etag
+        if last_modified is not None:
+            response.last_modified = last_modified
+        if self._cache_control:
+            response.headers['Cache-Control'] = self._cache_control
+
+        if 'If-None-Match' in self.request.headers:
+            not_modified = etag in self.request.if_none_match
+        else:
+            since = self.request.if_modified_since
+            not_modified = (last_modified is not None and
+                            since is not None and last_modified <= since)
+        if not not_modified:
+            return None
+        headers = [(name, response.headers[name])
+                   for name in ('ETag', 'Last-Modified', 'Cache-Control')
+                   if name in response.headers]
+        return HTTPNotModified(headers=headers)
+
+    def conditional_item_response(self, obj):
+        """ Check conditional request headers for item :obj:.
+
+        Returns HTTPNotModified response if the client has the current
+        representation of :obj:. Returns None otherwise or if
+        `_cache_validator` is not set.
+        """
+        if not self._cache_validator:
+            return None
+        value = getattr(obj, self._cache_validator, None)
+        etag = self._etag(getattr(obj, self.Model.pk_field(), None), value)
+        return self.conditional_response(etag, to_datetime(value))
+
+    def head_response(self, total=None):
+        """ Get response of HEAD request.
+
+        Response has no body, so objects are not serialized. Headers set
+        on `self.request.response` (e.g. validators) are kept.
+
+        :param total: Number of objects of collection, returned in
+            X-Total-Count header. Like totals of collection responses,
+            it is limited by `public_max_limit` setting for
+            unauthenticated users.
+        """
+        response = self.request.response
+        response.content_type = 'application/json'
+        if total is not None:
+            if self._auth_enabled and not getattr(self.request, 'user', None):
+                public_max = int(self.request.registry.settings.get(
+                    'public_max_limit', 100))
+                total = min(total, public_max)
+            response.headers['X-Total-Count'] = str(total)
+        return response
+
+    @classmethod
+    def exists_fields(cls):
+        """ Get names of fields of ES documents needed to respond to item
+        HEAD requests.
+
+        These are the primary key and fields used to check the item
+        belongs to its parents and to compute its validators.
+        """
+        fields = [cls.Model.pk_field()]
+        if cls._parent_backref is not None:
+            fields.append(cls._parent_backref)
+        if getattr(cls, '_es_ancestry', False):
+            fields.append('_ancestors')
+        if cls._cache_validator:
+            fields.append(cls._cache_validator)
+        return fields
+
+    def _get_stream_format(self):
+        """ Get format in which collection response should be streamed.
+
+        Format is taken from `_stream` query param, which is removed
+        from `self._query_params`, or from the Accept header when it
+        requests NDJSON. Returns None if response should not be
+        streamed.
+        """
+        stream_format = self._query_params.pop('_stream', None)
+        if stream_format is None:
+            accept = self.request.headers.get('Accept') or ''
+            if stream_formats['ndjson'] in accept:
+                stream_format = 'ndjson'
+        if stream_format is not None and stream_format not in stream_formats:
+            raise JHTTPBadRequest('Invalid _stream value. Valid values: '
+                                  '{}'.format(', '.join(stream_formats)))
+        return stream_format
+
+    def _stream_limit(self):
+        """ Get max number of objects in streamed response.
+
+        Streamed collections are only limited by `_limit` when it is
+        requested explicitly or when public limits apply. Returns None
+        if number of objects is not limited.
+        """
+        user = getattr(self.request, 'user', None)
+        public = self._auth_enabled and user is None
+        if not (public or '_limit' in self.request.params):
+            return None
+        try:
+            return int(self._query_params['_limit'])
+        except (TypeError, ValueError):
+            raise JHTTPBadRequest('Invalid _limit value')
+
+    def _stream_chunk_dicts(self, objects):
+        """ Run `index` after calls on a chunk of objects.
+
+        This applies the same wrappers (e.g. privacy, object URLs) to
+        streamed objects as to collection responses.
+        """
+        result = list(objects)
+        for call in self._after_calls.get('index', []):
+            result = call(request=self.request, result=result)
+        return result['data']
+
+    def stream_collection(self, chunks, stream_format):
+        """ Get response that streams objects of collection.
+
+        :param chunks: Iterable of lists of objects to be streamed.
+        :param stream_format: One of `stream_formats` keys. Objects are
+            streamed one JSON document per line for 'ndjson' and as a
+            JSON array for 'json'.
+        """
+        ndjson = stream_format == 'ndjson'
+        # Parent lookups, params validation and the first query run
+        # before the response status is sent, so their errors are
+        # returned as error responses.
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is not None:
+            chunks = itertools.chain([first], chunks)
+
+        def app_iter():
+            separator = '\n' if ndjson else ','
+            prefix = '' if ndjson else '['
+            for chunk in chunks:
+                docs = [json_dumps(doc, encoder=self._json_encoder)
+                        for doc in self._stream_chunk_dicts(chunk)]
+                if not docs:
+                    continue
+                body = prefix + separator.join(docs)
+                prefix = '' if ndjson else ','
+                if ndjson:
+                    body += '\n'
+                yield body.encode('utf-8')
+            if not ndjson:
+                yield (']' if prefix == ',' else '[]').encode('utf-8')
+
+        return Response(
+            app_iter=app_iter(), charset='utf-8',
+            content_type=stream_formats[stream_format])
+
     def _get_context_key(self, **kwargs):
         """ Get value of `self._resource.id_name` from :kwargs: """
         return str(kwargs.get(self._resource.id_name))
@@ -163,44 +674,277 @@ class BaseView(object):
 
         acl = self._factory(**kwargs)
         if acl.item_model is None:
-            acl.item_model = self.Model
+            acl.item_model = self._get_item_model()
 
         self.context = acl[key]
+        if not es_based:
+            self._db_fetches += 1
 
 
 class CollectionView(BaseView):
     """ View that works with database and implements handlers for all
     available CRUD operations.
 
+    When `_set_based_bulk` is True, collection updates and deletes are
+    performed with a single set-based DB query (see
+    `get_bulk_queryset`) when possible.
     """
+    _set_based_bulk = False
+    _stream_chunk_size = 500
+
+    def get_bulk_queryset(self):
+        """ Get DB queryset of objects matched by collection request
+        without loading the objects.
+
+        For nested resources, objects are filtered by a back reference to
+        the parent object, so parent's children are not loaded either.
+
+        Returns None if the request can't be compiled into a single
+        query: when set-based mode is disabled, a page of the collection
+        is requested or resource is nested without a back reference.
+        """
+        if not self._set_based_bulk:
+            return None
+        if any(param in self._query_params for param in page_params):
+            return None
+        params = self._query_params.copy()
+        if hasattr(self._resource.parent, 'view'):
+            if self._parent_backref is None:
+                return None
+            params[self._parent_backref] = self._parent_item()
+        return self.Model.get_collection(**params)
+
     def index(self, **kwargs):
+        stream_format = self._get_stream_format()
+        if self.request.method == 'HEAD':
+            return self.head_response(self.get_collection(_count=True))
+        if stream_format is not None and '_count' not in self._query_params:
+            return self.stream_collection(
+                self.iter_collection_chunks(), stream_format)
         return self.get_collection()
 
+    def iter_collection_chunks(self):
+        """ Iterate over pages of `_stream_chunk_size` DB objects of the
+        collection.
+
+        Objects are sorted by primary key, unless `_sort` is requested,
+        so pages are stable. Pages sorted by primary key are selected by
+        the primary key of the last object of the previous page instead
+        of being skipped to with `_start`, so each page costs the same
+        and objects aren't skipped or repeated when objects are created
+        or deleted during streaming. `_start` and `_page` params are
+        ignored.
+        """
+        limit = self._stream_limit()
+        for param in page_params:
+            self._query_params.pop(param, None)
+        pk_field = self.Model.pk_field()
+        sort = self._query_params.setdefault('_sort', pk_field)
+        keyset = sort in (pk_field, '+' + pk_field)
+        children = None
+        if hasattr(self._resource.parent, 'view'):
+            if self._parent_backref is not None:
+                self._query_params[self._parent_backref] = \
+                    self._parent_item()
+            else:
+                children = list(self._parent_queryset() or [])
+        streamed = 0
+        after = None
+        while limit is None or streamed < limit:
+            size = self._stream_chunk_size
+            if limit is not None:
+                size = min(size, limit - streamed)
+            objects = self._collection_chunk(size, streamed, after, children)
+            if objects:
+                yield objects
+            if len(objects) < size:
+                break
+            streamed += size
+            if keyset:
+                after = getattr(objects[-1], pk_field)
+
+    def _collection_chunk(self, size, start, after=None, children=None):
+        """ Get list of DB objects of a page of streamed collection.
+
+        :param size: Number of objects in the page.
+        :param start: Number of objects before the page.
+        :param after: Primary key of the last object of the previous
+            page, if objects are sorted by primary key, or None.
+        :param children: List of objects of nested collection, if they
+            can't be queried by a back reference to the parent object.
+        """
+        pk_field = self.Model.pk_field()
+        params = dict(self._query_params, _limit=size)
+        if after is None:
+            params['_start'] = start
+        elif children is not None:
+            children = [obj for obj in children
+                        if getattr(obj, pk_field) > after]
+        else:
+            query_set = _pk_after_queryset(self.Model, after)
+            if query_set is None:
+                params['_start'] = start
+            else:
+                params['query_set'] = query_set
+        if children is not None:
+            return list(self.Model.filter_objects(children, **params))
+        return list(self.Model.get_collection(**params))
+
     def show(self, **kwargs):
-        return self.get_item(**kwargs)
+        obj = self.get_item(**kwargs)
+        response = self.conditional_item_response(obj)
+        if response is None and self.request.method == 'HEAD':
+            return self.head_response()
+        return obj if response is None else response
 
     def create(self, **kwargs):
+        if self._json_items is not None:
+            return self.create_many(**kwargs)
         obj = self.Model(**self._json_params)
         self.set_object_acl(obj)
         return obj.save(self.request)
 
+    def create_many(self, **kwargs):
+        """ Create objects from items of JSON array request body.
+
+        Each item is processed like a body of a single object create
+        request (see `_process_json_item`). Objects are created in the
+        request transaction, so when an item fails to be created, an
+        error reporting the index and the status of the item is raised
+        and none of the objects are committed.
+
+        When request has `Prefer: return=minimal` header, only type, ID
+        and URL of created objects are returned.
+        """
+        objects = []
+        for index, params in enumerate(self._json_items):
+            try:
+                params = self._process_json_item(params, 'create')
+                obj = self.Model(**params)
+                self.set_object_acl(obj)
+                objects.append(obj.save(self.request))
+            except (HTTPError, ValueError, TypeError) as ex:
+                status = getattr(ex, 'status_int', 400)
+                raise exception_response(
+                    status,
+                    detail='Failed to create item {}: {}'.format(index, ex),
+                    extra={'data': {'index': index, 'status': status}})
+        log.info('Created {} {} objects'.format(
+            len(objects), self.Model.__name__))
+
+        prefer = self.request.headers.get('Prefer', '')
+        if 'return=minimal' in prefer:
+            pk_field = self.Model.pk_field()
+            return [{'_type': self.Model.__name__,
+                     '_pk': str(getattr(obj, pk_field))}
+                    for obj in objects]
+        return objects
+
+    def get_write_item(self, **kwargs):
+        """ Get DB object changed by item PUT, PATCH and DELETE requests. """
+        return self.get_item(**kwargs)
+
     def update(self, **kwargs):
-        obj = self.get_item(**kwargs)
+        obj = self.get_write_item(**kwargs)
         return obj.update(self._json_params, self.request)
 
     def replace(self, **kwargs):
         return self.update(**kwargs)
 
     def delete(self, **kwargs):
-        obj = self.get_item(**kwargs)
+        obj = self.get_write_item(**kwargs)
         obj.delete(self.request)
 
     def delete_many(self, **kwargs):
-        objects = self.get_collection()
+        objects = self.get_bulk_queryset()
+        if objects is not None:
+            log.info('Set-based delete of {} objects'.format(
+                self.Model.__name__))
+        else:
+            objects = self.get_collection()
         return self.Model._delete_many(objects, self.request)
 
+    def update_each(self, **kwargs):
+        """ Apply changes of each item of JSON array request body to the
+        object with the item's ID.
+
+        Objects are loaded with a single query and updated in the request
+        transaction. Changes of each item are processed like a body of a
+        single object update request (see `_process_json_item`). When
+        auth is enabled, the 'update' permission of each object's item
+        ACL is checked. All items are processed before any of the
+        objects is updated.
+        """
+        objects = self._get_json_items_objects()
+        changes = []
+        for obj, params in zip(objects, self._json_items):
+            if self._auth_enabled:
+                self._check_item_permission(obj, 'update')
+            changes.append(
+                self._process_json_item(params, 'update', instance=obj))
+        for obj, params in zip(objects, changes):
+            obj.update(params, self.request)
+        log.info('Updated {} {} objects with different changes'.format(
+            len(objects), self.Model.__name__))
+        return len(objects)
+
+    def _get_json_items_objects(self):
+        """ Get objects with IDs of `self._json_item_ids` in one query.
+
+        Objects are returned in order of the IDs. JHTTPNotFound is raised
+        if any of the objects doesn't exist or doesn't belong to the
+        parent object of a nested resource.
+        """
+        pk_field = self.Model.pk_field()
+        objects = self.Model.get_by_ids(self._json_item_ids)
+        objects = {str(getattr(obj, pk_field)): obj for obj in objects}
+        if hasattr(self._resource.parent, 'view'):
+            if self._parent_backref is not None:
+                parent_obj = self._parent_item()
+                objects = {key: obj for key, obj in objects.items()
+                           if self._belongs_to_parent(obj, parent_obj)}
+            else:
+                children = self._parent_queryset() or []
+                objects = {key: obj for key, obj in objects.items()
+                           if obj in children}
+        missing = [str(id_) for id_ in self._json_item_ids
+                   if str(id_) not in objects]
+        if missing:
+            raise JHTTPNotFound('{}({}) not found'.format(
+                self.Model.__name__, ', '.join(missing)))
+        return [objects[str(id_)] for id_ in self._json_item_ids]
+
+    def _check_item_permission(self, obj, permission):
+        """ Check request has :permission: in item ACL of :obj:.
+
+        :param obj: Object ACL of which is checked.
+        :param permission: Name of the permission.
+        """
+        from .acl import BaseACL
+        kwargs = {'request': self.request}
+        if issubclass(self._factory, BaseACL):
+            kwargs['es_based'] = False
+        acl = self._factory(**kwargs)
+        if acl.item_model is None:
+            acl.item_model = self.Model
+        item_acl = acl.item_acl(obj)
+        if item_acl is not None:
+            obj.__acl__ = item_acl
+        obj.__parent__ = acl
+        if not self.request.has_permission(permission, obj):
+            raise JHTTPForbidden('Not enough permissions to {} {}({})'.format(
+                permission, self.Model.__name__,
+                getattr(obj, self.Model.pk_field())))
+
     def update_many(self, **kwargs):
-        objects = self.get_collection(**self._query_params)
+        if self._json_items is not None:
+            return self.update_each(**kwargs)
+        objects = self.get_bulk_queryset()
+        if objects is not None:
+            log.info('Set-based update of {} objects'.format(
+                self.Model.__name__))
+        else:
+            objects = self.get_collection(**self._query_params)
         return self.Model._update_many(
             objects, self._json_params, self.request)
 
@@ -214,7 +958,24 @@ class ESBaseView(BaseView):
     Use `self.get_collection_es` and `self.get_item_es` to get access
     to the set of objects and individual object respectively which are
     valid at the current level.
+
+    When `_es_ancestry` is True, ES documents of `self.Model` store IDs of
+    their ancestors (see `ramses.models.ESAncestryMixin`) and nested
+    objects are filtered by these IDs instead of querying parent views.
+
+    When `_mget_parents` is True, all parent objects of nested route are
+    fetched with a single ES multi-get request instead of one request
+    per parent.
     """
+    _es_ancestry = False
+    _mget_parents = False
+
+    def setup_default_wrappers(self):
+        super(ESBaseView, self).setup_default_wrappers()
+        if getattr(self.Model, '_es_ancestry', False):
+            for meth in ('index', 'show'):
+                self._after_calls[meth].append(hide_ancestors)
+
     def _parent_queryset_es(self):
         """ Get queryset (list of object IDs) of parent view.
 
@@ -223,16 +984,129 @@ class ESBaseView(BaseView):
         """
         parent = self._resource.parent
         if hasattr(parent, 'view'):
-            req = self.request.blank(self.request.path)
-            req.registry = self.request.registry
-            req.matchdict = {
-                parent.id_name: self.request.matchdict.get(parent.id_name)}
-            parent_view = parent.view(parent.view._factory, req)
-            obj = parent_view.get_item_es(**req.matchdict)
+            if self._mget_parents:
+                obj = self._get_parents_es()[0][1]
+            else:
+                obj = self._parent_item(es_based=True)
             prop = self._resource.collection_name
             objects_ids = getattr(obj, prop, None)
             return objects_ids
 
+    def _in_parent_es(self, resource, obj, parent_obj):
+        """ Check ES document :obj: of :resource: belongs to parent ES
+        document :parent_obj:.
+
+        Back reference of :obj: is used if :resource: view defines it.
+        Otherwise :obj: is looked up in the parent's collection field.
+        """
+        backref = getattr(resource.view, '_parent_backref', None)
+        if backref is not None:
+            pk_field = resource.parent.view.Model.pk_field()
+            return _references(obj, backref, parent_obj, pk_field)
+        pk_field = resource.view.Model.pk_field()
+        children = getattr(parent_obj, resource.collection_name, None)
+        children_ids = [
+            str(getattr(child, pk_field, child)) for child in children or []]
+        return str(getattr(obj, pk_field, None)) in children_ids
+
+    def _get_parents_es(self):
+        """ Get ES documents of all parent objects in nested route using
+        a single ES multi-get request.
+
+        Returns a list of (resource, document) tuples ordered from the
+        closest parent up. Raises JHTTPNotFound if any of the parents
+        doesn't exist or doesn't belong to its own parent.
+        """
+        from nefertari.elasticsearch import ES
+        resources = []
+        parent = self._resource.parent
+        while hasattr(parent, 'view'):
+            resources.append(parent)
+            parent = parent.parent
+
+        ids = []
+        for resource in resources:
+            acl = resource.view._factory(request=self.request)
+            key = self.request.matchdict.get(resource.id_name)
+            ids.append({
+                '_type': resource.view.Model.__name__,
+                '_id': acl.item_db_id(key),
+            })
+        documents = ES(self.Model.__name__).get_by_ids(
+            ids, _raise_on_empty=True,
+            _fields=self._parents_fields_es(resources))
+
+        parents = list(zip(resources, documents))
+        for (resource, obj), (_, parent_obj) in zip(parents, parents[1:]):
+            if not self._in_parent_es(resource, obj, parent_obj):
+                raise JHTTPNotFound('{}(id={}) resource not found'.format(
+                    resource.view.Model.__name__,
+                    self.request.matchdict.get(resource.id_name)))
+        return parents
+
+    def _parents_fields_es(self, resources):
+        """ Get names of fields of parent ES documents needed to check
+        nesting of :resources:.
+
+        These are primary keys and back references of parents and
+        collection fields which reference their children.
+
+        :param resources: List of parent resources ordered from the
+            closest parent up.
+        """
+        fields = set()
+        children = [self._resource] + resources[:-1]
+        for resource, child in zip(resources, children):
+            fields.add(resource.view.Model.pk_field())
+            fields.add(child.collection_name)
+            backref = getattr(resource.view, '_parent_backref', None)
+            if backref is not None:
+                fields.add(backref)
+        return sorted(fields)
+
+    def _get_ancestor_ids(self):
+        """ Get IDs of ancestor objects requested in nested route.
+
+        Returns a map of {ancestor id_name: ancestor ID} or None if
+        ancestry of `self.Model` documents can't be used to filter
+        objects at the current level.
+        """
+        if not self._es_ancestry:
+            return None
+        ancestry = self.Model._ancestry or {}
+        parent = self._resource.parent
+        if not hasattr(parent, 'view'):
+            return None
+
+        ancestor_ids = {}
+        while hasattr(parent, 'view'):
+            if parent.id_name not in ancestry:
+                return None
+            acl = parent.view._factory(request=self.request)
+            ancestor_ids[parent.id_name] = str(acl.item_db_id(
+                self.request.matchdict.get(parent.id_name)))
+            parent = parent.parent
+        return ancestor_ids
+
+    def _check_parent_exists_es(self):
+        """ Raise JHTTPNotFound if parent object requested in nested
+        route doesn't exist.
+
+        Parent is fetched from ES by its ID only, without loading
+        the parent chain and children of the parent.
+        """
+        parent = self._resource.parent
+        acl = parent.view._factory(request=self.request)
+        acl[self.request.matchdict.get(parent.id_name)]
+
+    def _has_ancestors(self, obj, ancestor_ids):
+        """ Check ES object :obj: belongs to all :ancestor_ids:. """
+        ancestors = getattr(obj, '_ancestors', None)
+        for id_name, ancestor_id in ancestor_ids.items():
+            if ancestor_id not in (getattr(ancestors, id_name, None) or []):
+                return False
+        return True
+
     def get_es_object_ids(self, objects):
         """ Return IDs of :objects: if they are not IDs already. """
         id_field = self.clean_id_name
@@ -248,15 +1122,31 @@ class ESBaseView(BaseView):
         queryset, thus filtering out objects that don't belong to the parent
         object.
         """
+        if not self._set_parent_filter_es():
+            return []
+        return super(ESBaseView, self).get_collection_es()
+
+    def _set_parent_filter_es(self):
+        """ Add filter by parent object to `self._query_params`.
+
+        Returns False if parent object has no objects at the current
+        level, thus no query has to be performed.
+        """
+        ancestor_ids = self._get_ancestor_ids()
+        if ancestor_ids is not None:
+            self._check_parent_exists_es()
+            for id_name, ancestor_id in ancestor_ids.items():
+                self._query_params['_ancestors.' + id_name] = ancestor_id
+            return True
+
         objects_ids = self._parent_queryset_es()
 
         if objects_ids is not None:
             objects_ids = self.get_es_object_ids(objects_ids)
             if not objects_ids:
-                return []
+                return False
             self._query_params['id'] = objects_ids
-
-        return super(ESBaseView, self).get_collection_es()
+        return True
 
     def get_item_es(self, **kwargs):
         """ Get ES collection item taking into account generated queryset
@@ -270,14 +1160,31 @@ class ESBaseView(BaseView):
         applied, it is applied explicitly.
         """
         item_id = self._get_context_key(**kwargs)
-        objects_ids = self._parent_queryset_es()
+        ancestor_ids = self._get_ancestor_ids()
+        objects_ids = parent_obj = parents = None
+        use_mget = (ancestor_ids is None and self._mget_parents and
+                    hasattr(self._resource.parent, 'view'))
+        if use_mget:
+            parents = self._get_parents_es()
+        elif ancestor_ids is None and self._parent_backref is not None:
+            parent_obj = self._parent_item(es_based=True)
+        elif ancestor_ids is None:
+            objects_ids = self._parent_queryset_es()
         if objects_ids is not None:
             objects_ids = self.get_es_object_ids(objects_ids)
 
         if six.callable(self.context):
             self.reload_context(es_based=True, **kwargs)
 
-        if (objects_ids is not None) and (item_id not in objects_ids):
+        not_found = (
+            (objects_ids is not None and item_id not in objects_ids) or
+            (ancestor_ids is not None and
+             not self._has_ancestors(self.context, ancestor_ids)) or
+            (parent_obj is not None and
+             not self._belongs_to_parent(self.context, parent_obj)) or
+            (parents is not None and not self._in_parent_es(
+                self._resource, self.context, parents[0][1])))
+        if not_found:
             raise JHTTPNotFound('{}(id={}) resource not found'.format(
                 self.Model.__name__, item_id))
 
@@ -288,33 +1195,390 @@ class ESCollectionView(ESBaseView, CollectionView):
     """ View that reads data from ES.
 
     Write operations are inherited from :CollectionView:
+
+    When `_bulk_chunk_size` is set, collection updates and deletes page
+    through IDs of matching ES documents with scroll and process DB
+    objects in chunks of this size.
+
+    When `_set_based_bulk` is True and the request doesn't use ES-only
+    query params, collection updates and deletes skip querying ES and
+    are performed with a single set-based DB query, after which the
+    engine synchronizes ES with a bulk request.
+
+    When `_collection_cache` is set, it is a
+    :class:`ramses.cache.LRUCache` which stores collection
+    responses per request path, query params and effective principals.
+
+    When `_single_flight` is set, it is a :class:`ramses.cache.SingleFlight`
+    which shares a single ES query between identical concurrent
+    collection requests.
     """
+    _bulk_chunk_size = 0
+    _bulk_scroll = '5m'
+    _collection_cache = None
+    _single_flight = None
+
+    def iter_collection_chunks_es(self):
+        """ Iterate over chunks of `_stream_chunk_size` ES documents of
+        the collection.
+
+        Documents are paged with ES scroll. `_start` and `_page` params
+        are ignored.
+        """
+        from nefertari.elasticsearch import process_fields_param
+        if not self._set_parent_filter_es():
+            return
+        limit = self._stream_limit()
+        for param in page_params:
+            self._query_params.pop(param, None)
+        streamed = 0
+        for total, hits in self._scroll_es(
+                self._stream_chunk_size, process_fields_param):
+            docs = [dict(hit['_source'], _type=hit['_type'])
+                    for hit in hits]
+            if limit is not None:
+                docs = docs[:limit - streamed]
+            streamed += len(docs)
+            yield docs
+            if limit is not None and streamed >= limit:
+                break
+
     def index(self, **kwargs):
+        stream_format = self._get_stream_format()
+        if self.request.method == 'HEAD':
+            return self.head_collection_es()
+        if '_count' in self._query_params:
+            return self.get_collection_count_es()
+        if stream_format is not None:
+            return self.stream_collection(
+                self.iter_collection_chunks_es(), stream_format)
+        if '_cursor' in self._query_params:
+            return self.get_collection_cursor_es()
+        if self._cache_validator:
+            return self.get_collection_conditional_es()
+        if self._collection_cache is not None:
+            return self.get_collection_cached_es()
+        return self.get_collection_coalesced_es()
+
+    def _read_key(self):
+        """ Get key of collection read of current request. """
+        params = json.dumps(
+            self._query_params, sort_keys=True, default=str)
+        principals = sorted(
+            str(principal) for principal in
+            self.request.effective_principals)
+        return (self.request.path, params, tuple(principals))
+
+    def get_collection_cached_es(self, fetch=None):
+        """ Get ES collection from `_collection_cache`.
+
+        Collection is queried and cached on cache miss. Copies of cached
+        collections are returned, so response processing doesn't change
+        cached data.
+
+        :param fetch: Callable that queries the collection. Defaults to
+            `self.get_collection_es`.
+        """
+        cache = self._collection_cache
+        key = self._read_key()
+        collection = cache.get(key)
+        if collection is None:
+            collection = self.get_collection_coalesced_es(fetch)
+            cache.set(key, copy_documents(collection))
+        else:
+            collection = copy_documents(collection)
+        log.debug('{} collection cache hit rate: {:.2f}'.format(
+            self.Model.__name__, cache.stats()['hit_rate']))
+        return collection
+
+    def get_collection_coalesced_es(self, fetch=None):
+        """ Get ES collection sharing ES query with identical concurrent
+        requests if `_single_flight` is set.
+
+        :param fetch: Callable that queries the collection. Defaults to
+            `self.get_collection_es`.
+        """
+        fetch = fetch or self.get_collection_es
+        if self._single_flight is None:
+            return fetch()
+        return self._single_flight.do(self._read_key(), fetch)
+
+    def get_collection_count_es(self):
+        """ Get number of documents of ES collection.
+
+        Documents are counted with ES count API, so none of them are
+        fetched.
+        """
+        self._query_params.pop('_cursor', None)
         return self.get_collection_es()
 
-    def show(self, **kwargs):
-        return self.get_item_es(**kwargs)
+    def head_collection_es(self):
+        """ Get response of HEAD request of ES collection.
 
-    def update(self, **kwargs):
-        """ Explicitly reload context with DB usage to get access
-        to complete DB object.
+        Number of matching documents is counted without fetching them
+        and returned in X-Total-Count header. When `_cache_validator` is
+        set, it is counted by the query which computes validators.
         """
-        self.reload_context(es_based=False, **kwargs)
-        return super(ESCollectionView, self).update(**kwargs)
+        self._query_params.pop('_cursor', None)
+        if not self._set_parent_filter_es():
+            return self.head_response(0)
+        if self._cache_validator:
+            total, response = self._validate_collection_es()
+            if response is not None:
+                return response
+        else:
+            self._query_params['_count'] = True
+            total = super(ESBaseView, self).get_collection_es()
+        return self.head_response(total)
+
+    def get_collection_conditional_es(self):
+        """ Get ES collection unless client has its current state.
+
+        Collection validators are computed with a single ES query which
+        counts matching documents and gets the max value of the
+        `_cache_validator` field, so documents are only fetched and
+        serialized when the collection has changed. Documents are then
+        read through `_collection_cache` and `_single_flight`, if set.
+        """
+        if not self._set_parent_filter_es():
+            return []
+        total, response = self._validate_collection_es()
+        if response is not None:
+            return response
+        fetch = super(ESBaseView, self).get_collection_es
+        if self._collection_cache is not None:
+            return self.get_collection_cached_es(fetch)
+        return self.get_collection_coalesced_es(fetch)
+
+    def _validate_collection_es(self):
+        """ Set validators of ES collection response and check them
+        against conditional request headers.
+
+        Returns a tuple of the number of matching documents and
+        HTTPNotModified response or None.
+        """
+        from nefertari.elasticsearch import ES
+        es = ES(self.Model.__name__)
+        params = dict(self._query_params, _limit=0)
+        for param in ('_start', '_page', '_sort', '_fields'):
+            params.pop(param, None)
+        search_params = es.build_search_params(params)
+        search_params['body']['aggregations'] = {
+            'validator': {'max': {'field': self._cache_validator}}}
+        data = ES.api.search(**search_params)
+        validator = data['aggregations']['validator']
+        last_modified = None
+        if validator.get('value_as_string') is not None:
+            last_modified = datetime.fromtimestamp(
+                validator['value'] / 1000, UTC).replace(microsecond=0)
+        total = data['hits']['total']
+        etag = self._etag(total, validator.get('value'))
+        return total, self.conditional_response(etag, last_modified)
+
+    def get_collection_cursor_es(self):
+        """ Get page of ES collection that follows the `_cursor` param.
+
+        Instead of skipping documents with `_start`, documents are
+        filtered to those sorted after the sort values of the last
+        document of the previous page. Documents are sorted by a single
+        `_sort` field, if requested, and by primary key as a tiebreaker.
+        An empty `_cursor` requests the first page. Cursor of the next
+        page is returned in the `next_cursor` key of the response; it is
+        None on the last page. Cursor stores the sort it was created
+        with and is rejected if request's `_sort` is different.
+        """
+        from nefertari.elasticsearch import ES
+        cursor = self._query_params.pop('_cursor')
+        self._query_params.pop('_start', None)
+        self._query_params.pop('_page', None)
+        if not self._set_parent_filter_es():
+            return []
+
+        pk_field = self.Model.pk_field()
+        sort = split_strip(self._query_params.pop('_sort', ''))
+        if len(sort) > 1:
+            raise JHTTPBadRequest(
+                'Cursor pagination supports a single _sort field')
+        descending = bool(sort) and sort[0].startswith('-')
+        sort_field = sort[0].lstrip('+-') if sort else None
+        if sort_field == pk_field:
+            sort_field = None
+        fields = [sort_field, pk_field] if sort_field else [pk_field]
+
+        order = '-' if descending else ''
+        sort = ','.join(order + field for field in fields)
+        es = ES(self.Model.__name__)
+        body = {'query': self._search_query_es(es)}
+        if cursor:
+            values = decode_cursor(cursor, len(fields), sort)
+            body['query'] = _add_filter(
+                body['query'],
+                self._cursor_filter(fields, values, descending))
+
+        search_params = {
+            'body': body,
+            '_limit': self._query_params['_limit'],
+            '_sort': sort,
+        }
+        if '_fields' in self._query_params:
+            search_params['_fields'] = split_strip(
+                self._query_params['_fields']) + fields
+        documents = es.get_collection(**search_params)
+
+        next_cursor = None
+        if documents and len(documents) == int(search_params['_limit']):
+            last = documents[-1]
+            next_cursor = encode_cursor(
+                [getattr(last, field, None) for field in fields], sort)
+        documents._nefertari_meta['next_cursor'] = next_cursor
+        return documents
+
+    def _search_query_es(self, es):
+        """ Get ES query matching documents of collection request.
+
+        :param es: nefertari.elasticsearch.ES instance.
+        """
+        params = dict(self._query_params, _limit=0)
+        params.pop('_fields', None)
+        search_fields = params.pop('_search_fields', None)
+        query = es.build_search_params(params)['body']['query']
+        # Search fields only apply to query string queries
+        if search_fields and 'query_string' in query:
+            params['_search_fields'] = search_fields
+            query = es.build_search_params(params)['body']['query']
+        return query
+
+    def _cursor_filter(self, fields, values, descending):
+        """ Get ES filter matching documents sorted after :values:.
+
+        :param fields: List of sort field names. The last one is the
+            tiebreaker.
+        :param values: List of values of :fields: of the last document
+            of the previous page.
+        :param descending: Boolean. Whether documents are sorted in
+            descending order.
+        """
+        op = 'lt' if descending else 'gt'
+        doc_filter = {'range': {fields[-1]: {op: values[-1]}}}
+        for field, value in zip(fields[-2::-1], values[-2::-1]):
+            doc_filter = {'bool': {'should': [
+                {'range': {field: {op: value}}},
+                {'bool': {'must': [{'term': {field: value}}, doc_filter]}},
+            ]}}
+        return doc_filter
 
-    def delete(self, **kwargs):
-        """ Explicitly reload context with DB usage to get access
-        to complete DB object.
+    def show(self, **kwargs):
+        obj = self.get_item_es(**kwargs)
+        response = self.conditional_item_response(obj)
+        if response is None and self.request.method == 'HEAD':
+            return self.head_response()
+        return obj if response is None else response
+
+    def get_write_item(self, **kwargs):
+        """ Get DB object changed by item PUT, PATCH and DELETE requests.
+
+        Object is loaded from the database once and is checked to belong
+        to its parents using the database, so writes don't depend on ES
+        documents being up to date.
         """
         self.reload_context(es_based=False, **kwargs)
-        return super(ESCollectionView, self).delete(**kwargs)
+        return self.get_item(**kwargs)
 
     def get_dbcollection_with_es(self, **kwargs):
-        """ Get DB objects collection by first querying ES. """
+        """ Get DB objects collection by first querying ES.
+
+        Only primary keys of matching documents are loaded from ES.
+        """
+        self._query_params['_fields'] = [self.Model.pk_field()]
         es_objects = self.get_collection_es()
         db_objects = self.Model.filter_objects(es_objects)
         return db_objects
 
+    def get_bulk_queryset(self):
+        """ Don't compile requests that use ES-only query params. """
+        if any(param in self._query_params for param in es_only_params):
+            return None
+        return super(ESCollectionView, self).get_bulk_queryset()
+
+    def get_es_ids_chunks(self):
+        """ Iterate over IDs of ES documents matching collection query.
+
+        Documents are paged with ES scroll, fetching IDs only. Yields
+        (total, ids) tuples, where `total` is the number of all matching
+        documents and `ids` is a list of at most `_bulk_chunk_size` IDs.
+        """
+        hits_chunks = self._scroll_es(
+            self._bulk_chunk_size, lambda fields: {'_source': False})
+        for total, hits in hits_chunks:
+            yield total, [hit['_id'] for hit in hits]
+
+    def _scroll_es(self, size, source_params):
+        """ Iterate over chunks of ES hits matching collection query.
+
+        Yields (total, hits) tuples, where `total` is the number of all
+        matching documents and `hits` is a list of at most :size: hits.
+
+        :param size: Number of hits in a chunk.
+        :param source_params: Callable which gets value of `_fields`
+            param and returns ES params that control returned `_source`.
+        """
+        from nefertari.elasticsearch import ES
+        es = ES(self.Model.__name__)
+        params = dict(self._query_params, _limit=size)
+        search_params = es.build_search_params(params)
+        search_params.pop('from_', None)
+        search_params.update(
+            source_params(search_params.pop('fields', None)) or {})
+        data = ES.api.search(scroll=self._bulk_scroll, **search_params)
+        total = data['hits']['total']
+        scroll_id = data.get('_scroll_id')
+        try:
+            while data['hits']['hits']:
+                yield total, data['hits']['hits']
+                data = ES.api.scroll(
+                    scroll_id=scroll_id, scroll=self._bulk_scroll)
+                scroll_id = data.get('_scroll_id')
+        finally:
+            if scroll_id is not None:
+                ES.api.clear_scroll(scroll_id=scroll_id)
+
+    def _process_many(self, action, process, **kwargs):
+        """ Call :process: on DB objects of the collection.
+
+        If the request can be compiled into a set-based query, the
+        queryset is processed without querying ES. Otherwise, if
+        `_bulk_chunk_size` is set and no page of the collection is
+        requested explicitly, objects are processed in chunks with
+        progress being logged. Otherwise all objects are processed at
+        once.
+
+        :param action: Name of the action for logging.
+        :param process: Callable which processes DB objects and returns
+            number of processed objects.
+        :param kwargs: Kwargs of the view method.
+        """
+        model_name = self.Model.__name__
+        queryset = self.get_bulk_queryset()
+        if queryset is not None:
+            processed = process(queryset)
+            log.info('{} {} {} objects with a set-based query'.format(
+                action, processed, model_name))
+            return processed
+
+        paged = any(param in self._query_params for param in page_params)
+        if not self._bulk_chunk_size or paged:
+            return process(self.get_dbcollection_with_es(**kwargs))
+
+        if not self._set_parent_filter_es():
+            return process([])
+
+        processed = 0
+        for total, ids in self.get_es_ids_chunks():
+            processed += process(self.Model.get_by_ids(ids))
+            log.info('{} {} of {} {} objects'.format(
+                action, processed, total, model_name))
+        return processed
+
     def delete_many(self, **kwargs):
         """ Delete multiple objects from collection.
 
@@ -322,8 +1586,9 @@ class ESCollectionView(ESBaseView, CollectionView):
         This is done to make sure deleted objects are those filtered
         by ES in the 'index' method (so user deletes what he saw).
         """
-        db_objects = self.get_dbcollection_with_es(**kwargs)
-        return self.Model._delete_many(db_objects, self.request)
+        def process(db_objects):
+            return self.Model._delete_many(db_objects, self.request)
+        return self._process_many('Deleted', process, **kwargs)
 
     def update_many(self, **kwargs):
         """ Update multiple objects from collection.
@@ -331,10 +1596,16 @@ class ESCollectionView(ESBaseView, CollectionView):
         First ES is queried, then the results are used to query DB.
         This is done to make sure updated objects are those filtered
         by ES in the 'index' method (so user updates what he saw).
+
+        JSON array request bodies are processed with `update_each`.
         """
-        db_objects = self.get_dbcollection_with_es(**kwargs)
-        return self.Model._update_many(
-            db_objects, self._json_params, self.request)
+        if self._json_items is not None:
+            return self.update_each(**kwargs)
+
+        def process(db_objects):
+            return self.Model._update_many(
+                db_objects, self._json_params, self.request)
+        return self._process_many('Updated', process, **kwargs)
 
 
 class ItemSubresourceBaseView(BaseView):
@@ -354,16 +1625,102 @@ class ItemSubresourceBaseView(BaseView):
     base class, thus making checks like `isinstance(view, baseClass)` easier.
     Also to override `_get_context_key` to return parent resource's id_name
     and `get_item` to reload context on each access.
+
+    When `_es_reads` is True, reads get the parent item from ES with
+    `self.get_item_es`, which fetches only fields returned by
+    `self._es_fields`. It requires `self._factory` to be a generated ACL.
     """
+    _es_reads = False
 
     def _get_context_key(self, **kwargs):
         """ Get value of `self._resource.parent.id_name` from :kwargs: """
         return str(kwargs.get(self._resource.parent.id_name))
 
     def get_item(self, **kwargs):
-        """ Reload context on each access. """
+        """ Reload context on each access.
+
+        Item is checked to belong to the parents of its collection.
+        """
         self.reload_context(es_based=False, **kwargs)
-        return super(ItemSubresourceBaseView, self).get_item(**kwargs)
+        obj = super(ItemSubresourceBaseView, self).get_item(**kwargs)
+        return self._check_item_parents(obj)
+
+    def _item_is_nested(self):
+        """ Check the item belongs to a nested collection. """
+        item_resource = self._resource.parent
+        return hasattr(getattr(item_resource, 'parent', None), 'view')
+
+    def _check_item_parents(self, obj, es_based=False):
+        """ Check item :obj: belongs to the parents of its collection.
+
+        Check is performed by the view of the item's resource, which gets
+        :obj: as its context, so the item isn't loaded again. Returns
+        :obj:.
+
+        :param obj: DB object or ES document of the item.
+        :param es_based: Boolean. Whether :obj: is an ES document.
+        """
+        if not self._item_is_nested():
+            return obj
+        item_view = self._parent_view(obj)
+        kwargs = {self._resource.parent.id_name: self.request.matchdict.get(
+            self._resource.parent.id_name)}
+        if es_based:
+            item_view.get_item_es(**kwargs)
+        else:
+            item_view.get_item(**kwargs)
+            self._db_fetches += item_view._db_fetches
+        return obj
+
+    def _es_fields(self):
+        """ Get names of fields of parent ES document needed by reads or
+        None to fetch all fields.
+        """
+        return None
+
+    def get_item_es(self, **kwargs):
+        """ Get ES document of the parent item.
+
+        Only fields returned by `self._es_fields` and fields needed to
+        check the item belongs to the parents of its collection are
+        fetched.
+        """
+        key = self._get_context_key(**kwargs)
+        acl = self._factory(request=self.request, es_based=True)
+        if acl.item_model is None:
+            acl.item_model = self._get_item_model()
+        fields = self._es_fields()
+        if fields is not None and self._item_is_nested():
+            fields = fields + self._resource.parent.view.exists_fields()
+        self.context = acl.getitem_es(acl.item_db_id(key), fields=fields)
+        return self._check_item_parents(self.context, es_based=True)
+
+    def get_read_item(self, **kwargs):
+        """ Get the parent item for reads from ES if `_es_reads` is set
+        or from the database otherwise.
+        """
+        if self._es_reads:
+            return self.get_item_es(**kwargs)
+        return self.get_item(**kwargs)
+
+    def _get_item_pk(self, **kwargs):
+        """ Get primary key of the parent item requested in :kwargs:
+        without loading the item.
+
+        `self.context` is the ACL of the route, which resolves the 'self'
+        key of the current user. Returns None if key can't be resolved or
+        if the item belongs to a nested collection, as it has to be
+        loaded to check it belongs to its parents.
+        """
+        from .acl import BaseACL
+        if self._item_is_nested():
+            return None
+        key = self._get_context_key(**kwargs)
+        if isinstance(self.context, BaseACL):
+            key = self.context.item_db_id(key)
+        if key == 'self':
+            return None
+        return key
 
 
 class ItemAttributeView(ItemSubresourceBaseView):
@@ -371,24 +1728,216 @@ class ItemAttributeView(ItemSubresourceBaseView):
 
     Attribute resources represent field: ListField, DictField.
 
+    Item routes of DictField attribute resources, e.g.
+    /users/{id}/settings/{key}, represent keys of the dict, which are
+    stored in `self.key`. Bodies of PUT and PATCH requests to them are
+    new values of the keys and may be any JSON values. Writes to keys
+    are processed as updates of the whole field of the item.
+
     You may subclass ItemAttributeView in your project when you want to
     define custom attribute subroute and view of a item route defined in
     RAML and generated by ramses.
     """
+    _key_item = None
+
     def __init__(self, *args, **kw):
         super(ItemAttributeView, self).__init__(*args, **kw)
-        self.attr = self.request.path.split('/')[-1]
+        path = self.request.path.rstrip('/').split('/')
+        self.key = self._get_attr_key()
+        if self.key is not None:
+            path = path[:-1]
+        self.attr = path[-1]
         self.value_type = None
         self.unique = True
 
+    def _get_attr_key(self):
+        """ Get requested key of dict field or None if request isn't
+        made to a key route.
+        """
+        resource = getattr(self, '_resource', None)
+        if resource is None:
+            return None
+        return (self.request.matchdict or {}).get(resource.id_name)
+
+    def prepare_request_params(self, _query_params, _json_params):
+        """ Store JSON body of PUT and PATCH requests to keys of dict
+        field in `self._key_value`.
+        """
+        is_key_write = (self.request.method in ('PUT', 'PATCH') and
+                        self._get_attr_key() is not None)
+        if not is_key_write:
+            return super(ItemAttributeView, self).prepare_request_params(
+                _query_params, _json_params)
+        try:
+            self._key_value = self.request.json
+        except ValueError:
+            raise JHTTPBadRequest('Expecting JSON value')
+        self._query_params = dictset(
+            _query_params or self.request.params.mixed())
+        self._json_params = dictset()
+        self._params = self._query_params.copy()
+
     def index(self, **kwargs):
-        obj = self.get_item(**kwargs)
-        return getattr(obj, self.attr)
+        paged = any(param in self.request.params
+                    for param in page_params + ('_cursor',))
+        if paged:
+            return self.get_slice(**kwargs)
+        obj = self.get_read_item(**kwargs)
+        return plain_value(getattr(obj, self.attr, None))
+
+    def _es_fields(self):
+        if self.key is not None:
+            return ['{}.{}'.format(self.attr, self.key)]
+        return [self.attr]
+
+    def _check_key(self):
+        """ Raise JHTTPBadRequest if `self.key` can't be used as a key of
+        dict field, as it would be processed as a path or a removal.
+        """
+        invalid = (self.key.startswith(('-', '__', '$')) or
+                   '.' in self.key)
+        if invalid:
+            raise JHTTPBadRequest('Invalid key: {}'.format(self.key))
+
+    def show(self, **kwargs):
+        """ Get value of a key of dict field.
+
+        The key is read from the database without reading the rest of
+        the field when the engine supports it, or from the ES document
+        when `_es_reads` is set.
+        """
+        self._check_key()
+        values = None
+        pk = self._get_item_pk(**kwargs)
+        if pk is not None and not self._es_reads:
+            values = get_keys(self.Model, pk, self.attr, [self.key])
+        if values is None:
+            obj = self.get_read_item(**kwargs)
+            values = plain_value(getattr(obj, self.attr, None))
+        if not isinstance(values, dict) or self.key not in values:
+            raise JHTTPNotFound('{}({}).{}[{}] not found'.format(
+                self.Model.__name__, self._get_context_key(**kwargs),
+                self.attr, self.key))
+        return values[self.key]
+
+    def setup_default_wrappers(self):
+        """ Prepare writes to keys of dict field before their events are
+        fired (see `_prepare_key_write`).
+        """
+        super(ItemAttributeView, self).setup_default_wrappers()
+        if self._get_attr_key() is not None:
+            for meth in ('replace', 'update', 'delete'):
+                self._before_calls[meth].insert(0, self._prepare_key_write)
+
+    def _prepare_key_write(self, **kwargs):
+        """ Prepare write to a key of dict field as an update of the
+        field.
+
+        The item is loaded and the new value of the whole field is stored
+        in `self._json_params`, so request privacy, field processors and
+        update event handlers of the field apply to it.
+        """
+        self._check_key()
+        matchdict = dict(self.request.matchdict or {})
+        matchdict.pop('action', None)
+        matchdict.pop('traverse', None)
+        self._key_item = self.get_item(**matchdict)
+        value = dict(getattr(self._key_item, self.attr, None) or {})
+        if self.request.method == 'DELETE':
+            value.pop(self.key, None)
+        else:
+            value[self.key] = self._key_value
+        self._json_params[self.attr] = value
+        if self._auth_enabled:
+            wrappers.apply_request_privacy(self.Model, self._json_params)(
+                request=self.request)
+
+    def _update_key(self):
+        """ Update the item with prepared value of dict field and return
+        the new value of the field.
+        """
+        if self._key_item is None:
+            self._prepare_key_write()
+        obj = self._key_item
+        obj.update(self._json_params, self.request)
+        return getattr(obj, self.attr, None) or {}
+
+    @events.trigger_instead('update')
+    def replace(self, **kwargs):
+        """ Set a key of dict field to request body. """
+        return self._update_key().get(self.key)
+
+    @events.trigger_instead('update')
+    def update(self, **kwargs):
+        return self.replace(**kwargs)
+
+    @events.trigger_instead('update')
+    def delete(self, **kwargs):
+        """ Remove a key from dict field. """
+        self._update_key()
+
+    def get_slice(self, **kwargs):
+        """ Get page of list field values.
+
+        Page is selected with `_limit` (20 by default) and either
+        `_start`, `_page` or `_cursor` query params. Cursor of the next
+        page is returned in the `next_cursor` key of the response; it is
+        None on the last page. Values are sliced in the database when
+        the engine supports it for the field type, unless `_es_reads` is
+        set, in which case they are sliced from the ES document. Dict
+        fields are returned in full.
+        """
+        params = self._query_params
+        try:
+            start, limit = process_limit(
+                params.get('_start'), params.get('_page'),
+                params.get('_limit', 20))
+        except ValueError as ex:
+            raise JHTTPBadRequest(str(ex))
+        if params.get('_cursor'):
+            start = decode_cursor(params['_cursor'], 1)[0]
+            if not isinstance(start, int) or start < 0:
+                raise JHTTPBadRequest('Invalid _cursor value')
+
+        values = None
+        pk = self._get_item_pk(**kwargs)
+        if limit and pk is not None and not self._es_reads:
+            values = get_slice(self.Model, pk, self.attr, start, limit + 1)
+        if values is None:
+            obj = self.get_read_item(**kwargs)
+            values = plain_value(getattr(obj, self.attr, None))
+            if not isinstance(values, list):
+                return values
+            values = values[start:start + limit + 1]
+
+        page = _ValuesPage(values[:limit])
+        next_cursor = None
+        if len(values) > limit:
+            next_cursor = encode_cursor([start + limit])
+        page._nefertari_meta = {'start': start, 'next_cursor': next_cursor}
+        return page
 
     def create(self, **kwargs):
+        """ Add values to and remove values from the field. """
+        return self._update_field(self._json_params, **kwargs)
+
+    def _update_field(self, params, **kwargs):
+        """ Apply changes :params: to the field and return its new value.
+
+        Field is updated with atomic database-side operations when the
+        engine supports them for its type. Otherwise the object is loaded
+        and the field is rewritten by `update_iterables`.
+        """
+        pk = self._get_item_pk(**kwargs)
+        if pk is not None:
+            value = update_iterable(
+                self.Model, pk, self.attr, params,
+                unique=self.unique, request=self.request)
+            if value is not None:
+                return value
         obj = self.get_item(**kwargs)
         obj.update_iterables(
-            self._json_params, self.attr,
+            params, self.attr,
             unique=self.unique,
             value_type=self.value_type,
             request=self.request)
@@ -406,6 +1955,10 @@ class ItemSingularView(ItemSubresourceBaseView):
     generated by ramses.
     If you decide to do so, make sure to set `self._singular_model` to a model
     class, instances of which will be processed by this view.
+
+    `self.get_item` returns objects of `_parent_model`, which is the model
+    of the parent item resource. `self.Model` is never swapped, so
+    instances of this view can be used concurrently.
     """
     _parent_model = None
 
@@ -413,20 +1966,57 @@ class ItemSingularView(ItemSubresourceBaseView):
         super(ItemSingularView, self).__init__(*args, **kw)
         self.attr = self.request.path.split('/')[-1]
 
-    def get_item(self, **kwargs):
-        with patch_view_model(self, self._parent_model):
-            return super(ItemSingularView, self).get_item(**kwargs)
+    def _get_item_model(self):
+        return self._parent_model
+
+    def _es_fields(self):
+        return [self.attr]
 
     def show(self, **kwargs):
+        if self._es_reads:
+            return self.get_singular_es(**kwargs)
         parent_obj = self.get_item(**kwargs)
         return getattr(parent_obj, self.attr)
 
+    def get_singular_es(self, **kwargs):
+        """ Get ES document of the singular object.
+
+        It is nested in the parent document when the relationship is
+        nested. Otherwise the parent document only has its ID and it is
+        fetched by it.
+        """
+        from nefertari.elasticsearch import ES
+        parent_obj = self.get_item_es(**kwargs)
+        value = getattr(parent_obj, self.attr, None)
+        if value is None or hasattr(value, '_data'):
+            return value
+        return ES(self.Model.__name__).get_item(id=value)
+
+    def _get_singular_backref(self):
+        """ Get name of `self.Model` field which references the parent
+        object or None if relationship has no back reference.
+        """
+        params = self._parent_model.get_field_params(self.attr) or {}
+        return params.get('backref_name')
+
     def create(self, **kwargs):
+        """ Create object linked to the parent object.
+
+        When relationship has a back reference, object is created with
+        it set to the parent object, so both objects are linked and
+        indexed by a single save. Otherwise parent object is updated
+        after object is saved.
+        """
         parent_obj = self.get_item(**kwargs)
-        obj = self.Model(**self._json_params)
+        backref = self._get_singular_backref()
+        params = self._json_params.copy()
+        if backref is not None:
+            params[backref] = parent_obj
+        obj = self.Model(**params)
         self.set_object_acl(obj)
         obj = obj.save(self.request)
-        parent_obj.update({self.attr: obj}, self.request)
+        if backref is None:
+            parent_obj.update({self.attr: obj}, self.request)
         return obj
 
     def update(self, **kwargs):
@@ -480,7 +2070,28 @@ def generate_rest_view(config, model_cls, attrs=None, es_based=True,
         bases = [SetObjectACLMixin] + bases + [ACLFilterViewMixin]
     bases.append(NefertariBaseView)
 
-    RESTView = type('RESTView', tuple(bases), {'Model': model_cls})
+    view_attrs = {
+        'Model': model_cls,
+        '_set_based_bulk': getattr(model_cls, '_set_based_bulk', False),
+        '_cache_control': getattr(model_cls, '_cache_control', None),
+        '_cache_validator': getattr(model_cls, '_cache_validator', None),
+        '_es_refresh': getattr(model_cls, '_es_refresh', None),
+    }
+    if es_based:
+        view_attrs['_collection_cache'] = getattr(
+            model_cls, '_collection_cache', None)
+        view_attrs['_single_flight'] = getattr(
+            model_cls, '_single_flight', None)
+    # Parents are fetched directly by IDs, so ES ACL filtering of
+    # database ACLs can't be applied to them
+    if es_based and not config.registry.database_acls:
+        view_attrs['_mget_parents'] = config.registry.mget_parents
+    if es_based:
+        view_attrs['_bulk_chunk_size'] = config.registry.bulk_chunk_size
+    if es_based and (attr_view or singular):
+        view_attrs['_es_reads'] = getattr(model_cls, '_es_reads', False)
+
+    RESTView = type('RESTView', tuple(bases), view_attrs)
 
     def _attr_error(*args, **kwargs):
         raise AttributeError
@@ -54,4 +54,6 @@ def config_mock():
     from mock import Mock
     config = Mock()
     config.registry.database_acls = False
+    config.registry.mget_parents = False
+    config.registry.bulk_chunk_size = 0
     return config
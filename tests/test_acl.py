@@ -159,6 +159,25 @@ class TestGenerateACL(object):
         acl_cls = acl.generate_acl(config, **kwargs)
         assert issubclass(acl_cls, acl.DatabaseACLMixin)
 
+    def test_item_cache_option(self, mock_parse):
+        config = config_mock()
+        model_cls = Mock(_item_cache='cache')
+        acl_cls = acl.generate_acl(
+            config, model_cls=model_cls,
+            raml_resource=Mock(security_schemes=[]))
+        assert acl_cls._item_cache == 'cache'
+        acl_cls = acl.generate_acl(
+            config, model_cls='Foo',
+            raml_resource=Mock(security_schemes=[]))
+        assert acl_cls._item_cache is None
+
+    def test_single_flight_option(self, mock_parse):
+        config = config_mock()
+        acl_cls = acl.generate_acl(
+            config, model_cls=Mock(_single_flight='flight'),
+            raml_resource=Mock(security_schemes=[]))
+        assert acl_cls._single_flight == 'flight'
+
 
 class TestBaseACL(object):
 
@@ -251,13 +270,23 @@ class TestBaseACL(object):
         assert result == obj._apply_callables()
 
     def test_magic_getitem_es_based(self):
-        obj = acl.BaseACL('req')
+        obj = acl.BaseACL(Mock(method='GET'))
         obj.item_db_id = Mock(return_value=42)
         obj.getitem_es = Mock()
         obj.es_based = True
+        obj._exists_fields = ['id']
         obj.__getitem__(1)
         obj.item_db_id.assert_called_once_with(1)
-        obj.getitem_es.assert_called_once_with(42)
+        obj.getitem_es.assert_called_once_with(42, fields=None)
+
+    def test_magic_getitem_es_based_head(self):
+        obj = acl.BaseACL(Mock(method='HEAD'))
+        obj.item_db_id = Mock(return_value=42)
+        obj.getitem_es = Mock()
+        obj.es_based = True
+        obj._exists_fields = ['id', 'updated_at']
+        obj.__getitem__(1)
+        obj.getitem_es.assert_called_once_with(42, fields=['id', 'updated_at'])
 
     def test_magic_getitem_db_based(self):
         obj = acl.BaseACL('req')
@@ -285,3 +314,77 @@ class TestBaseACL(object):
         assert value.__acl__ == obj.item_acl()
         assert value.__parent__ is obj
         assert value.__name__ == 'varvar'
+
+    @patch('ramses.acl.ES')
+    def test_getitem_es_fields(self, mock_es):
+        obj = acl.BaseACL('req')
+        obj.item_model = Mock(__name__='Foo')
+        obj.item_acl = Mock()
+        value = obj.getitem_es(key=1, fields=['tags'])
+        mock_es().get_item.assert_called_once_with(
+            id=1, _source_include=['tags'])
+        assert value == mock_es().get_item()
+
+    @patch('ramses.acl.ES')
+    def test_getitem_es_fields_callable_principal(self, mock_es):
+        obj = acl.BaseACL('req')
+        obj.item_model = Mock(__name__='Foo')
+        obj._item_acl = ((Allow, Mock(), 'view'),)
+        obj.item_acl = Mock()
+        obj.getitem_es(key=1, fields=['tags'])
+        mock_es().get_item.assert_called_once_with(id=1)
+
+    @patch('ramses.acl.ES')
+    def test_getitem_es_fields_cached(self, mock_es):
+        from nefertari.utils import dict2obj
+        from ramses.cache import LRUCache
+        obj = acl.BaseACL('req')
+        obj.item_model = Mock(__name__='Foo')
+        obj._item_cache = LRUCache()
+        obj.item_acl = Mock()
+        obj._fetch_es_document = Mock(
+            return_value=dict2obj({'_type': 'Foo', 'id': 1}))
+        obj.getitem_es(key=1, fields=['tags'])
+        obj._fetch_es_document.assert_called_once_with(1)
+
+    @patch('ramses.acl.ES')
+    def test_getitem_es_fields_coalesced(self, mock_es):
+        obj = acl.BaseACL('req')
+        obj.item_model = Mock(__name__='Foo')
+        obj._single_flight = Mock()
+        obj._single_flight.do.side_effect = lambda key, func: func()
+        obj.item_acl = Mock()
+        obj.getitem_es(key=1, fields=['tags'])
+        assert obj._single_flight.do.call_args[0][0] == (
+            'item', '1', ('tags',))
+
+    @patch('ramses.acl.ES')
+    def test_getitem_es_cached(self, mock_es):
+        from nefertari.utils import dict2obj
+        from ramses.cache import LRUCache
+        mock_es().get_item.return_value = dict2obj(
+            {'_type': 'Foo', 'id': 1, 'name': 'foo'})
+        obj = acl.BaseACL('req')
+        obj.item_model = Mock(__name__='Foo')
+        obj._item_cache = LRUCache()
+        obj.item_acl = Mock(side_effect=['acl1', 'acl2'])
+        first = obj.getitem_es(key=1)
+        second = obj.getitem_es(key=1)
+        mock_es().get_item.assert_called_once_with(id=1)
+        assert second is not first
+        assert second.to_dict() == first.to_dict()
+        assert first.__acl__ == 'acl1'
+        assert second.__acl__ == 'acl2'
+        assert obj._item_cache.get('1').name == 'foo'
+
+    @patch('ramses.acl.ES')
+    def test_getitem_es_coalesced(self, mock_es):
+        obj = acl.BaseACL('req')
+        obj.item_model = Mock(__name__='Foo')
+        obj._single_flight = Mock()
+        obj._single_flight.do.side_effect = lambda key, func: func()
+        obj.item_acl = Mock()
+        value = obj.getitem_es(key=1)
+        assert obj._single_flight.do.call_args[0][0] == ('item', '1')
+        mock_es().get_item.assert_called_once_with(id=1)
+        assert value == mock_es().get_item()
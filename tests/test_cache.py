@@ -0,0 +1,168 @@
+import threading
+import time
+
+import pytest
+from mock import patch
+
+from ramses.cache import LRUCache, SingleFlight, copy_documents
+
+
+class TestLRUCache(object):
+
+    def test_get_missing(self):
+        cache = LRUCache()
+        assert cache.get('foo') is None
+        assert cache.misses == 1
+        assert cache.hits == 0
+
+    def test_set_get(self):
+        cache = LRUCache()
+        cache.set('foo', [1, 2])
+        assert cache.get('foo') == [1, 2]
+        assert cache.hits == 1
+
+    @patch('ramses.cache.time')
+    def test_get_expired(self, mock_time):
+        cache = LRUCache(ttl=10)
+        mock_time.time.return_value = 100
+        cache.set('foo', 1)
+        mock_time.time.return_value = 105
+        assert cache.get('foo') == 1
+        mock_time.time.return_value = 111
+        assert cache.get('foo') is None
+        assert cache.stats()['size'] == 0
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_size=2)
+        cache.set('foo', 1)
+        cache.set('bar', 2)
+        cache.get('foo')
+        cache.set('zoo', 3)
+        assert cache.get('bar') is None
+        assert cache.get('foo') == 1
+        assert cache.get('zoo') == 3
+        assert cache.evictions == 1
+
+    def test_delete(self):
+        cache = LRUCache()
+        cache.set('foo', 1)
+        cache.set('bar', 2)
+        cache.delete('foo')
+        cache.delete('zoo')
+        assert cache.get('foo') is None
+        assert cache.get('bar') == 2
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.set('foo', 1)
+        cache.clear()
+        assert cache.get('foo') is None
+        assert cache.invalidations == 1
+
+    def test_stats(self):
+        cache = LRUCache()
+        assert cache.stats()['hit_rate'] == 0.0
+        cache.set('foo', 1)
+        cache.get('foo')
+        cache.get('bar')
+        assert cache.stats() == {
+            'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0,
+            'invalidations': 0, 'hit_rate': 0.5,
+        }
+
+
+class TestSingleFlight(object):
+
+    def _leader_call(self, flight, result):
+        """ Start call of `flight` in a thread which blocks until
+        returned event is set.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def func():
+            started.set()
+            release.wait()
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        def call():
+            try:
+                results.append(flight.do('foo', func))
+            except Exception as ex:
+                results.append(ex)
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        started.wait()
+        return thread, release, results
+
+    def _wait_for_waiters(self, flight, count):
+        while flight._calls['foo'].waiters < count:
+            time.sleep(0.001)
+
+    def test_do(self):
+        flight = SingleFlight()
+        assert flight.do('foo', lambda: [1]) == [1]
+        assert flight.do('foo', lambda: [2]) == [2]
+        assert flight.shared == 0
+        assert flight._calls == {}
+
+    def test_do_concurrent(self):
+        flight = SingleFlight()
+        leader, release, results = self._leader_call(flight, [{'id': 1}])
+        follower_results = []
+        follower = threading.Thread(target=lambda: follower_results.append(
+            flight.do('foo', lambda: pytest.fail('Called twice'))))
+        follower.start()
+        self._wait_for_waiters(flight, 1)
+        release.set()
+        leader.join()
+        follower.join()
+        assert results == [[{'id': 1}]]
+        assert follower_results == [[{'id': 1}]]
+        assert follower_results[0] is not results[0]
+        assert flight.shared == 1
+        assert flight._calls == {}
+
+    def test_do_concurrent_failure(self):
+        flight = SingleFlight()
+        error = ValueError('foo')
+        leader, release, results = self._leader_call(flight, error)
+        follower_results = []
+        follower = threading.Thread(target=lambda: follower_results.append(
+            flight.do('foo', lambda: 'bar')))
+        follower.start()
+        self._wait_for_waiters(flight, 1)
+        release.set()
+        leader.join()
+        follower.join()
+        assert results == [error]
+        assert follower_results == ['bar']
+
+
+class TestCopyDocuments(object):
+
+    def test_es_documents(self):
+        from nefertari.elasticsearch import _ESDocs
+        from nefertari.utils import dict2obj
+        docs = _ESDocs([dict2obj({'_type': 'Foo', 'id': 1, 'a': {'b': 1}})])
+        docs._nefertari_meta = {'total': 1}
+        copied = copy_documents(docs)
+        assert isinstance(copied, _ESDocs)
+        assert copied._nefertari_meta == {'total': 1}
+        assert copied._nefertari_meta is not docs._nefertari_meta
+        assert copied[0] is not docs[0]
+        assert copied[0].to_dict() == docs[0].to_dict()
+        assert copied[0].a.b == 1
+        copied[0]._data['a']['b'] = 2
+        assert docs[0]._data['a']['b'] == 1
+
+    def test_other_values(self):
+        value = [{'id': 1}]
+        copied = copy_documents(value)
+        assert copied == value
+        assert copied[0] is not value[0]
+        assert copy_documents(3) == 3
@@ -28,6 +28,41 @@ class TestHelperFunctions(object):
             1, {'foo': 'bar'}, 3) == 'bar'
         mock_get.assert_called_once_with(1)
 
+    @patch.object(generators, 'get_static_parent')
+    @patch.object(generators, 'get_backref_name')
+    def test_get_ancestry_chain(self, mock_backref, mock_parent):
+        mock_backref.side_effect = ['story', 'owner', None]
+        mock_parent.side_effect = [
+            Mock(path='/stories'), Mock(path='/users')]
+        root = Mock(is_root=True)
+        users = Mock(is_root=False, id_name='user_username',
+                     collection_name='users')
+        users.parent = root
+        stories = Mock(is_root=False, id_name='story_id',
+                       collection_name='stories')
+        stories.parent = users
+        comments = Mock(is_root=False, collection_name='comments')
+        comments.parent = stories
+
+        chain = generators._get_ancestry_chain(
+            Mock(path='/comments'), comments)
+        assert chain == [
+            ('story_id', stories.view.Model, ['story'], ['comments']),
+            ('user_username', users.view.Model, ['story', 'owner'],
+             ['stories', 'comments']),
+        ]
+        route_names = [c[0][1] for c in mock_backref.call_args_list]
+        assert route_names == ['comments', 'stories']
+
+    @patch.object(generators, 'get_backref_name')
+    def test_get_ancestry_chain_no_backref(self, mock_backref):
+        mock_backref.return_value = None
+        resource = Mock(collection_name='comments')
+        resource.parent = Mock(is_root=False)
+        chain = generators._get_ancestry_chain(
+            Mock(path='/comments'), resource)
+        assert chain == []
+
     @patch.object(generators, 'generate_resource')
     def test_generate_server_no_resources(self, mock_gen):
         generators.generate_server(Mock(resources=None), 'foo')
@@ -143,6 +178,7 @@ class TestGenerateResource(object):
             config, raml_resource, parent_resource)
         assert new_resource is None
 
+    @patch('ramses.generators.get_backref_name')
     @patch('ramses.generators.dynamic_part_name')
     @patch('ramses.generators.singular_subresource')
     @patch('ramses.generators.attr_subresource')
@@ -152,7 +188,8 @@ class TestGenerateResource(object):
     @patch('ramses.generators.generate_rest_view')
     def test_full_run(
             self, generate_view, view_attrs, generate_acl, get_model,
-            attr_res, singular_res, mock_dyn):
+            attr_res, singular_res, mock_dyn, mock_backref):
+        mock_backref.return_value = 'owner'
         mock_dyn.return_value = 'fooid'
         model_cls = Mock()
         model_cls.pk_field.return_value = 'my_id'
@@ -185,7 +222,50 @@ class TestGenerateResource(object):
             factory=generate_acl(),
             view=generate_view()
         )
+        mock_backref.assert_called_with(raml_resource, 'stories')
+        assert generate_view()._parent_backref == 'owner'
         assert res == parent_resource.add()
+        assert generate_acl()._exists_fields == (
+            parent_resource.add().view.exists_fields())
+
+    @patch('ramses.generators.attr_subresource_type')
+    @patch('ramses.generators.dynamic_part_name')
+    @patch('ramses.generators.singular_subresource')
+    @patch('ramses.generators.attr_subresource')
+    @patch('ramses.generators.generate_acl')
+    @patch('ramses.generators.resource_view_attrs')
+    @patch('ramses.generators.generate_rest_view')
+    def test_full_run_dict_attr(
+            self, generate_view, view_attrs, generate_acl,
+            attr_res, singular_res, mock_dyn, attr_type):
+        mock_dyn.return_value = 'settings_key'
+        view_attrs.return_value = set(['index', 'create'])
+        attr_res.return_value = True
+        attr_type.return_value = 'dict'
+        singular_res.return_value = False
+        raml_resource = Mock(path='/settings')
+        parent_resource = Mock(is_root=False, uid=1)
+
+        config = config_mock()
+        generators.generate_resource(config, raml_resource, parent_resource)
+        attr_type.assert_called_once_with(raml_resource, 'settings')
+        mock_dyn.assert_called_once_with(
+            raml_resource=raml_resource,
+            route_name='settings', pk_field='key')
+        generate_view.assert_called_once_with(
+            config,
+            model_cls=parent_resource.view.Model,
+            attrs=set(['index', 'create', 'show', 'replace', 'update',
+                       'delete']),
+            attr_view=True,
+            singular=False
+        )
+        parent_resource.add.assert_called_once_with(
+            'setting', 'settings',
+            id_name='settings_key',
+            factory=generate_acl(),
+            view=generate_view()
+        )
 
     @patch('ramses.generators.dynamic_part_name')
     @patch('ramses.generators.singular_subresource')
@@ -229,3 +309,63 @@ class TestGenerateResource(object):
             view=generate_view()
         )
         assert res == parent_resource.add()
+
+    @patch('ramses.generators.get_backref_name')
+    @patch('ramses.generators._get_ancestry_chain')
+    @patch('ramses.models.setup_ancestry')
+    @patch('ramses.generators.dynamic_part_name')
+    @patch('ramses.generators.singular_subresource')
+    @patch('ramses.generators.attr_subresource')
+    @patch('ramses.models.get_existing_model')
+    @patch('ramses.generators.generate_acl')
+    @patch('ramses.generators.resource_view_attrs')
+    @patch('ramses.generators.generate_rest_view')
+    def test_es_ancestry(
+            self, generate_view, view_attrs, generate_acl, get_model,
+            attr_res, singular_res, mock_dyn, mock_setup, mock_chain,
+            mock_backref):
+        mock_dyn.return_value = 'fooid'
+        model_cls = Mock(_es_ancestry=True)
+        model_cls.pk_field.return_value = 'my_id'
+        attr_res.return_value = False
+        singular_res.return_value = False
+        get_model.return_value = model_cls
+        mock_chain.return_value = [('user_username', 'User', [], [])]
+        raml_resource = Mock(path='/stories')
+        parent_resource = Mock(is_root=False, uid=1)
+        config = config_mock()
+
+        res = generators.generate_resource(
+            config, raml_resource, parent_resource)
+        mock_chain.assert_called_once_with(raml_resource, res)
+        mock_setup.assert_called_once_with(
+            config, model_cls, mock_chain())
+        assert res.view._es_ancestry
+
+    @patch('ramses.generators.get_backref_name')
+    @patch('ramses.generators._get_ancestry_chain')
+    @patch('ramses.models.setup_ancestry')
+    @patch('ramses.generators.dynamic_part_name')
+    @patch('ramses.generators.singular_subresource')
+    @patch('ramses.generators.attr_subresource')
+    @patch('ramses.models.get_existing_model')
+    @patch('ramses.generators.generate_acl')
+    @patch('ramses.generators.resource_view_attrs')
+    @patch('ramses.generators.generate_rest_view')
+    def test_es_ancestry_not_nested(
+            self, generate_view, view_attrs, generate_acl, get_model,
+            attr_res, singular_res, mock_dyn, mock_setup, mock_chain,
+            mock_backref):
+        model_cls = Mock(_es_ancestry=True)
+        attr_res.return_value = False
+        singular_res.return_value = False
+        get_model.return_value = model_cls
+        mock_chain.return_value = []
+        parent_resource = Mock(is_root=False, uid=1)
+        parent_resource.add.return_value = Mock(
+            view=Mock(_es_ancestry=False))
+
+        res = generators.generate_resource(
+            config_mock(), Mock(path='/stories'), parent_resource)
+        assert not mock_setup.called
+        assert not res.view._es_ancestry
@@ -0,0 +1,319 @@
+import threading
+
+import pytest
+from mock import Mock, patch
+
+from ramses import indexing
+from .fixtures import config_mock
+
+
+def _action(id_, op='index'):
+    return {'_op_type': op, '_index': 'foo', '_type': 'Story', '_id': id_}
+
+
+class TestIndexQueue(object):
+
+    def test_flush_by_size(self):
+        sent = []
+        queue = indexing.IndexQueue(
+            send=sent.append, flush_size=2, flush_interval=60)
+        queue.start()
+        queue.put([_action(1), _action(2), _action(3), _action(4)])
+        assert queue.join(timeout=5)
+        queue.stop()
+        assert sent == [[_action(1), _action(2)], [_action(3), _action(4)]]
+        assert queue.stats()['flushed'] == 4
+
+    def test_flush_by_interval(self):
+        sent = []
+        queue = indexing.IndexQueue(
+            send=sent.append, flush_size=100, flush_interval=0.01)
+        queue.start()
+        queue.put([_action(1)])
+        assert queue.join(timeout=5)
+        queue.stop()
+        assert sent == [[_action(1)]]
+
+    def test_stop_sends_queued_actions(self):
+        sent = []
+        queue = indexing.IndexQueue(
+            send=sent.append, flush_size=100, flush_interval=60)
+        queue.start()
+        queue.put([_action(1)])
+        queue.stop(timeout=5)
+        assert sent == [[_action(1)]]
+        assert not queue.put([_action(2)])
+
+    @patch('ramses.indexing.time.sleep')
+    def test_retry(self, mock_sleep):
+        send = Mock(side_effect=[Exception('down'), None])
+        queue = indexing.IndexQueue(send=send, retry_delay=2)
+        queue._flush([_action(1)])
+        assert send.call_count == 2
+        mock_sleep.assert_called_once_with(2)
+        stats = queue.stats()
+        assert stats['retries'] == 1
+        assert stats['flushed'] == 1
+        assert stats['failed'] == 0
+
+    @patch('ramses.indexing.time.sleep')
+    def test_retry_gives_up(self, mock_sleep):
+        send = Mock(side_effect=Exception('down'))
+        queue = indexing.IndexQueue(
+            send=send, max_retries=2, retry_delay=1)
+        queue._flush([_action(1)])
+        assert send.call_count == 3
+        assert [c[0][0] for c in mock_sleep.call_args_list] == [1, 2]
+        assert queue.stats()['failed'] == 1
+
+    def test_put_full_queue(self):
+        queue = indexing.IndexQueue(
+            send=Mock(), max_size=2, put_timeout=0.01)
+        assert queue.put([_action(1), _action(2)])
+        assert not queue.put([_action(3)])
+        stats = queue.stats()
+        assert stats['depth'] == 2
+        assert stats['rejected'] == 1
+
+    def test_put_waits_for_space(self):
+        queue = indexing.IndexQueue(
+            send=Mock(), max_size=1, flush_interval=0, put_timeout=5)
+        queue.put([_action(1)])
+        result = []
+        writer = threading.Thread(
+            target=lambda: result.append(queue.put([_action(2)])))
+        writer.start()
+        queue.start()
+        writer.join(5)
+        assert queue.join(timeout=5)
+        queue.stop()
+        assert result == [True]
+        assert queue.stats()['flushed'] == 2
+
+    @patch('ramses.indexing.time')
+    def test_stats_lag(self, mock_time):
+        mock_time.time.return_value = 100
+        queue = indexing.IndexQueue(send=Mock())
+        assert queue.stats()['lag'] == 0
+        queue.put([_action(1)])
+        mock_time.time.return_value = 103
+        stats = queue.stats()
+        assert stats['lag'] == 3
+        assert stats['depth'] == 1
+
+
+class TestMergeActions(object):
+
+    def test_last_action_wins(self):
+        actions = [_action(1), _action(2), _action(1, 'delete'), _action(3)]
+        assert indexing.merge_actions(actions) == [
+            _action(2), _action(1, 'delete'), _action(3)]
+
+    def test_updates_kept(self):
+        actions = [_action(1), _action(1, 'update'), _action(2, 'update'),
+                   _action(1, 'update')]
+        assert indexing.merge_actions(actions) == [
+            _action(1), _action(1, 'update'), _action(1, 'update'),
+            _action(2, 'update')]
+
+
+class TestRefreshPolicies(object):
+
+    def _request(self, es_refresh=None, **params):
+        request = Mock(spec=['params', 'es_refresh'])
+        request.params.mixed.return_value = params
+        request.es_refresh = es_refresh
+        return request
+
+    def test_get_refresh_policy(self):
+        assert indexing.get_refresh(self._request('none')) is False
+        assert indexing.get_refresh(self._request('immediate')) is True
+        assert indexing.get_refresh(self._request('wait_for')) is None
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_refresh_query_param(self, mock_es):
+        mock_es.settings.asbool.return_value = True
+        request = self._request(_refresh_index='true')
+        assert indexing.get_refresh(request) is True
+        request = self._request('none', _refresh_index='true')
+        assert indexing.get_refresh(request) is False
+        mock_es.settings.asbool.return_value = False
+        assert indexing.get_refresh(self._request(_refresh_index='true')) \
+            is None
+
+    def test_get_refresh_no_request(self):
+        assert indexing.get_refresh(None) is None
+
+    @patch('nefertari.elasticsearch.ES')
+    @patch('elasticsearch.helpers.bulk')
+    def test_send_bulk(self, mock_bulk, mock_es):
+        mock_bulk.return_value = (1, [])
+        indexing.send_bulk([_action(1)], refresh=True)
+        mock_bulk.assert_called_once_with(
+            client=mock_es.api, actions=[_action(1)], refresh=True)
+        mock_bulk.reset_mock()
+        indexing.send_bulk([_action(1)])
+        mock_bulk.assert_called_once_with(
+            client=mock_es.api, actions=[_action(1)])
+
+    @patch('nefertari.elasticsearch.ES')
+    @patch('elasticsearch.helpers.bulk')
+    def test_send_bulk_errors(self, mock_bulk, mock_es):
+        mock_bulk.return_value = (0, ['foo'])
+        with pytest.raises(Exception) as ex:
+            indexing.send_bulk([_action(1)])
+        assert 'foo' in str(ex.value)
+
+    @patch('ramses.indexing.send_bulk')
+    def test_refresh_policies(self, mock_send_bulk):
+        send = Mock()
+        bulk_body = indexing.refresh_policies(send)
+        bulk_body([_action(1)], self._request('immediate'))
+        mock_send_bulk.assert_called_once_with([_action(1)], refresh=True)
+        assert not send.called
+
+    @patch('ramses.indexing.send_bulk')
+    def test_refresh_policies_not_set(self, mock_send_bulk):
+        send = Mock()
+        bulk_body = indexing.refresh_policies(send)
+        request = self._request()
+        bulk_body([_action(1)], request)
+        send.assert_called_once_with([_action(1)], request)
+        bulk_body([_action(2)], None)
+        send.assert_called_with([_action(2)], None)
+        assert not mock_send_bulk.called
+
+    @patch('nefertari.engine.get_document_classes', create=True)
+    def test_setup_refresh_policies(self, mock_classes):
+        import nefertari.elasticsearch as es_module
+        mock_classes.return_value = {
+            'Story': Mock(_es_refresh='immediate')}
+        send = Mock()
+        with patch.object(es_module, '_bulk_body', send):
+            indexing.setup_refresh_policies()
+            bulk_body = es_module._bulk_body
+            assert bulk_body is not send
+            indexing.setup_refresh_policies()
+            assert es_module._bulk_body is bulk_body
+            es_module._bulk_body([_action(1)], request=None)
+            del es_module._ramses_refresh_policies
+        send.assert_called_once_with([_action(1)], None)
+
+    @patch('nefertari.engine.get_document_classes', create=True)
+    def test_setup_refresh_policies_not_declared(self, mock_classes):
+        import nefertari.elasticsearch as es_module
+        mock_classes.return_value = {'Story': Mock(_es_refresh=None)}
+        send = Mock()
+        with patch.object(es_module, '_bulk_body', send):
+            indexing.setup_refresh_policies()
+            assert es_module._bulk_body is send
+        assert not hasattr(es_module, '_ramses_refresh_policies')
+
+
+class TestWriteBehind(object):
+
+    def _request(self, **params):
+        request = Mock(spec=['params'])
+        request.params.mixed.return_value = params
+        return request
+
+    def test_no_request(self):
+        queue, send_now = Mock(), Mock()
+        bulk_body = indexing.write_behind(queue, send_now)
+        bulk_body([_action(1)], None)
+        send_now.assert_called_once_with([_action(1)], None)
+        assert not queue.put.called
+
+    def test_enqueue(self):
+        queue, send_now = Mock(), Mock()
+        bulk_body = indexing.write_behind(queue, send_now)
+        bulk_body([_action(1)], self._request())
+        queue.put.assert_called_once_with([_action(1)])
+        assert not send_now.called
+
+    def test_queue_full(self):
+        queue, send_now = Mock(), Mock()
+        queue.put.return_value = False
+        request = self._request()
+        bulk_body = indexing.write_behind(queue, send_now)
+        bulk_body([_action(1)], request)
+        send_now.assert_called_once_with([_action(1)], request)
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_refresh_index(self, mock_es):
+        mock_es.settings.asbool.return_value = True
+        queue, send_now = Mock(), Mock()
+        request = self._request(_refresh_index='true')
+        bulk_body = indexing.write_behind(queue, send_now)
+        bulk_body([_action(1)], request)
+        send_now.assert_called_once_with([_action(1)], request)
+        assert not queue.put.called
+
+    def test_refresh_policy(self):
+        queue, send_now = Mock(), Mock()
+        request = self._request()
+        request.es_refresh = 'immediate'
+        bulk_body = indexing.write_behind(queue, send_now)
+        bulk_body([_action(1)], request)
+        send_now.assert_called_once_with([_action(1)], request)
+        assert not queue.put.called
+
+    def test_after_commit(self):
+        queue, send_now = Mock(), Mock()
+        request = self._request()
+        request.tm = Mock()
+        bulk_body = indexing.write_behind(queue, send_now)
+        bulk_body([_action(1)], request)
+        assert not queue.put.called
+        hook = request.tm.get().addAfterCommitHook.call_args[0][0]
+        hook(False)
+        assert not queue.put.called
+        hook(True)
+        queue.put.assert_called_once_with([_action(1)])
+
+
+class TestSetupWriteBehind(object):
+
+    @patch('ramses.indexing.atexit')
+    @patch('ramses.indexing.IndexQueue')
+    def test_setup(self, mock_queue, mock_atexit):
+        import nefertari.elasticsearch as es_module
+        config = config_mock()
+        config.registry.settings = {
+            'ramses.index_queue_flush_size': '100',
+            'ramses.index_queue_flush_interval': '0.5',
+        }
+        send_now = Mock()
+        with patch.object(es_module, '_bulk_body', send_now):
+            queue = indexing.setup_write_behind(config)
+            assert es_module._bulk_body is not send_now
+            kwargs = mock_queue.call_args[1]
+            kwargs['send']([_action(1)])
+            del es_module._ramses_index_queue
+        send_now.assert_called_once_with([_action(1)], None)
+        assert kwargs['flush_size'] == 100
+        assert kwargs['flush_interval'] == 0.5
+        assert kwargs['max_size'] == 10000
+        assert queue == mock_queue()
+        queue.start.assert_called_once_with()
+        mock_atexit.register.assert_called_once_with(queue.stop)
+        assert config.registry.index_queue == queue
+
+    @patch('ramses.indexing.atexit')
+    @patch('ramses.indexing.IndexQueue')
+    def test_setup_once(self, mock_queue, mock_atexit):
+        import nefertari.elasticsearch as es_module
+        config = config_mock()
+        config.registry.settings = {}
+        other_config = config_mock()
+        other_config.registry.settings = {}
+        with patch.object(es_module, '_bulk_body', Mock()):
+            queue = indexing.setup_write_behind(config)
+            bulk_body = es_module._bulk_body
+            assert indexing.setup_write_behind(other_config) is queue
+            assert es_module._bulk_body is bulk_body
+            del es_module._ramses_index_queue
+        assert mock_queue.call_count == 1
+        queue.start.assert_called_once_with()
+        mock_atexit.register.assert_called_once_with(queue.stop)
+        assert other_config.registry.index_queue is queue
@@ -0,0 +1,104 @@
+import pytest
+from mock import Mock, patch
+
+from nefertari.json_httpexceptions import JHTTPBadRequest
+
+from ramses import iterables
+
+
+class TestIterables(object):
+
+    def test_split_keys(self):
+        positive, negative = iterables.split_keys(
+            ['a', '-b', '__c', ' d'])
+        assert positive == ['a', 'd']
+        assert negative == ['b']
+
+    def test_mongo_list_updates(self):
+        updates = iterables.mongo_list_updates('tags', ['a', '-b', 'c'])
+        assert updates == [
+            {'$addToSet': {'tags': {'$each': ['a', 'c']}}},
+            {'$pullAll': {'tags': ['b']}},
+        ]
+
+    def test_mongo_list_updates_not_unique(self):
+        updates = iterables.mongo_list_updates(
+            'tags', {'a': None}, unique=False)
+        assert updates == [{'$push': {'tags': {'$each': ['a']}}}]
+
+    def test_mongo_list_updates_empty(self):
+        assert iterables.mongo_list_updates('tags', '') == [
+            {'$set': {'tags': []}}]
+
+    def test_mongo_list_updates_missing_params(self):
+        with pytest.raises(JHTTPBadRequest):
+            iterables.mongo_list_updates('tags', ['__a'])
+
+    def test_mongo_dict_updates(self):
+        updates = iterables.mongo_dict_updates(
+            'settings', {'a': 1, '-b': None, '-a': None})
+        assert updates == [{
+            '$set': {'settings.a': 1},
+            '$unset': {'settings.b': ''},
+        }]
+
+    def test_mongo_dict_updates_empty(self):
+        assert iterables.mongo_dict_updates('settings', {}) == [
+            {'$set': {'settings': {}}}]
+
+    def test_update_iterable_not_supported(self):
+        model_cls = Mock(spec=['pk_field'])
+        value = iterables.update_iterable(model_cls, 1, 'tags', ['a'])
+        assert value is None
+
+    @patch('ramses.iterables.index_field')
+    @patch('ramses.iterables._update_mongo')
+    def test_update_iterable_mongo(self, mock_update, mock_index):
+        model_cls = Mock(spec=['_get_collection'])
+        value = iterables.update_iterable(
+            model_cls, 1, 'tags', ['a'], unique=False, request='req')
+        mock_update.assert_called_once_with(
+            model_cls, 1, 'tags', ['a'], False)
+        mock_index.assert_called_once_with(
+            model_cls, 1, 'tags', mock_update(), request='req')
+        assert value == mock_update()
+
+    def test_get_slice_not_supported(self):
+        model_cls = Mock(spec=['pk_field'])
+        assert iterables.get_slice(model_cls, 1, 'tags', 0, 10) is None
+
+    @patch('ramses.iterables._slice_mongo')
+    def test_get_slice_mongo(self, mock_slice):
+        model_cls = Mock(spec=['_get_collection'])
+        value = iterables.get_slice(model_cls, 1, 'tags', 10, 5)
+        mock_slice.assert_called_once_with(model_cls, 1, 'tags', 10, 5)
+        assert value == mock_slice()
+
+    def test_get_keys_not_supported(self):
+        model_cls = Mock(spec=['__table__'])
+        assert iterables.get_keys(model_cls, 1, 'settings', ['a']) is None
+
+    @patch('ramses.iterables._get_keys_mongo')
+    def test_get_keys_mongo(self, mock_keys):
+        model_cls = Mock(spec=['_get_collection'])
+        value = iterables.get_keys(model_cls, 1, 'settings', ['a'])
+        mock_keys.assert_called_once_with(model_cls, 1, 'settings', ['a'])
+        assert value == mock_keys()
+
+    @patch('nefertari.elasticsearch._bulk_body')
+    @patch('ramses.iterables.ES')
+    def test_index_field(self, mock_es, mock_bulk):
+        mock_es().index_name = 'foo'
+        mock_es().doc_type = 'User'
+        model_cls = Mock(_index_enabled=True, __name__='User')
+        request = Mock()
+        iterables.index_field(model_cls, 1, 'tags', ['a'], request)
+        mock_bulk.assert_called_once_with([{
+            '_op_type': 'update', '_index': 'foo', '_type': 'User',
+            '_id': 1, 'doc': {'tags': ['a']}}], request)
+
+    @patch('nefertari.elasticsearch._bulk_body')
+    def test_index_field_not_indexed(self, mock_bulk):
+        model_cls = Mock(_index_enabled=False)
+        iterables.index_field(model_cls, 1, 'tags', ['a'])
+        assert not mock_bulk.called
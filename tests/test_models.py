@@ -276,6 +276,135 @@ class TestGenerateModelCls(object):
         assert not issubclass(model_cls, models.engine.ESBaseDocument)
         assert not issubclass(model_cls, AuthModelMethodsMixin)
 
+    def test_es_ancestry(self, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        schema['_es_ancestry'] = True
+        mock_reg.mget.return_value = {'foo': 'bar'}
+
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert issubclass(model_cls, models.ESAncestryMixin)
+        assert model_cls._es_ancestry
+
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None, es_based=False)
+        assert not issubclass(model_cls, models.ESAncestryMixin)
+
+    def test_set_based_bulk(self, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert not getattr(model_cls, '_set_based_bulk', False)
+
+        schema['_set_based_bulk'] = True
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert model_cls._set_based_bulk
+
+    def test_es_reads(self, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert not getattr(model_cls, '_es_reads', False)
+
+        schema['_es_reads'] = True
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert model_cls._es_reads
+
+    def test_cache_options(self, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        schema['_cache_control'] = 'max-age=60'
+        schema['_cache_validator'] = 'updated_at'
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert model_cls._cache_control == 'max-age=60'
+        assert model_cls._cache_validator == 'updated_at'
+
+    def test_es_refresh(self, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        schema['_es_refresh'] = 'immediate'
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert model_cls._es_refresh == 'immediate'
+
+    def test_es_refresh_unknown(self, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        schema['_es_refresh'] = 'always'
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        with pytest.raises(ValueError) as ex:
+            models.generate_model_cls(
+                config, schema=schema, model_name='Story',
+                raml_resource=None)
+        assert str(ex.value) == 'Unknown refresh policy: always'
+        schema['_es_refresh'] = 'wait_for'
+        with pytest.raises(ValueError):
+            models.generate_model_cls(
+                config, schema=schema, model_name='Story',
+                raml_resource=None)
+
+    def test_coalesce_reads(self, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        from ramses.cache import SingleFlight
+        config = config_mock()
+        schema = self._test_schema()
+        schema['_coalesce_reads'] = True
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        assert isinstance(model_cls._single_flight, SingleFlight)
+
+    @patch('ramses.models.setup_collection_cache')
+    def test_collection_cache(
+            self, mock_setup, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        schema['_collection_cache'] = {'ttl': 10}
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        mock_setup.assert_called_once_with(config, model_cls, {'ttl': 10})
+
+    @patch('ramses.models.setup_item_cache')
+    def test_item_cache(
+            self, mock_setup, mock_reg, mock_subscribers, mock_proc):
+        from ramses import models
+        config = config_mock()
+        schema = self._test_schema()
+        schema['_item_cache'] = True
+        mock_reg.mget.return_value = {'foo': 'bar'}
+        model_cls, auth_model = models.generate_model_cls(
+            config, schema=schema, model_name='Story',
+            raml_resource=None)
+        mock_setup.assert_called_once_with(config, model_cls, True)
+
     def test_no_db_settings(self, mock_reg, mock_subscribers, mock_proc):
         from ramses import models
         config = config_mock()
@@ -485,3 +614,296 @@ class TestSubscribersSetup(object):
         }
         models.setup_fields_processors(config, 'mymodel', schema)
         assert not config.add_field_processors.called
+
+    def test_setup_collection_cache(self):
+        from nefertari import events
+        from ramses import models
+        config = Mock()
+        model_cls = Mock(__name__='Story')
+        cache = models.setup_collection_cache(
+            config, model_cls, {'max_size': 10, 'ttl': 5})
+        assert model_cls._collection_cache is cache
+        assert cache.max_size == 10
+        assert cache.ttl == 5
+        subscriber, evts = config.subscribe_to_events.call_args[0]
+        assert config.subscribe_to_events.call_args[1] == {
+            'model': model_cls}
+        assert events.AfterCreate in evts
+        assert events.AfterUpdateMany in evts
+        assert events.AfterDeleteMany in evts
+        cache.set('foo', 1)
+        subscriber(Mock())
+        assert cache.get('foo') is None
+
+    def test_setup_collection_cache_defaults(self):
+        from ramses import models
+        model_cls = Mock(__name__='Story')
+        cache = models.setup_collection_cache(Mock(), model_cls, True)
+        assert cache.max_size == 1000
+        assert cache.ttl == 60
+
+    def test_setup_item_cache(self):
+        from nefertari import events
+        from ramses import models
+        config = Mock()
+        model_cls = Mock()
+        model_cls.pk_field.return_value = 'id'
+        cache = models.setup_item_cache(config, model_cls, {'ttl': 5})
+        assert model_cls._item_cache is cache
+        assert cache.ttl == 5
+        item_call, collection_call = config.subscribe_to_events.call_args_list
+        invalidate_item, item_events = item_call[0]
+        assert item_events == [
+            events.AfterUpdate, events.AfterReplace, events.AfterDelete]
+        invalidate, collection_events = collection_call[0]
+        assert collection_events == [
+            events.AfterUpdateMany, events.AfterDeleteMany]
+        cache.set('1', 'foo')
+        cache.set('2', 'bar')
+        invalidate_item(Mock(instance=Mock(id=1)))
+        assert cache.get('1') is None
+        assert cache.get('2') == 'bar'
+        invalidate(Mock())
+        assert cache.get('2') is None
+
+
+@pytest.mark.usefixtures('engine_mock')
+class TestESAncestry(object):
+
+    def _test_model(self):
+        from ramses import models
+
+        class Base(object):
+            def to_dict(self, **kwargs):
+                return {'id': 1}
+
+            @classmethod
+            def get_es_mapping(cls, **kwargs):
+                return {'Comment': {'properties': {'id': {}}}}
+
+        class Comment(models.ESAncestryMixin, Base):
+            _ancestry = {
+                'story_id': ['story'],
+                'user_username': ['story', 'owner'],
+            }
+        return Comment
+
+    def test_get_ancestors(self):
+        obj = self._test_model()()
+        obj.story = Mock(id=1)
+        obj.story.pk_field.return_value = 'id'
+        obj.story.owner = Mock(username='user1')
+        obj.story.owner.pk_field.return_value = 'username'
+        assert obj.get_ancestors() == {
+            'story_id': ['1'],
+            'user_username': ['user1'],
+        }
+
+    def test_get_ancestors_missing_link(self):
+        obj = self._test_model()()
+        obj.story = None
+        assert obj.get_ancestors() == {
+            'story_id': [],
+            'user_username': [],
+        }
+
+    def test_to_dict(self):
+        obj = self._test_model()()
+        obj.get_ancestors = Mock(return_value={'story_id': ['1']})
+        assert obj.to_dict() == {
+            'id': 1, '_ancestors': {'story_id': ['1']}}
+        assert obj.to_dict(_depth=0) == {'id': 1}
+        assert obj.to_dict(request=Mock()) == {'id': 1}
+
+    def test_get_es_mapping(self):
+        mapping = self._test_model().get_es_mapping()
+        properties = mapping['Comment']['properties']
+        assert properties['id'] == {}
+        ancestors = properties['_ancestors']
+        assert ancestors['type'] == 'object'
+        assert ancestors['properties'] == {
+            'story_id': {'type': 'string', 'index': 'not_analyzed'},
+            'user_username': {'type': 'string', 'index': 'not_analyzed'},
+        }
+
+    def test_get_ancestors_list_backref(self):
+        obj = self._test_model()()
+        obj._ancestry = {
+            'story_id': ['stories'],
+            'user_id': ['stories', 'owner'],
+        }
+        owner = Mock(id=5)
+        owner.pk_field.return_value = 'id'
+        stories = [Mock(id=1, owner=owner), Mock(id=2, owner=owner)]
+        for story in stories:
+            story.pk_field.return_value = 'id'
+        obj.stories = stories
+        assert obj.get_ancestors() == {
+            'story_id': ['1', '2'],
+            'user_id': ['5'],
+        }
+
+    def test_follow_relationships(self):
+        from ramses import models
+        leaves = [Mock(), Mock(), Mock()]
+        objects = [
+            Mock(children=[Mock(leaf=leaves[0]), Mock(leaf=None)]),
+            Mock(children=Mock(leaf=leaves[1])),
+            Mock(children=None),
+            Mock(children=(Mock(leaf=[leaves[2]]),)),
+        ]
+        result = models.follow_relationships(objects, ['children', 'leaf'])
+        assert result == leaves
+
+    @patch('ramses.models._ancestry_bulk_reindexer')
+    @patch('ramses.models._ancestry_reindexer')
+    def test_setup_ancestry(self, mock_reindexer, mock_bulk):
+        from nefertari import events
+        from ramses import models
+        config = Mock()
+        model_cls = Mock(_ancestry=None)
+        chain = [
+            ('story_id', 'Story', ['story'], ['comments']),
+            ('user_username', 'User', ['story', 'owner'],
+             ['stories', 'comments']),
+        ]
+        models.setup_ancestry(config, model_cls, chain)
+        assert model_cls._ancestry == {
+            'story_id': ['story'],
+            'user_username': ['story', 'owner'],
+        }
+        mock_reindexer.assert_has_calls([
+            call(model_cls, 'story_id', ['comments']),
+            call(model_cls, 'user_username', ['stories', 'comments']),
+            call(model_cls, 'story_id', ['comments']),
+        ])
+        mock_bulk.assert_called_once_with(
+            model_cls, 'User', 'user_username', ['stories', 'comments'])
+        subscriber = mock_reindexer()
+        config.add_subscriber.assert_has_calls([
+            call(subscriber, events.AfterUpdate,
+                 model='Story', field='comments'),
+            call(subscriber, events.AfterReplace,
+                 model='Story', field='comments'),
+            call(subscriber, events.AfterUpdate,
+                 model='User', field='stories'),
+            call(subscriber, events.AfterReplace,
+                 model='User', field='stories'),
+            call(subscriber, events.AfterUpdate,
+                 model='Story', field='owner'),
+            call(subscriber, events.AfterReplace,
+                 model='Story', field='owner'),
+            call(mock_bulk(), events.AfterUpdateMany,
+                 model='Story', field='owner'),
+        ])
+
+    @patch('ramses.models.reindex_descendants')
+    def test_ancestry_reindexer(self, mock_reindex):
+        from ramses import models
+        reindex = models._ancestry_reindexer('Comment', 'story_id', ['a'])
+        event = Mock(instance=Mock(id=1))
+        event.model.pk_field.return_value = 'id'
+        reindex(event)
+        event.model.get_item.assert_called_once_with(id=1)
+        mock_reindex.assert_called_once_with(
+            'Comment', event.model.get_item(), 'story_id', ['a'],
+            request=event.view.request)
+
+    @patch('ramses.models.reindex_descendants')
+    def test_ancestry_bulk_reindexer(self, mock_reindex):
+        from ramses import models
+        user_model = Mock()
+        user_model.pk_field.return_value = 'username'
+        reindex = models._ancestry_bulk_reindexer(
+            'Comment', user_model, 'user_username', ['a'])
+        event = Mock(instance=None)
+        event.field.new_value = 'user1'
+        reindex(event)
+        user_model.get_item.assert_called_once_with(
+            username='user1', _raise_on_empty=False)
+        mock_reindex.assert_called_once_with(
+            'Comment', user_model.get_item(), 'user_username', ['a'],
+            request=event.view.request)
+
+    @patch('ramses.models.reindex_descendants')
+    def test_ancestry_bulk_reindexer_unset(self, mock_reindex):
+        from ramses import models
+        user_model = Mock()
+        reindex = models._ancestry_bulk_reindexer(
+            'Comment', user_model, 'user_username', ['a'])
+        event = Mock(instance=None)
+        event.field.new_value = None
+        reindex(event)
+        assert not user_model.get_item.called
+        assert not mock_reindex.called
+
+    @patch('nefertari.utils.to_dicts')
+    @patch('nefertari.elasticsearch.ES')
+    def test_reindex_descendants(self, mock_es, mock_dicts):
+        from ramses import models
+        mock_dicts.side_effect = lambda objects: list(objects)
+        model_cls = Mock(__name__='Comment')
+        model_cls.pk_field.return_value = 'id'
+        former = Mock(id=1)
+        current = [Mock(id=2), Mock(id=3)]
+        mock_es().get_collection.return_value = [former, Mock(id=2)]
+        model_cls.filter_objects.return_value = [former]
+        ancestor = Mock(username='user1', stories=[
+            Mock(comments=current[:1]), Mock(comments=current[1:])])
+        ancestor.pk_field.return_value = 'username'
+
+        models.reindex_descendants(
+            model_cls, ancestor, 'user_username', ['stories', 'comments'],
+            request='foo')
+        mock_es.assert_called_with('Comment')
+        mock_es().get_collection.assert_called_once_with(**{
+            '_ancestors.user_username': 'user1',
+            '_fields': ['id'],
+            '_limit': 500,
+            '_start': 0,
+        })
+        model_cls.filter_objects.assert_called_once_with([former])
+        mock_es().index.assert_has_calls([
+            call([former], request='foo'),
+            call(current, request='foo'),
+        ])
+
+    @patch('nefertari.utils.to_dicts')
+    @patch('nefertari.elasticsearch.ES')
+    def test_reindex_descendants_chunks(self, mock_es, mock_dicts):
+        from ramses import models
+        mock_dicts.side_effect = lambda objects: list(objects)
+        model_cls = Mock(__name__='Comment')
+        model_cls.pk_field.return_value = 'id'
+        docs = [Mock(id=i) for i in range(5)]
+        mock_es().get_collection.side_effect = [
+            docs[:2], docs[2:4], docs[4:]]
+        model_cls.filter_objects.side_effect = lambda objects: objects
+        ancestor = Mock(username='user1', comments=None)
+        ancestor.pk_field.return_value = 'username'
+
+        models.reindex_descendants(
+            model_cls, ancestor, 'user_username', ['comments'],
+            chunk_size=2)
+        starts = [c[1]['_start'] for c in
+                  mock_es().get_collection.call_args_list]
+        assert starts == [0, 2, 4]
+        mock_es().index.assert_has_calls([
+            call(docs[:2], request=None),
+            call(docs[2:4], request=None),
+            call(docs[4:], request=None),
+        ])
+        assert mock_es().index.call_count == 3
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_reindex_descendants_nothing_found(self, mock_es):
+        from ramses import models
+        model_cls = Mock(__name__='Comment')
+        model_cls.pk_field.return_value = 'id'
+        mock_es().get_collection.return_value = []
+        ancestor = Mock(username='user1', stories=None)
+        ancestor.pk_field.return_value = 'username'
+        models.reindex_descendants(
+            model_cls, ancestor, 'user_username', ['stories'])
+        assert not model_cls.filter_objects.called
+        assert not mock_es().index.called
@@ -286,6 +286,27 @@ class TestUtils(object):
         mock_schema.assert_called_once_with(parent)
         assert utils.attr_subresource('resource', 'route_name2')
 
+    @patch('ramses.utils.get_static_parent')
+    @patch('ramses.utils.resource_schema')
+    def test_attr_subresource_type(self, mock_schema, mock_par):
+        mock_schema.return_value = {
+            'properties': {
+                'settings': {'_db_settings': {'type': 'dict'}},
+                'tags': {'_db_settings': {'type': 'list'}},
+                'name': {'_db_settings': {'type': 'string'}},
+            }
+        }
+        assert utils.attr_subresource_type('res', 'settings') == 'dict'
+        assert utils.attr_subresource_type('res', 'tags') == 'list'
+        assert utils.attr_subresource_type('res', 'name') is None
+        assert utils.attr_subresource_type('res', 'other') is None
+
+    def test_dict_key_view_attrs(self):
+        assert utils.dict_key_view_attrs(['index']) == set(['index', 'show'])
+        assert utils.dict_key_view_attrs(['create']) == set([
+            'create', 'replace', 'update', 'delete'])
+        assert utils.dict_key_view_attrs([]) == set()
+
     @patch('ramses.utils.get_static_parent')
     @patch('ramses.utils.resource_schema')
     def test_singular_subresource_no_static_parent(self, mock_schema, mock_par):
@@ -340,6 +361,50 @@ class TestUtils(object):
         mock_par.assert_called_once_with('resource', method='POST')
         mock_schema.assert_called_once_with(parent)
 
+    @patch('ramses.utils.get_static_parent')
+    @patch('ramses.utils.resource_schema')
+    def test_get_backref_name_no_static_parent(self, mock_schema, mock_par):
+        mock_par.return_value = None
+        assert utils.get_backref_name('foo', 1) is None
+        mock_par.assert_called_once_with('foo', method='POST')
+        assert not mock_schema.called
+
+    @patch('ramses.utils.get_static_parent')
+    @patch('ramses.utils.resource_schema')
+    def test_get_backref_name_not_relationship(self, mock_schema, mock_par):
+        mock_schema.return_value = {
+            'properties': {
+                'route_name': {
+                    '_db_settings': {
+                        'type': 'list',
+                        'backref_name': 'owner',
+                    }
+                }
+            }
+        }
+        assert utils.get_backref_name('resource', 'route_name') is None
+        assert utils.get_backref_name('resource', 'route_name2') is None
+
+    @patch('ramses.utils.get_static_parent')
+    @patch('ramses.utils.resource_schema')
+    def test_get_backref_name(self, mock_schema, mock_par):
+        parent = Mock()
+        mock_par.return_value = parent
+        mock_schema.return_value = {
+            'properties': {
+                'route_name': {
+                    '_db_settings': {
+                        'type': 'relationship',
+                        'document': 'Story',
+                        'backref_name': 'owner',
+                    }
+                }
+            }
+        }
+        assert utils.get_backref_name('resource', 'route_name') == 'owner'
+        mock_par.assert_called_once_with('resource', method='POST')
+        mock_schema.assert_called_once_with(parent)
+
     def test_is_callable_tag_not_str(self):
         assert not utils.is_callable_tag(1)
         assert not utils.is_callable_tag(None)
@@ -404,8 +469,9 @@ class TestUtils(object):
         model2 = Mock()
         view_cls.Model = model1
 
-        with utils.patch_view_model(view_cls, model2):
-            view_cls.Model()
+        with pytest.warns(DeprecationWarning):
+            with utils.patch_view_model(view_cls, model2):
+                view_cls.Model()
 
         assert view_cls.Model is model1
         assert not model1.called
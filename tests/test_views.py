@@ -1,11 +1,13 @@
 import pytest
-from mock import Mock, patch
+from mock import Mock, MagicMock, NonCallableMock, patch, call
 
 from nefertari.json_httpexceptions import (
-    JHTTPNotFound, JHTTPMethodNotAllowed)
+    JHTTPNotFound, JHTTPMethodNotAllowed, JHTTPBadRequest, JHTTPConflict,
+    JHTTPForbidden)
+from nefertari.utils import dict2obj, dictset
 from nefertari.view import BaseView
 
-from ramses import views
+from ramses import acl, views
 from .fixtures import config_mock, guards_engine_mock
 
 
@@ -19,6 +21,7 @@ class ViewTestBase(object):
     request_kwargs = dict(
         method='GET',
         accept=[''],
+        headers={},
     )
 
     def _test_view(self):
@@ -51,6 +54,302 @@ class TestBaseView(ViewTestBase):
         view = self._test_view()
         assert view._query_params['_limit'] == 20
 
+    def test_init_es_refresh(self):
+        class View(self.view_cls, BaseView):
+            _json_encoder = 'foo'
+            _es_refresh = 'immediate'
+        request = Mock(**self.request_kwargs)
+        View(request=request, **self.view_kwargs)
+        assert request.es_refresh == 'immediate'
+
+    def _json_array_view(self, body, method='POST',
+                         view_cls=views.CollectionView, matchdict=None):
+        class View(view_cls, BaseView):
+            _json_encoder = 'foo'
+            _resource = Mock(id_name='foo_id')
+        request = Mock(
+            method=method, accept=[''], content_type='application/json',
+            json=body, matchdict=matchdict or {})
+        return View(request=request, context={}, _query_params={'a': 1})
+
+    def test_init_json_array(self):
+        view = self._json_array_view([{'foo.bar': 1}, {'zoo': 2}])
+        assert view._json_items == [{'foo': {'bar': 1}}, {'zoo': 2}]
+        assert view._json_params == {}
+        assert view._query_params == {'a': 1}
+        assert view._params == {'a': 1}
+
+    def test_init_json_array_invalid_items(self):
+        with pytest.raises(JHTTPBadRequest):
+            self._json_array_view([{'foo': 1}, 2])
+
+    def test_init_json_array_item_route(self):
+        with pytest.raises(JHTTPBadRequest):
+            self._json_array_view([{'foo': 1}], matchdict={'foo_id': 1})
+        with pytest.raises(JHTTPBadRequest):
+            self._json_array_view(
+                [{'id': 1, 'changes': {}}], method='PATCH',
+                matchdict={'foo_id': 1})
+
+    def test_init_json_array_not_collection_view(self):
+        with pytest.raises(JHTTPBadRequest):
+            self._json_array_view([{'foo': 1}], view_cls=views.BaseView)
+        with pytest.raises(JHTTPBadRequest):
+            self._json_array_view(
+                [{'foo': 1}], view_cls=views.ItemAttributeView)
+
+    def test_process_json_item(self):
+        view = self._test_view()
+        view.Model = Mock()
+        view._auth_enabled = False
+
+        def processor(event):
+            assert event.fields['foo'].new_value == 1
+            assert event.instance == 'obj'
+            event.set_field_value('foo', 2)
+        view.request.registry.notify.side_effect = processor
+        assert view._process_json_item(
+            {'foo': 1}, 'update', instance='obj') == {'foo': 2}
+        assert view._json_params == {'foo2': 'bar2'}
+
+    @patch('ramses.views.wrappers')
+    def test_process_json_item_privacy(self, mock_wrap):
+        view = self._test_view()
+        view.Model = Mock()
+        view._auth_enabled = True
+        view._silent = True
+        assert view._process_json_item({'foo': 1}, 'create') == {'foo': 1}
+        mock_wrap.apply_request_privacy.assert_called_once_with(
+            view.Model, {'foo': 1})
+        mock_wrap.apply_request_privacy().assert_called_once_with(
+            request=view.request)
+        assert not view.request.registry.notify.called
+
+    def test_init_json_array_patch(self):
+        view = self._json_array_view([
+            {'id': 1, 'changes': {'foo.bar': 1}},
+            {'id': 2, 'changes': {'zoo': 2}},
+        ], method='PATCH')
+        assert view._json_item_ids == [1, 2]
+        assert view._json_items == [{'foo': {'bar': 1}}, {'zoo': 2}]
+        assert view._json_params == {}
+
+    def test_init_json_array_patch_invalid_items(self):
+        with pytest.raises(JHTTPBadRequest):
+            self._json_array_view([{'id': 1}], method='PATCH')
+
+    def test_init_json_object(self):
+        view = self._json_array_view({'foo': 1})
+        assert view._json_items is None
+        assert view._json_params == {'foo': 1}
+
+    @patch('nefertari.view.engine')
+    def test_convert_ids2objects_json_items(self, mock_eng):
+        view = self._test_view()
+        view.Model = Mock()
+        mock_eng.is_relationship_field.return_value = True
+        converted = []
+        view.id2obj = Mock(
+            side_effect=lambda name, cls: converted.append(
+                dict(view._json_params)))
+        view._json_items = [{'foo': 1}, {'foo': 2}]
+        view.convert_ids2objects()
+        assert converted == [{'foo': 1}, {'foo': 2}]
+        assert view._json_params == {'foo2': 'bar2'}
+
+    def test_get_stream_format_param(self):
+        view = self._test_view()
+        view._query_params['_stream'] = 'json'
+        assert view._get_stream_format() == 'json'
+        assert '_stream' not in view._query_params
+
+    def test_get_stream_format_accept(self):
+        view = self._test_view()
+        view.request.headers = {'Accept': 'application/x-ndjson'}
+        assert view._get_stream_format() == 'ndjson'
+
+    def test_get_stream_format_none(self):
+        view = self._test_view()
+        assert view._get_stream_format() is None
+
+    def test_get_stream_format_invalid(self):
+        view = self._test_view()
+        view._query_params['_stream'] = 'xml'
+        with pytest.raises(JHTTPBadRequest):
+            view._get_stream_format()
+
+    def test_stream_limit(self):
+        view = self._test_view()
+        view._auth_enabled = False
+        view.request.params = {}
+        assert view._stream_limit() is None
+        view.request.params = {'_limit': '5'}
+        view._query_params['_limit'] = 5
+        assert view._stream_limit() == 5
+
+    def test_stream_limit_invalid(self):
+        view = self._test_view()
+        view._auth_enabled = False
+        view.request.params = {'_limit': 'foo'}
+        view._query_params['_limit'] = 'foo'
+        with pytest.raises(JHTTPBadRequest):
+            view._stream_limit()
+
+    def test_stream_limit_public(self):
+        view = self._test_view()
+        view._auth_enabled = True
+        view.request.params = {}
+        view.request.user = None
+        assert view._stream_limit() == 20
+
+    def test_stream_chunk_dicts(self):
+        view = self._test_view()
+        view._after_calls = {'index': [
+            lambda request, result: {'data': result},
+            lambda request, result: {'data': [
+                dict(doc, _self=1) for doc in result['data']]},
+        ]}
+        assert view._stream_chunk_dicts(iter([{'a': 1}])) == [
+            {'a': 1, '_self': 1}]
+
+    def _stream_view(self):
+        view = self._test_view()
+        view._json_encoder = None
+        view._stream_chunk_dicts = Mock(side_effect=lambda docs: docs)
+        return view
+
+    def test_stream_collection_ndjson(self):
+        view = self._stream_view()
+        resp = view.stream_collection(
+            iter([[{'a': 1}, {'a': 2}], [], [{'a': 3}]]), 'ndjson')
+        assert resp.content_type == 'application/x-ndjson'
+        assert b''.join(resp.app_iter) == (
+            b'{"a": 1}\n{"a": 2}\n{"a": 3}\n')
+
+    def test_stream_collection_json(self):
+        view = self._stream_view()
+        resp = view.stream_collection(
+            iter([[{'a': 1}, {'a': 2}], [], [{'a': 3}]]), 'json')
+        assert resp.content_type == 'application/json'
+        body = b''.join(resp.app_iter)
+        assert body == b'[{"a": 1},{"a": 2},{"a": 3}]'
+
+    def test_stream_collection_first_chunk_error(self):
+        view = self._stream_view()
+
+        def chunks():
+            raise JHTTPNotFound()
+            yield []
+        with pytest.raises(JHTTPNotFound):
+            view.stream_collection(chunks(), 'json')
+
+    def test_stream_collection_json_empty(self):
+        view = self._stream_view()
+        resp = view.stream_collection(iter([]), 'json')
+        assert b''.join(resp.app_iter) == b'[]'
+
+    def _conditional_view(self, **headers):
+        from pyramid.response import Response
+        from webob import Request
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view.Model.pk_field.return_value = 'id'
+        view.request = Request.blank('/', headers=headers)
+        view.request.response = Response()
+        view.request.authenticated_userid = 'user1'
+        view._cache_control = 'public, max-age=60'
+        return view
+
+    def test_etag(self):
+        view = self._conditional_view()
+        etag = view._etag(1, 2)
+        assert etag == view._etag(1, 2)
+        assert etag != view._etag(1, 3)
+        view._query_params['_fields'] = 'name'
+        assert etag != view._etag(1, 2)
+        view._query_params.pop('_fields')
+        view.request.authenticated_userid = 'user2'
+        assert etag != view._etag(1, 2)
+
+    def test_conditional_response_modified(self):
+        view = self._conditional_view(**{'If-None-Match': '"bar"'})
+        last_modified = views.to_datetime('2016-05-17T10:00:00Z')
+        assert view.conditional_response('foo', last_modified) is None
+        response = view.request.response
+        assert response.headers['ETag'] == '"foo"'
+        assert response.last_modified == last_modified
+        assert response.headers['Cache-Control'] == 'public, max-age=60'
+
+    def test_conditional_response_etag_match(self):
+        from pyramid.httpexceptions import HTTPNotModified
+        view = self._conditional_view(**{'If-None-Match': '"foo"'})
+        response = view.conditional_response('foo')
+        assert isinstance(response, HTTPNotModified)
+        assert response.headers['ETag'] == '"foo"'
+        assert response.headers['Cache-Control'] == 'public, max-age=60'
+
+    def test_conditional_response_modified_since(self):
+        view = self._conditional_view(**{
+            'If-Modified-Since': 'Tue, 17 May 2016 10:00:00 GMT'})
+        response = view.conditional_response(
+            'foo', views.to_datetime('2016-05-17T10:00:00Z'))
+        assert response.status_int == 304
+        response = view.conditional_response(
+            'foo', views.to_datetime('2016-05-17T10:00:01Z'))
+        assert response is None
+
+    def test_conditional_item_response(self):
+        view = self._conditional_view()
+        view.conditional_response = Mock()
+        obj = Mock(id=1, updated_at='2016-05-17T10:00:00Z')
+        assert view.conditional_item_response(obj) is None
+        view._cache_validator = 'updated_at'
+        response = view.conditional_item_response(obj)
+        view.conditional_response.assert_called_once_with(
+            view._etag(1, '2016-05-17T10:00:00Z'),
+            views.to_datetime('2016-05-17T10:00:00Z'))
+        assert response == view.conditional_response()
+
+    def test_head_response(self):
+        view = self._conditional_view()
+        view._auth_enabled = False
+        response = view.head_response(150)
+        assert response is view.request.response
+        assert response.content_type == 'application/json'
+        assert response.headers['X-Total-Count'] == '150'
+        view = self._conditional_view()
+        view._auth_enabled = False
+        assert 'X-Total-Count' not in view.head_response().headers
+
+    def test_head_response_public(self):
+        view = self._conditional_view()
+        view._auth_enabled = True
+        view.request.user = None
+        view.request.registry = Mock(settings={'public_max_limit': '100'})
+        response = view.head_response(150)
+        assert response.headers['X-Total-Count'] == '100'
+
+    def test_exists_fields(self):
+        class View(views.BaseView):
+            Model = Mock()
+        View.Model.pk_field.return_value = 'id'
+        assert View.exists_fields() == ['id']
+        View._parent_backref = 'owner'
+        View._es_ancestry = True
+        View._cache_validator = 'updated_at'
+        assert View.exists_fields() == [
+            'id', 'owner', '_ancestors', 'updated_at']
+
+    def test_to_datetime(self):
+        from datetime import datetime
+        from webob.datetime_utils import UTC
+        expected = datetime(2016, 5, 17, 10, tzinfo=UTC)
+        assert views.to_datetime('2016-05-17T10:00:00Z') == expected
+        assert views.to_datetime(datetime(2016, 5, 17, 10, 0, 0, 5)) == (
+            expected)
+        assert views.to_datetime('foo') is None
+        assert views.to_datetime(3) is None
+
     def test_clean_id_name(self):
         view = self._test_view()
         view._resource = Mock(id_name='foo')
@@ -120,6 +419,10 @@ class TestBaseView(ViewTestBase):
         with pytest.raises(JHTTPNotFound):
             view.get_item(name='wqe')
 
+    def test_get_item_model(self):
+        view = self._test_view()
+        assert view._get_item_model() is view.Model
+
     def test_get_item_found_in_parent(self):
         view = self._test_view()
         view._parent_queryset = Mock(return_value=[1, 3])
@@ -136,6 +439,55 @@ class TestBaseView(ViewTestBase):
         view.reload_context.assert_called_once_with(
             es_based=False, name='wqe')
 
+    def _backref_view(self):
+        view = self._test_view()
+        view.Model = Mock(__name__='Story')
+        view._resource = Mock()
+        view._resource.parent.view.Model.pk_field.return_value = 'id'
+        view._parent_backref = 'owner'
+        view._parent_queryset = Mock()
+        view.reload_context = Mock()
+        return view
+
+    def test_get_item_backref_belongs_to_parent(self):
+        view = self._backref_view()
+        view._parent_item = Mock(return_value=Mock(id=1))
+        view.context = Mock(owner=Mock(id=1))
+        assert view.get_item(name='wqe') is view.context
+        view._parent_item.assert_called_once_with()
+        assert not view._parent_queryset.called
+
+    def test_get_item_backref_wrong_parent(self):
+        view = self._backref_view()
+        view._parent_item = Mock(return_value=Mock(id=2))
+        view.context = Mock(owner=Mock(id=1))
+        with pytest.raises(JHTTPNotFound):
+            view.get_item(name='wqe')
+
+    def test_get_item_backref_no_parent(self):
+        view = self._backref_view()
+        view._parent_item = Mock(return_value=None)
+        view.context = Mock(owner=None)
+        assert view.get_item(name='wqe') is view.context
+
+    def test_belongs_to_parent(self):
+        view = self._backref_view()
+        parent_obj = Mock(id=1)
+        assert view._belongs_to_parent(Mock(owner=Mock(id=1)), parent_obj)
+        assert view._belongs_to_parent(Mock(owner=1), parent_obj)
+        assert view._belongs_to_parent(Mock(owner='1'), parent_obj)
+        assert not view._belongs_to_parent(Mock(owner=None), parent_obj)
+        assert not view._belongs_to_parent(Mock(owner=2), parent_obj)
+
+    def test_belongs_to_parent_list_backref(self):
+        view = self._backref_view()
+        parent_obj = Mock(id=1)
+        assert view._belongs_to_parent(
+            Mock(owner=[Mock(id=3), Mock(id=1)]), parent_obj)
+        assert view._belongs_to_parent(Mock(owner=[3, 1]), parent_obj)
+        assert not view._belongs_to_parent(Mock(owner=[3, 2]), parent_obj)
+        assert not view._belongs_to_parent(Mock(owner=[]), parent_obj)
+
     def test_get_context_key(self):
         view = self._test_view()
         view._resource = Mock(id_name='foo')
@@ -181,6 +533,26 @@ class TestBaseView(ViewTestBase):
             get_item.assert_called_once_with(username='user12')
             assert result == get_item().stories
 
+    def test_parent_queryset_item_subresource(self):
+        class View(views.ItemSubresourceBaseView, BaseView):
+            _json_encoder = 'foo'
+
+        view = View(request=Mock(**self.request_kwargs), **self.view_kwargs)
+        view._parent_item = Mock()
+        assert view._parent_queryset() is None
+        assert not view._parent_item.called
+
+    def test_parent_item_db_fetches(self):
+        view = self._test_view()
+        view._db_fetches = 1
+        parent_view = Mock(_db_fetches=2)
+        view._resource = Mock()
+        view._resource.parent.view.return_value = parent_view
+        view.request.matchdict = {'user_id': 1}
+        view._resource.parent.id_name = 'user_id'
+        assert view._parent_item() == parent_view.get_item()
+        assert view._db_fetches == 3
+
     def test_reload_context(self):
         class Factory(dict):
             item_model = None
@@ -194,6 +566,9 @@ class TestBaseView(ViewTestBase):
         view.reload_context(es_based=False, arg='asd')
         view._get_context_key.assert_called_once_with(arg='asd')
         assert view.context == 'foo'
+        assert view._db_fetches == 1
+        view.reload_context(es_based=True, arg='asd')
+        assert view._db_fetches == 1
 
 
 class TestCollectionView(ViewTestBase):
@@ -206,6 +581,137 @@ class TestCollectionView(ViewTestBase):
         view.get_collection.assert_called_once_with()
         assert resp == view.get_collection()
 
+    def test_index_head(self):
+        view = self._test_view()
+        view.request.method = 'HEAD'
+        view.get_collection = Mock(return_value=3)
+        view.head_response = Mock()
+        resp = view.index()
+        view.get_collection.assert_called_once_with(_count=True)
+        view.head_response.assert_called_once_with(3)
+        assert resp == view.head_response()
+
+    def test_index_count_stream(self):
+        view = self._test_view()
+        view._query_params.update(_stream='ndjson', _count=True)
+        view.get_collection = Mock()
+        view.stream_collection = Mock()
+        assert view.index() == view.get_collection()
+        assert not view.stream_collection.called
+
+    def test_index_stream(self):
+        view = self._test_view()
+        view._query_params['_stream'] = 'ndjson'
+        view.get_collection = Mock()
+        view.iter_collection_chunks = Mock()
+        view.stream_collection = Mock()
+        resp = view.index()
+        assert not view.get_collection.called
+        view.stream_collection.assert_called_once_with(
+            view.iter_collection_chunks(), 'ndjson')
+        assert resp == view.stream_collection()
+
+    def _chunks_view(self):
+        view = self._test_view()
+        view.Model = Mock()
+        view.Model.pk_field.return_value = 'id'
+        view._resource = Mock()
+        view._resource.parent = Mock(spec=[])
+        view._stream_chunk_size = 2
+        view._stream_limit = Mock(return_value=None)
+        view._query_params['_start'] = 10
+        objects = [Mock(id=1), Mock(id=2), Mock(id=3)]
+        view._collection_chunk = Mock(
+            side_effect=[objects[:2], objects[2:]])
+        return view, objects
+
+    def test_iter_collection_chunks(self):
+        view, objects = self._chunks_view()
+        assert list(view.iter_collection_chunks()) == [
+            objects[:2], objects[2:]]
+        view._collection_chunk.assert_has_calls([
+            call(2, 0, None, None), call(2, 2, 2, None)])
+        assert view._query_params['_sort'] == 'id'
+        assert '_start' not in view._query_params
+
+    def test_iter_collection_chunks_limit(self):
+        view, objects = self._chunks_view()
+        view._stream_limit.return_value = 3
+        view._query_params['_sort'] = '-name'
+        assert list(view.iter_collection_chunks()) == [
+            objects[:2], objects[2:]]
+        view._collection_chunk.assert_has_calls([
+            call(2, 0, None, None), call(1, 2, None, None)])
+        assert view._query_params['_sort'] == '-name'
+
+    def test_iter_collection_chunks_nested(self):
+        view, objects = self._chunks_view()
+        view._resource.parent = Mock()
+        view._parent_queryset = Mock(return_value=objects)
+        list(view.iter_collection_chunks())
+        view._collection_chunk.assert_has_calls([
+            call(2, 0, None, objects), call(2, 2, 2, objects)])
+
+    def test_iter_collection_chunks_backref(self):
+        view, objects = self._chunks_view()
+        view._resource.parent = Mock()
+        view._parent_backref = 'owner'
+        view._parent_item = Mock()
+        list(view.iter_collection_chunks())
+        assert view._query_params['owner'] == view._parent_item.return_value
+        view._collection_chunk.assert_has_calls([
+            call(2, 0, None, None), call(2, 2, 2, None)])
+
+    def test_collection_chunk_first(self):
+        view = self._test_view()
+        view.Model = Mock()
+        view.Model.pk_field.return_value = 'id'
+        view.Model.get_collection.return_value = iter([1, 2])
+        assert view._collection_chunk(2, 0) == [1, 2]
+        view.Model.get_collection.assert_called_once_with(
+            foo='bar', _limit=2, _start=0)
+
+    @patch('ramses.views._pk_after_queryset')
+    def test_collection_chunk_after(self, mock_after):
+        view = self._test_view()
+        view.Model = Mock()
+        view.Model.pk_field.return_value = 'id'
+        view.Model.get_collection.return_value = []
+        view._collection_chunk(2, 4, after=3)
+        mock_after.assert_called_once_with(view.Model, 3)
+        view.Model.get_collection.assert_called_once_with(
+            foo='bar', _limit=2, query_set=mock_after.return_value)
+
+    @patch('ramses.views._pk_after_queryset')
+    def test_collection_chunk_after_not_supported(self, mock_after):
+        view = self._test_view()
+        view.Model = Mock()
+        view.Model.pk_field.return_value = 'id'
+        view.Model.get_collection.return_value = []
+        mock_after.return_value = None
+        view._collection_chunk(2, 4, after=3)
+        view.Model.get_collection.assert_called_once_with(
+            foo='bar', _limit=2, _start=4)
+
+    def test_collection_chunk_children(self):
+        view = self._test_view()
+        view.Model = Mock()
+        view.Model.pk_field.return_value = 'id'
+        view.Model.filter_objects.return_value = []
+        children = [Mock(id=1), Mock(id=2), Mock(id=3)]
+        view._collection_chunk(2, 4, after=1, children=children)
+        view.Model.filter_objects.assert_called_once_with(
+            children[1:], foo='bar', _limit=2)
+
+    def test_pk_after_queryset(self):
+        model_cls = Mock(spec=['pk_field', 'objects', '_get_collection'])
+        model_cls.pk_field.return_value = 'id'
+        query_set = views._pk_after_queryset(model_cls, 3)
+        model_cls.objects.assert_called_once_with(id__gt=3)
+        assert query_set == model_cls.objects.return_value
+        model_cls = Mock(spec=['pk_field'])
+        assert views._pk_after_queryset(model_cls, 3) is None
+
     def test_show(self):
         view = self._test_view()
         view.get_item = Mock()
@@ -213,6 +719,24 @@ class TestCollectionView(ViewTestBase):
         view.get_item.assert_called_once_with(foo='bar')
         assert resp == view.get_item()
 
+    def test_show_head(self):
+        view = self._test_view()
+        view.request.method = 'HEAD'
+        view.get_item = Mock()
+        view.head_response = Mock()
+        assert view.show(foo='bar') == view.head_response.return_value
+        view.get_item.assert_called_once_with(foo='bar')
+        view.head_response.assert_called_once_with()
+
+    def test_show_not_modified(self):
+        view = self._test_view()
+        view.get_item = Mock()
+        view.conditional_item_response = Mock()
+        resp = view.show(foo='bar')
+        view.conditional_item_response.assert_called_once_with(
+            view.get_item())
+        assert resp == view.conditional_item_response()
+
     def test_create(self):
         view = self._test_view()
         view.set_object_acl = Mock()
@@ -279,10 +803,233 @@ class TestCollectionView(ViewTestBase):
             view.request)
         assert resp == 123
 
+    def _create_many_view(self):
+        view = self._test_view()
+        view.set_object_acl = Mock()
+        view.Model = Mock(__name__='Foo')
+        view.Model.pk_field.return_value = 'id'
+        view.Model.side_effect = lambda **kw: Mock(**kw)
+        view._json_items = [{'id': 1}, {'id': 2}]
+        view.request.headers = {}
+        return view
+
+    def test_create_json_array(self):
+        view = self._create_many_view()
+        view.create_many = Mock()
+        assert view.create() == view.create_many()
+
+    def test_create_many(self):
+        view = self._create_many_view()
+        objects = [Mock(), Mock()]
+        view.Model.side_effect = objects
+        view._process_json_item = Mock(side_effect=lambda params, act: params)
+        result = view.create_many()
+        view._process_json_item.assert_has_calls([
+            call({'id': 1}, 'create'), call({'id': 2}, 'create')])
+        assert view.Model.call_args_list == [call(id=1), call(id=2)]
+        assert view.set_object_acl.call_count == 2
+        for obj in objects:
+            obj.save.assert_called_once_with(view.request)
+        assert result == [obj.save() for obj in objects]
+
+    def test_create_many_minimal(self):
+        view = self._create_many_view()
+        view.request.headers = {'Prefer': 'return=minimal'}
+        for params in view._json_items:
+            params['save'] = Mock(return_value=Mock(id=params['id']))
+        assert view.create_many() == [
+            {'_type': 'Foo', '_pk': '1'}, {'_type': 'Foo', '_pk': '2'}]
+
+    def test_create_many_item_error(self):
+        view = self._create_many_view()
+        failing = Mock()
+        failing.save.side_effect = JHTTPConflict()
+        view.Model.side_effect = [Mock(), failing]
+        with pytest.raises(JHTTPConflict) as ex:
+            view.create_many()
+        assert 'Failed to create item 1' in ex.value.body.decode()
+
+    def test_create_many_invalid_item(self):
+        view = self._create_many_view()
+        view.Model.side_effect = TypeError('foo')
+        with pytest.raises(JHTTPBadRequest):
+            view.create_many()
+
+    def _update_each_view(self):
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view.Model.pk_field.return_value = 'id'
+        view._resource = Mock()
+        view._resource.parent = Mock(spec=[])
+        view._auth_enabled = False
+        view._json_item_ids = [2, 1]
+        view._json_items = [{'foo': 2}, {'foo': 1}]
+        view.Model.get_by_ids.return_value = [Mock(id=1), Mock(id=2)]
+        return view
+
+    def test_update_many_json_array(self):
+        view = self._update_each_view()
+        view.update_each = Mock()
+        assert view.update_many() == view.update_each()
+
+    def test_update_each(self):
+        view = self._update_each_view()
+        obj1, obj2 = view.Model.get_by_ids.return_value
+        assert view.update_each() == 2
+        view.Model.get_by_ids.assert_called_once_with([2, 1])
+        obj1.update.assert_called_once_with({'foo': 1}, view.request)
+        obj2.update.assert_called_once_with({'foo': 2}, view.request)
+
+    def test_update_each_processed_changes(self):
+        view = self._update_each_view()
+        obj1, obj2 = view.Model.get_by_ids.return_value
+        view._process_json_item = Mock(
+            side_effect=lambda params, action, instance: dict(
+                params, bar=instance.id))
+        view.update_each()
+        view._process_json_item.assert_has_calls([
+            call({'foo': 2}, 'update', instance=obj2),
+            call({'foo': 1}, 'update', instance=obj1)])
+        obj1.update.assert_called_once_with(
+            {'foo': 1, 'bar': 1}, view.request)
+        obj2.update.assert_called_once_with(
+            {'foo': 2, 'bar': 2}, view.request)
+
+    def test_update_each_not_found(self):
+        view = self._update_each_view()
+        view._json_item_ids = [2, 3]
+        with pytest.raises(JHTTPNotFound) as ex:
+            view.update_each()
+        assert 'Foo(3)' in ex.value.body.decode()
+        obj1, obj2 = view.Model.get_by_ids.return_value
+        assert not obj2.update.called
+
+    def test_update_each_other_parent(self):
+        view = self._update_each_view()
+        view._resource.parent = Mock()
+        view._parent_backref = 'owner'
+        view._parent_item = Mock()
+        view._belongs_to_parent = Mock(side_effect=lambda obj, p: obj.id == 1)
+        with pytest.raises(JHTTPNotFound) as ex:
+            view.update_each()
+        assert 'Foo(2)' in ex.value.body.decode()
+
+    @patch('ramses.views.wrappers')
+    def test_update_each_auth(self, mock_wrap):
+        view = self._update_each_view()
+        view._auth_enabled = True
+        view._check_item_permission = Mock()
+        obj1, obj2 = view.Model.get_by_ids.return_value
+        view.update_each()
+        mock_wrap.apply_request_privacy.assert_has_calls([
+            call(view.Model, {'foo': 2}), call(view.Model, {'foo': 1}),
+        ], any_order=True)
+        view._check_item_permission.assert_has_calls([
+            call(obj2, 'update'), call(obj1, 'update')])
+
+    @patch('ramses.views.wrappers')
+    def test_update_each_forbidden(self, mock_wrap):
+        view = self._update_each_view()
+        view._auth_enabled = True
+        acls = iter(['acl2', 'acl1'])
+
+        class Factory(object):
+            item_model = None
+
+            def __init__(self, request):
+                pass
+
+            def item_acl(self, item):
+                return next(acls)
+
+        view._factory = Factory
+        view.request.has_permission.side_effect = [True, False]
+        with pytest.raises(JHTTPForbidden):
+            view.update_each()
+        obj1, obj2 = view.Model.get_by_ids.return_value
+        assert obj2.__acl__ == 'acl2'
+        assert obj1.__acl__ == 'acl1'
+        view.request.has_permission.assert_called_with('update', obj1)
+        assert not obj1.update.called
+        assert not obj2.update.called
+
+    def _set_based_view(self):
+        view = self._test_view()
+        view.Model = Mock(__name__='Mock')
+        view._set_based_bulk = True
+        view._query_params.pop('_limit', None)
+        view._resource = Mock()
+        view._resource.parent = Mock(spec=[])
+        return view
+
+    def test_get_bulk_queryset_disabled(self):
+        view = self._set_based_view()
+        view._set_based_bulk = False
+        assert view.get_bulk_queryset() is None
+        assert not view.Model.get_collection.called
+
+    def test_get_bulk_queryset_paged(self):
+        view = self._set_based_view()
+        view._query_params['_start'] = 10
+        assert view.get_bulk_queryset() is None
+
+    def test_get_bulk_queryset(self):
+        view = self._set_based_view()
+        result = view.get_bulk_queryset()
+        view.Model.get_collection.assert_called_once_with(foo='bar')
+        assert result == view.Model.get_collection()
+
+    def test_get_bulk_queryset_nested_no_backref(self):
+        view = self._set_based_view()
+        view._resource.parent = Mock()
+        assert view.get_bulk_queryset() is None
+
+    def test_get_bulk_queryset_nested(self):
+        view = self._set_based_view()
+        view._resource.parent = Mock()
+        view._parent_backref = 'owner'
+        view._parent_item = Mock(return_value='user1')
+        view.get_bulk_queryset()
+        view.Model.get_collection.assert_called_once_with(
+            foo='bar', owner='user1')
+
+    def test_delete_many_set_based(self):
+        view = self._set_based_view()
+        view.get_collection = Mock()
+        view.get_bulk_queryset = Mock()
+        view.delete_many()
+        assert not view.get_collection.called
+        view.Model._delete_many.assert_called_once_with(
+            view.get_bulk_queryset(), view.request)
+
+    def test_update_many_set_based(self):
+        view = self._set_based_view()
+        view.get_collection = Mock()
+        view.get_bulk_queryset = Mock()
+        view.update_many()
+        assert not view.get_collection.called
+        view.Model._update_many.assert_called_once_with(
+            view.get_bulk_queryset(), {'foo2': 'bar2'}, view.request)
+
 
 class TestESBaseView(ViewTestBase):
     view_cls = views.ESBaseView
 
+    def test_hide_ancestors(self):
+        result = {'data': [{'id': 1, '_ancestors': {}}, {'id': 2}]}
+        assert views.hide_ancestors(result=result) == {
+            'data': [{'id': 1}, {'id': 2}]}
+        result = {'id': 1, '_ancestors': {}}
+        assert views.hide_ancestors(result=result) == {'id': 1}
+
+    def test_setup_default_wrappers_ancestry(self):
+        view = self._test_view()
+        assert views.hide_ancestors not in view._after_calls['show']
+        view.Model = Mock(_es_ancestry=True)
+        view.setup_default_wrappers()
+        assert view._after_calls['index'][-1] is views.hide_ancestors
+        assert view._after_calls['show'][-1] is views.hide_ancestors
+
     def test_parent_queryset_es(self):
         from pyramid.config import Configurator
         from ramses.acl import BaseACL
@@ -412,6 +1159,262 @@ class TestESBaseView(ViewTestBase):
         view.reload_context.assert_called_once_with(es_based=True, a=4)
         assert resp == view.context
 
+    def test_get_item_es_backref_id(self):
+        view = self._test_view()
+        view.Model = Mock(__name__='Story')
+        view._resource = Mock()
+        view._resource.parent.view.Model.pk_field.return_value = 'id'
+        view._parent_backref = 'owner'
+        view._parent_queryset_es = Mock()
+        view._parent_item = Mock(return_value=Mock(id=1))
+        view._get_context_key = Mock(return_value='2')
+        view.reload_context = Mock()
+        view.context = Mock(owner=1)
+        assert view.get_item_es(a=4) is view.context
+        view._parent_item.assert_called_once_with(es_based=True)
+        assert not view._parent_queryset_es.called
+
+    def test_get_item_es_backref_wrong_parent(self):
+        view = self._test_view()
+        view.Model = Mock(__name__='Story')
+        view._resource = Mock()
+        view._resource.parent.view.Model.pk_field.return_value = 'id'
+        view._parent_backref = 'owner'
+        view._parent_item = Mock(return_value=Mock(id=1))
+        view._get_context_key = Mock(return_value='2')
+        view.reload_context = Mock()
+        view.context = Mock(owner=3)
+        with pytest.raises(JHTTPNotFound) as ex:
+            view.get_item_es(a=4)
+        assert 'Story(id=2) resource not found' in str(ex.value)
+
+    def _mget_resource(self):
+        user = Mock(id_name='user_username', collection_name='users')
+        user.parent = Mock(spec=[])
+        user.view = Mock(_parent_backref=None)
+        user.view.Model = Mock(__name__='User')
+        user.view.Model.pk_field.return_value = 'username'
+        story = Mock(id_name='story_id', collection_name='stories')
+        story.parent = user
+        story.view = Mock(_parent_backref=None)
+        story.view.Model = Mock(__name__='Story')
+        story.view.Model.pk_field.return_value = 'id'
+        for parent in (user, story):
+            parent.view._factory.return_value.item_db_id.side_effect = (
+                lambda key: key)
+        resource = Mock(collection_name='comments')
+        resource.parent = story
+        resource.view = Mock(_parent_backref='story')
+        resource.view.Model.pk_field.return_value = 'id'
+        resource.parent.view.Model.pk_field.return_value = 'id'
+        return resource
+
+    def test_in_parent_es_backref(self):
+        view = self._test_view()
+        resource = self._mget_resource()
+        parent_obj = Mock(id=1)
+        assert view._in_parent_es(resource, Mock(story=1), parent_obj)
+        assert not view._in_parent_es(resource, Mock(story=2), parent_obj)
+
+    def test_in_parent_es_collection(self):
+        view = self._test_view()
+        story = self._mget_resource().parent
+        parent_obj = Mock(stories=[1, 3])
+        assert view._in_parent_es(story, Mock(id=3), parent_obj)
+        assert not view._in_parent_es(story, Mock(id=2), parent_obj)
+        assert not view._in_parent_es(
+            story, Mock(id=2), Mock(stories=None))
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_parents_es(self, mock_es):
+        view = self._test_view()
+        view.Model = Mock(__name__='Comment')
+        view._resource = self._mget_resource()
+        view.request.matchdict = {'user_username': 'user1', 'story_id': '1'}
+        story_doc = Mock(id=1)
+        user_doc = Mock(stories=[1])
+        mock_es().get_by_ids.return_value = [story_doc, user_doc]
+        parents = view._get_parents_es()
+        mock_es.assert_called_with('Comment')
+        mock_es().get_by_ids.assert_called_once_with([
+            {'_type': 'Story', '_id': '1'},
+            {'_type': 'User', '_id': 'user1'},
+        ], _raise_on_empty=True,
+            _fields=['comments', 'id', 'stories', 'username'])
+        story = view._resource.parent
+        assert parents == [(story, story_doc), (story.parent, user_doc)]
+
+    def test_parents_fields_es_backref(self):
+        view = self._test_view()
+        view._resource = self._mget_resource()
+        story = view._resource.parent
+        story.view._parent_backref = 'author'
+        assert view._parents_fields_es([story, story.parent]) == [
+            'author', 'comments', 'id', 'stories', 'username']
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_parents_es_not_matching(self, mock_es):
+        view = self._test_view()
+        view.Model = Mock(__name__='Comment')
+        view._resource = self._mget_resource()
+        view.request.matchdict = {'user_username': 'user1', 'story_id': '1'}
+        mock_es().get_by_ids.return_value = [Mock(id=1), Mock(stories=[2])]
+        with pytest.raises(JHTTPNotFound) as ex:
+            view._get_parents_es()
+        assert 'Story(id=1) resource not found' in str(ex.value)
+
+    def test_get_item_es_mget_parents(self):
+        view = self._test_view()
+        view._mget_parents = True
+        view._resource = self._mget_resource()
+        view._parent_queryset_es = Mock()
+        view._get_parents_es = Mock(return_value=[
+            (view._resource.parent, Mock(id=1))])
+        view._get_context_key = Mock(return_value='2')
+        view.reload_context = Mock()
+        view.context = Mock(story=1)
+        assert view.get_item_es(a=4) is view.context
+        view._get_parents_es.assert_called_once_with()
+        assert not view._parent_queryset_es.called
+
+    def test_get_item_es_mget_parents_not_matching(self):
+        view = self._test_view()
+        view._mget_parents = True
+        view.Model = Mock(__name__='Comment')
+        view._resource = self._mget_resource()
+        view._get_parents_es = Mock(return_value=[
+            (view._resource.parent, Mock(id=1))])
+        view._get_context_key = Mock(return_value='2')
+        view.reload_context = Mock()
+        view.context = Mock(story=3)
+        with pytest.raises(JHTTPNotFound):
+            view.get_item_es(a=4)
+
+    def test_parent_queryset_es_mget_parents(self):
+        view = self._test_view()
+        view._mget_parents = True
+        view._resource = self._mget_resource()
+        view._parent_item = Mock()
+        story_doc = Mock(comments=[1, 2])
+        view._get_parents_es = Mock(return_value=[
+            (view._resource.parent, story_doc)])
+        assert view._parent_queryset_es() == [1, 2]
+        assert not view._parent_item.called
+
+    def _ancestry_resource(self):
+        user = Mock(id_name='user_username')
+        user.parent = Mock(spec=[])
+        story = Mock(id_name='story_id')
+        story.parent = user
+        for parent in (user, story):
+            parent.view._factory.return_value.item_db_id.side_effect = (
+                lambda key: key)
+        resource = Mock()
+        resource.parent = story
+        return resource
+
+    def test_get_ancestor_ids_disabled(self):
+        view = self._test_view()
+        assert view._get_ancestor_ids() is None
+
+    def test_get_ancestor_ids_not_nested(self):
+        view = self._test_view()
+        view._es_ancestry = True
+        view.Model = Mock(_ancestry={'user_username': ['owner']})
+        view._resource = Mock()
+        view._resource.parent = Mock(spec=[])
+        assert view._get_ancestor_ids() is None
+
+    def test_get_ancestor_ids_not_covered(self):
+        view = self._test_view()
+        view._es_ancestry = True
+        view.Model = Mock(_ancestry={'story_id': ['story']})
+        view._resource = self._ancestry_resource()
+        view.request.matchdict = {'user_username': 'user1', 'story_id': 1}
+        assert view._get_ancestor_ids() is None
+
+    def test_get_ancestor_ids(self):
+        view = self._test_view()
+        view._es_ancestry = True
+        view.Model = Mock(_ancestry={
+            'story_id': ['story'],
+            'user_username': ['story', 'owner'],
+        })
+        view._resource = self._ancestry_resource()
+        view.request.matchdict = {'user_username': 'user1', 'story_id': 1}
+        assert view._get_ancestor_ids() == {
+            'story_id': '1', 'user_username': 'user1'}
+        factory = view._resource.parent.parent.view._factory
+        factory.assert_called_with(request=view.request)
+        factory().item_db_id.assert_called_with('user1')
+
+    def test_has_ancestors(self):
+        from nefertari.utils import dict2obj, dictset
+        view = self._test_view()
+        obj = dict2obj({'_ancestors': {'story_id': ['1', '2']}})
+        assert view._has_ancestors(obj, {'story_id': '1'})
+        assert not view._has_ancestors(obj, {'story_id': '3'})
+        assert not view._has_ancestors(obj, {'user_username': 'user1'})
+        assert not view._has_ancestors(dict2obj({'a': 1}), {'story_id': '1'})
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_es_ancestry(self, mock_es):
+        mock_es.settings.asbool.return_value = False
+        view = self._test_view()
+        view._get_ancestor_ids = Mock(return_value={'story_id': '1'})
+        view._check_parent_exists_es = Mock()
+        view._parent_queryset_es = Mock()
+        view.Model = Mock(__name__='Foo')
+        view.get_collection_es()
+        assert not view._parent_queryset_es.called
+        view._check_parent_exists_es.assert_called_once_with()
+        mock_es().get_collection.assert_called_once_with(
+            _limit=20, foo='bar', **{'_ancestors.story_id': '1'})
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_es_ancestry_no_parent(self, mock_es):
+        view = self._test_view()
+        view._get_ancestor_ids = Mock(return_value={'story_id': '1'})
+        view._check_parent_exists_es = Mock(side_effect=JHTTPNotFound)
+        view.Model = Mock(__name__='Foo')
+        with pytest.raises(JHTTPNotFound):
+            view.get_collection_es()
+        assert not mock_es().get_collection.called
+
+    def test_check_parent_exists_es(self):
+        view = self._test_view()
+        view._resource = self._ancestry_resource()
+        view.request.matchdict = {'story_id': '1'}
+        parent = view._resource.parent
+        parent.view._factory.return_value = MagicMock()
+        view._check_parent_exists_es()
+        parent.view._factory.assert_called_once_with(request=view.request)
+        parent.view._factory().__getitem__.assert_called_once_with('1')
+
+    def test_get_item_es_ancestry_matching(self):
+        view = self._test_view()
+        view._get_context_key = Mock(return_value='2')
+        view._get_ancestor_ids = Mock(return_value={'story_id': '1'})
+        view._has_ancestors = Mock(return_value=True)
+        view._parent_queryset_es = Mock()
+        view.reload_context = Mock()
+        view.context = 'foo'
+        assert view.get_item_es(a=4) == 'foo'
+        assert not view._parent_queryset_es.called
+        view._has_ancestors.assert_called_once_with('foo', {'story_id': '1'})
+
+    def test_get_item_es_ancestry_not_matching(self):
+        view = self._test_view()
+        view._get_context_key = Mock(return_value='2')
+        view._get_ancestor_ids = Mock(return_value={'story_id': '1'})
+        view._has_ancestors = Mock(return_value=False)
+        view.reload_context = Mock()
+        view.Model = Mock(__name__='Foo')
+        view.context = 'foo'
+        with pytest.raises(JHTTPNotFound) as ex:
+            view.get_item_es(a=4)
+        assert 'Foo(id=2) resource not found' in str(ex.value)
+
 
 class TestESCollectionView(ViewTestBase):
     view_cls = views.ESCollectionView
@@ -431,18 +1434,119 @@ class TestESCollectionView(ViewTestBase):
         view.get_item_es.assert_called_once_with(foo=1)
         assert resp == view.get_item_es()
 
+    def test_show_head(self):
+        view = self._test_view()
+        view.request.method = 'HEAD'
+        view.get_item_es = Mock()
+        view.head_response = Mock()
+        assert view.show(foo=1) == view.head_response()
+        view.get_item_es.assert_called_once_with(foo=1)
+
+    def test_index_head(self):
+        view = self._test_view()
+        view.request.method = 'HEAD'
+        view.head_collection_es = Mock()
+        assert view.index() == view.head_collection_es()
+
+    def test_index_count(self):
+        view = self._test_view()
+        view._query_params.update(_count=True, _cursor='', _stream='json')
+        view._collection_cache = Mock()
+        view.get_collection_es = Mock(return_value=3)
+        assert view.index() == 3
+        assert '_cursor' not in view._query_params
+        view.get_collection_es.assert_called_once_with()
+
+    @patch('ramses.views.NefertariBaseView.get_collection_es')
+    def test_head_collection_es(self, mock_get):
+        view = self._test_view()
+        view._query_params['_cursor'] = ''
+        view._set_parent_filter_es = Mock(return_value=True)
+        view.head_response = Mock()
+        mock_get.return_value = 3
+        resp = view.head_collection_es()
+        assert resp == view.head_response.return_value
+        assert view._query_params['_count']
+        assert '_cursor' not in view._query_params
+        view.head_response.assert_called_once_with(3)
+
+    def test_head_collection_es_no_parent_objects(self):
+        view = self._test_view()
+        view._set_parent_filter_es = Mock(return_value=False)
+        view.head_response = Mock()
+        view.head_collection_es()
+        view.head_response.assert_called_once_with(0)
+
+    @patch('ramses.views.NefertariBaseView.get_collection_es')
+    def test_head_collection_es_validator(self, mock_get):
+        view = self._test_view()
+        view._cache_validator = 'updated_at'
+        view._set_parent_filter_es = Mock(return_value=True)
+        view._validate_collection_es = Mock(return_value=(3, None))
+        view.head_response = Mock()
+        view.head_collection_es()
+        view.head_response.assert_called_once_with(3)
+        assert not mock_get.called
+        view._validate_collection_es.return_value = (3, 'not modified')
+        assert view.head_collection_es() == 'not modified'
+
     def test_update(self):
         view = self._test_view()
         view.get_item = Mock()
+        view.get_item_es = Mock()
         view.reload_context = Mock()
-        view._location = Mock(return_value='/sadasd')
         resp = view.update(foo=1)
         view.reload_context.assert_called_once_with(es_based=False, foo=1)
         view.get_item.assert_called_once_with(foo=1)
+        assert not view.get_item_es.called
         view.get_item().update.assert_called_once_with(
             {'foo2': 'bar2'}, view.request)
         assert resp == view.get_item().update()
 
+    def _write_view(self):
+        obj = NonCallableMock()
+
+        class Factory(object):
+            item_model = Mock()
+
+            def __init__(self, request):
+                pass
+
+            def __getitem__(self, key):
+                return obj
+
+        view = self._test_view()
+        view._factory = Factory
+        view._resource = Mock(id_name='story_id')
+        view.get_item_es = Mock()
+        view._parent_queryset = Mock(return_value=[obj])
+        return view, obj
+
+    def test_update_single_fetch(self):
+        view, obj = self._write_view()
+        view.update(story_id=1)
+        obj.update.assert_called_once_with({'foo2': 'bar2'}, view.request)
+        assert view._db_fetches == 1
+        view._parent_queryset.assert_called_once_with()
+        assert not view.get_item_es.called
+
+    def test_delete_single_fetch(self):
+        view, obj = self._write_view()
+        view.delete(story_id=1)
+        obj.delete.assert_called_once_with(view.request)
+        assert view._db_fetches == 1
+        view._parent_queryset.assert_called_once_with()
+        assert not view.get_item_es.called
+
+    def test_update_not_in_parent(self):
+        view, obj = self._write_view()
+        view._parent_queryset.return_value = []
+        view.Model = Mock(__name__='Story')
+        with pytest.raises(JHTTPNotFound):
+            view.update(story_id=1)
+        assert not obj.update.called
+        assert not view.get_item_es.called
+
     def test_replace(self):
         view = self._test_view()
         view.update = Mock()
@@ -455,8 +1559,10 @@ class TestESCollectionView(ViewTestBase):
         view._query_params['_limit'] = 50
         view.get_collection_es = Mock(return_value=[1, 2])
         view.Model = Mock()
+        view.Model.pk_field.return_value = 'id'
         result = view.get_dbcollection_with_es(foo='bar')
         view.get_collection_es.assert_called_once_with()
+        assert view._query_params['_fields'] == ['id']
         view.Model.filter_objects.assert_called_once_with([1, 2])
         assert result == view.Model.filter_objects()
 
@@ -483,6 +1589,417 @@ class TestESCollectionView(ViewTestBase):
             view.request)
         assert result == 123
 
+    def _chunked_view(self):
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view._bulk_chunk_size = 2
+        view._query_params.pop('_limit', None)
+        view._set_parent_filter_es = Mock(return_value=True)
+        view.get_es_ids_chunks = Mock(return_value=[
+            (3, ['1', '2']), (3, ['3'])])
+        view.get_dbcollection_with_es = Mock()
+        return view
+
+    def test_update_many_chunked(self):
+        view = self._chunked_view()
+        view.Model._update_many.side_effect = [2, 1]
+        result = view.update_many(foo=1)
+        assert not view.get_dbcollection_with_es.called
+        view._set_parent_filter_es.assert_called_once_with()
+        view.Model.get_by_ids.assert_has_calls([
+            call(['1', '2']), call(['3'])])
+        assert view.Model._update_many.call_count == 2
+        view.Model._update_many.assert_called_with(
+            view.Model.get_by_ids(), {'foo2': 'bar2'}, view.request)
+        assert result == 3
+
+    def test_delete_many_chunked(self):
+        view = self._chunked_view()
+        view.Model._delete_many.side_effect = [2, 1]
+        result = view.delete_many(foo=1)
+        assert not view.get_dbcollection_with_es.called
+        assert view.Model._delete_many.call_count == 2
+        view.Model._delete_many.assert_called_with(
+            view.Model.get_by_ids(), view.request)
+        assert result == 3
+
+    def test_delete_many_chunked_no_parent_objects(self):
+        view = self._chunked_view()
+        view._set_parent_filter_es.return_value = False
+        view.Model._delete_many.return_value = 0
+        assert view.delete_many() == 0
+        assert not view.get_es_ids_chunks.called
+        view.Model._delete_many.assert_called_once_with([], view.request)
+
+    def test_update_many_chunked_paged(self):
+        view = self._chunked_view()
+        view._query_params['_limit'] = 10
+        view.update_many()
+        view.get_dbcollection_with_es.assert_called_once_with()
+        assert not view.get_es_ids_chunks.called
+
+    def test_update_many_json_array(self):
+        view = self._chunked_view()
+        view._json_items = [{'foo': 1}]
+        view.update_each = Mock()
+        assert view.update_many() == view.update_each()
+        assert not view.get_es_ids_chunks.called
+
+    def test_delete_many_set_based(self):
+        view = self._chunked_view()
+        view.get_bulk_queryset = Mock()
+        view.Model._delete_many.return_value = 3
+        assert view.delete_many() == 3
+        assert not view.get_es_ids_chunks.called
+        assert not view.get_dbcollection_with_es.called
+        view.Model._delete_many.assert_called_once_with(
+            view.get_bulk_queryset(), view.request)
+
+    def test_update_many_set_based(self):
+        view = self._chunked_view()
+        view.get_bulk_queryset = Mock()
+        view.update_many()
+        assert not view.get_es_ids_chunks.called
+        view.Model._update_many.assert_called_once_with(
+            view.get_bulk_queryset(), {'foo2': 'bar2'}, view.request)
+
+    def test_get_bulk_queryset_es_only_params(self):
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view._set_based_bulk = True
+        view._query_params.pop('_limit', None)
+        view._query_params['q'] = 'foo'
+        assert view.get_bulk_queryset() is None
+        assert not view.Model.get_collection.called
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_es_ids_chunks(self, mock_es):
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view._bulk_chunk_size = 2
+        mock_es().build_search_params.return_value = {
+            'index': 'idx', 'doc_type': 'Foo', 'body': {'query': 1},
+            'from_': 0, 'size': 2, 'fields': ['id'],
+        }
+        mock_es.api.search.return_value = {
+            '_scroll_id': 'a',
+            'hits': {'total': 3, 'hits': [{'_id': '1'}, {'_id': '2'}]},
+        }
+        mock_es.api.scroll.side_effect = [
+            {'_scroll_id': 'b', 'hits': {'total': 3, 'hits': [{'_id': '3'}]}},
+            {'_scroll_id': 'c', 'hits': {'total': 3, 'hits': []}},
+        ]
+        chunks = list(view.get_es_ids_chunks())
+        assert chunks == [(3, ['1', '2']), (3, ['3'])]
+        mock_es().build_search_params.assert_called_once_with(
+            {'foo': 'bar', '_limit': 2})
+        mock_es.api.search.assert_called_once_with(
+            scroll='5m', _source=False, index='idx', doc_type='Foo',
+            body={'query': 1}, size=2)
+        mock_es.api.scroll.assert_has_calls([
+            call(scroll_id='a', scroll='5m'),
+            call(scroll_id='b', scroll='5m'),
+        ])
+        mock_es.api.clear_scroll.assert_called_once_with(scroll_id='c')
+
+    def test_index_stream(self):
+        view = self._test_view()
+        view._query_params['_stream'] = 'json'
+        view.get_collection_es = Mock()
+        view.iter_collection_chunks_es = Mock()
+        view.stream_collection = Mock()
+        resp = view.index()
+        assert not view.get_collection_es.called
+        view.stream_collection.assert_called_once_with(
+            view.iter_collection_chunks_es(), 'json')
+        assert resp == view.stream_collection()
+
+    def test_index_conditional(self):
+        view = self._test_view()
+        view._cache_validator = 'updated_at'
+        view.get_collection_conditional_es = Mock()
+        assert view.index() == view.get_collection_conditional_es()
+
+    def _conditional_es_view(self, mock_es):
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view._cache_validator = 'updated_at'
+        view._query_params.update(_limit=10, _sort='-updated_at')
+        view._set_parent_filter_es = Mock(return_value=True)
+        view._etag = Mock(return_value='foo')
+        mock_es().build_search_params.return_value = {'body': {'query': 1}}
+        mock_es.api.search.return_value = {
+            'hits': {'total': 3},
+            'aggregations': {'validator': {
+                'value': 1463479200000,
+                'value_as_string': '2016-05-17T10:00:00.000Z'}},
+        }
+        return view
+
+    @patch('ramses.views.NefertariBaseView.get_collection_es')
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_conditional_es(self, mock_es, mock_get):
+        view = self._conditional_es_view(mock_es)
+        view.conditional_response = Mock(return_value=None)
+        assert view.get_collection_conditional_es() == mock_get()
+        mock_es().build_search_params.assert_called_once_with(
+            {'foo': 'bar', '_limit': 0})
+        mock_es.api.search.assert_called_once_with(body={
+            'query': 1,
+            'aggregations': {'validator': {'max': {'field': 'updated_at'}}},
+        })
+        view._etag.assert_called_once_with(3, 1463479200000)
+        view.conditional_response.assert_called_once_with(
+            'foo', views.to_datetime('2016-05-17T10:00:00Z'))
+
+    @patch('ramses.views.NefertariBaseView.get_collection_es')
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_conditional_es_not_modified(
+            self, mock_es, mock_get):
+        view = self._conditional_es_view(mock_es)
+        view.conditional_response = Mock()
+        result = view.get_collection_conditional_es()
+        assert result == view.conditional_response()
+        assert not mock_get.called
+
+    @patch('ramses.views.NefertariBaseView.get_collection_es')
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_conditional_es_cached(self, mock_es, mock_get):
+        view = self._conditional_es_view(mock_es)
+        view.conditional_response = Mock(return_value=None)
+        view._collection_cache = Mock()
+        view.get_collection_cached_es = Mock()
+        result = view.get_collection_conditional_es()
+        assert result == view.get_collection_cached_es.return_value
+        fetch = view.get_collection_cached_es.call_args[0][0]
+        assert fetch() == mock_get.return_value
+
+    @patch('ramses.views.NefertariBaseView.get_collection_es')
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_conditional_es_coalesced(
+            self, mock_es, mock_get):
+        view = self._conditional_es_view(mock_es)
+        view.conditional_response = Mock(return_value=None)
+        view._single_flight = Mock()
+        view.request.effective_principals = []
+        result = view.get_collection_conditional_es()
+        assert result == view._single_flight.do.return_value
+        assert not mock_get.called
+
+    def test_index_cached(self):
+        view = self._test_view()
+        view._collection_cache = Mock()
+        view.get_collection_cached_es = Mock()
+        assert view.index() == view.get_collection_cached_es()
+
+    def _cached_es_view(self):
+        from ramses.cache import LRUCache
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view._collection_cache = LRUCache()
+        view.request.path = '/foo'
+        view.request.effective_principals = ['system.Everyone', 'admin']
+        view.get_collection_es = Mock(return_value=[{'id': 1}])
+        return view
+
+    def test_read_key(self):
+        view = self._cached_es_view()
+        view._query_params.update(_limit=10)
+        assert view._read_key() == (
+            '/foo', '{"_limit": 10, "foo": "bar"}',
+            ('admin', 'system.Everyone'))
+
+    def test_get_collection_cached_es(self):
+        view = self._cached_es_view()
+        result = view.get_collection_cached_es()
+        assert result == [{'id': 1}]
+        result[0]['id'] = 2
+        assert view.get_collection_cached_es() == [{'id': 1}]
+        view.get_collection_es.assert_called_once_with()
+        assert view._collection_cache.stats()['hit_rate'] == 0.5
+
+    def test_get_collection_coalesced_es(self):
+        view = self._cached_es_view()
+        view._single_flight = Mock()
+        result = view.get_collection_coalesced_es()
+        view._single_flight.do.assert_called_once_with(
+            view._read_key(), view.get_collection_es)
+        assert result == view._single_flight.do()
+
+    def test_get_collection_coalesced_es_disabled(self):
+        view = self._cached_es_view()
+        assert view.get_collection_coalesced_es() == [{'id': 1}]
+        view.get_collection_es.assert_called_once_with()
+
+    def test_get_collection_cached_es_other_principals(self):
+        view = self._cached_es_view()
+        view.get_collection_cached_es()
+        view.request.effective_principals = ['system.Everyone']
+        view.get_collection_cached_es()
+        assert view.get_collection_es.call_count == 2
+
+    def test_index_cursor(self):
+        view = self._test_view()
+        view._query_params['_cursor'] = ''
+        view.get_collection_cursor_es = Mock()
+        assert view.index() == view.get_collection_cursor_es()
+
+    def test_encode_decode_cursor(self):
+        token = views.encode_cursor(['foo', 1])
+        assert views.decode_cursor(token, 2) == ['foo', 1]
+        token = views.encode_cursor(['foo', 1], '-name,-id')
+        assert views.decode_cursor(token, 2, '-name,-id') == ['foo', 1]
+
+    def test_decode_cursor_invalid(self):
+        with pytest.raises(JHTTPBadRequest):
+            views.decode_cursor('foo', 2)
+        with pytest.raises(JHTTPBadRequest):
+            views.decode_cursor(views.encode_cursor([1]), 2)
+        with pytest.raises(JHTTPBadRequest):
+            views.decode_cursor(views.encode_cursor([1], 'id'), 1, '-id')
+
+    def test_add_filter(self):
+        assert views._add_filter({'match_all': {}}, 'f') == {
+            'filtered': {'query': {'match_all': {}}, 'filter': 'f'}}
+        query = {'filtered': {'query': 'q', 'filter': 'f1'}}
+        assert views._add_filter(query, 'f2') == {'filtered': {
+            'query': 'q', 'filter': {'bool': {'must': ['f1', 'f2']}}}}
+        assert query == {'filtered': {'query': 'q', 'filter': 'f1'}}
+
+    def test_cursor_filter(self):
+        view = self._test_view()
+        assert view._cursor_filter(['id'], [1], False) == {
+            'range': {'id': {'gt': 1}}}
+        assert view._cursor_filter(['name', 'id'], ['a', 1], True) == {
+            'bool': {'should': [
+                {'range': {'name': {'lt': 'a'}}},
+                {'bool': {'must': [
+                    {'term': {'name': 'a'}},
+                    {'range': {'id': {'lt': 1}}},
+                ]}},
+            ]}}
+
+    def _cursor_view(self, mock_es):
+        view = self._test_view()
+        view.Model = Mock(__name__='Foo')
+        view.Model.pk_field.return_value = 'id'
+        view._set_parent_filter_es = Mock(return_value=True)
+        view._query_params.update(_limit=2, _start=4)
+        mock_es().build_search_params.return_value = {
+            'body': {'query': 'q'}}
+        docs = MagicMock()
+        docs.__len__.return_value = 2
+        last = Mock(id=2)
+        last.name = 'b'
+        docs.__getitem__.return_value = last
+        docs._nefertari_meta = {}
+        mock_es().get_collection.return_value = docs
+        return view
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_cursor_es_first_page(self, mock_es):
+        view = self._cursor_view(mock_es)
+        view._query_params['_cursor'] = ''
+        docs = view.get_collection_cursor_es()
+        mock_es().build_search_params.assert_called_once_with(
+            {'foo': 'bar', '_limit': 0})
+        mock_es().get_collection.assert_called_once_with(
+            body={'query': 'q'}, _limit=2, _sort='id')
+        assert views.decode_cursor(
+            docs._nefertari_meta['next_cursor'], 1, 'id') == [2]
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_cursor_es(self, mock_es):
+        view = self._cursor_view(mock_es)
+        view._query_params.update(
+            _cursor=views.encode_cursor(['a', 1], '-name,-id'), _sort='-name',
+            _fields='name')
+        view._cursor_filter = Mock()
+        docs = view.get_collection_cursor_es()
+        view._cursor_filter.assert_called_once_with(
+            ['name', 'id'], ['a', 1], True)
+        mock_es().get_collection.assert_called_once_with(
+            body={'query': {'filtered': {
+                'query': 'q', 'filter': view._cursor_filter()}}},
+            _limit=2, _sort='-name,-id', _fields=['name', 'name', 'id'])
+        assert views.decode_cursor(
+            docs._nefertari_meta['next_cursor'], 2, '-name,-id') == ['b', 2]
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_cursor_es_other_sort(self, mock_es):
+        view = self._cursor_view(mock_es)
+        view._query_params.update(
+            _cursor=views.encode_cursor(['a', 1], '-name,-id'), _sort='id')
+        with pytest.raises(JHTTPBadRequest):
+            view.get_collection_cursor_es()
+
+    def _search_query_view(self, **params):
+        from nefertari.elasticsearch import ES
+        view = self._test_view()
+        view._query_params = dictset(params, _limit=2, _fields='title')
+        es = ES('Foo', index_name='foo', chunk_size=10)
+        return view, es
+
+    def test_search_query_es(self):
+        view, es = self._search_query_view(q='a', _search_fields='title')
+        assert view._search_query_es(es) == {'query_string': {
+            'query': 'a', 'fields': ['title^1']}}
+
+    def test_search_query_es_no_query_string(self):
+        view, es = self._search_query_view(_search_fields='title')
+        assert view._search_query_es(es) == {'match_all': {}}
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_collection_cursor_es_last_page(self, mock_es):
+        view = self._cursor_view(mock_es)
+        view._query_params['_cursor'] = ''
+        mock_es().get_collection().__len__.return_value = 1
+        docs = view.get_collection_cursor_es()
+        assert docs._nefertari_meta['next_cursor'] is None
+
+    def test_get_collection_cursor_es_multiple_sort(self):
+        view = self._test_view()
+        view.Model = Mock()
+        view._set_parent_filter_es = Mock(return_value=True)
+        view._query_params.update(_cursor='', _sort='name,-id')
+        with pytest.raises(JHTTPBadRequest):
+            view.get_collection_cursor_es()
+
+    def _es_chunks_view(self):
+        view = self._test_view()
+        view._set_parent_filter_es = Mock(return_value=True)
+        view._stream_limit = Mock(return_value=None)
+        view._scroll_es = Mock(return_value=[
+            (3, [{'_source': {'a': 1}, '_type': 'Foo'},
+                 {'_source': {'a': 2}, '_type': 'Foo'}]),
+            (3, [{'_source': {'a': 3}, '_type': 'Foo'}]),
+        ])
+        return view
+
+    def test_iter_collection_chunks_es(self):
+        from nefertari.elasticsearch import process_fields_param
+        view = self._es_chunks_view()
+        view._query_params['_page'] = 2
+        chunks = list(view.iter_collection_chunks_es())
+        assert chunks == [
+            [{'a': 1, '_type': 'Foo'}, {'a': 2, '_type': 'Foo'}],
+            [{'a': 3, '_type': 'Foo'}],
+        ]
+        view._scroll_es.assert_called_once_with(500, process_fields_param)
+        assert '_page' not in view._query_params
+
+    def test_iter_collection_chunks_es_limit(self):
+        view = self._es_chunks_view()
+        view._stream_limit.return_value = 1
+        chunks = list(view.iter_collection_chunks_es())
+        assert chunks == [[{'a': 1, '_type': 'Foo'}]]
+
+    def test_iter_collection_chunks_es_no_parent_objects(self):
+        view = self._es_chunks_view()
+        view._set_parent_filter_es.return_value = False
+        assert list(view.iter_collection_chunks_es()) == []
+        assert not view._scroll_es.called
+
 
 class TestItemSubresourceBaseView(ViewTestBase):
     view_cls = views.ItemSubresourceBaseView
@@ -497,6 +2014,8 @@ class TestItemSubresourceBaseView(ViewTestBase):
 
     def test_get_item(self):
         view = self._test_view()
+        view._resource = Mock()
+        view._resource.parent.parent = None
         view._parent_queryset = Mock(return_value=[1, 2])
         view.reload_context = Mock()
         view.context = 1
@@ -504,13 +2023,85 @@ class TestItemSubresourceBaseView(ViewTestBase):
         view._parent_queryset.assert_called_once_with()
         view.reload_context.assert_called_once_with(es_based=False, foo=4)
 
+    def _nested_view(self):
+        view = self._test_view()
+        view.request.matchdict = {'user_id': 'A', 'story_id': 42}
+        view._resource = Mock()
+        view._resource.parent.id_name = 'story_id'
+        item_view_cls = view._resource.parent.view
+        item_view_cls.exists_fields.return_value = ['id', 'user_id']
+        item_view = item_view_cls()
+        item_view._db_fetches = 1
+        return view, item_view_cls, item_view
+
+    def test_get_item_nested(self):
+        view, item_view_cls, item_view = self._nested_view()
+        view._parent_queryset = Mock(return_value=None)
+        view.reload_context = Mock()
+        view.context = 1
+        assert view.get_item(story_id=42) == 1
+        context, request = item_view_cls.call_args[0]
+        assert context == 1
+        assert request.matchdict == {'user_id': 'A', 'story_id': 42}
+        item_view.get_item.assert_called_once_with(story_id=42)
+        assert view._db_fetches == 1
+
+    def test_get_item_nested_not_in_parent(self):
+        view, item_view_cls, item_view = self._nested_view()
+        view._parent_queryset = Mock(return_value=None)
+        view.reload_context = Mock()
+        item_view.get_item.side_effect = JHTTPNotFound
+        with pytest.raises(JHTTPNotFound):
+            view.get_item(story_id=42)
+
+    def test_get_item_es_nested(self):
+        view, item_view_cls, item_view = self._nested_view()
+        view._factory = Mock()
+        view._es_fields = Mock(return_value=['tags'])
+        acl = view._factory()
+        acl.item_db_id.return_value = 42
+        assert view.get_item_es(story_id=42) == acl.getitem_es()
+        acl.getitem_es.assert_any_call(
+            42, fields=['tags', 'id', 'user_id'])
+        context, request = item_view_cls.call_args[0]
+        assert context == acl.getitem_es()
+        item_view.get_item_es.assert_called_once_with(story_id=42)
+        assert not item_view.get_item.called
+
+    def test_get_item_es(self):
+        view = self._test_view()
+        view._resource = Mock()
+        view._resource.parent.id_name = 'user_id'
+        view._resource.parent.parent = None
+        view._factory = Mock()
+        view._es_fields = Mock(return_value=['tags'])
+        acl = view._factory()
+        acl.item_db_id.return_value = 2
+        assert view.get_item_es(user_id=1) == acl.getitem_es()
+        view._factory.assert_called_with(
+            request=view.request, es_based=True)
+        acl.item_db_id.assert_called_once_with('1')
+        acl.getitem_es.assert_any_call(2, fields=['tags'])
+        assert view.context == acl.getitem_es()
+
+    def test_get_read_item(self):
+        view = self._test_view()
+        view.get_item = Mock()
+        view.get_item_es = Mock()
+        assert view.get_read_item(foo=1) == view.get_item()
+        view._es_reads = True
+        assert view.get_read_item(foo=1) == view.get_item_es()
+        view.get_item_es.assert_any_call(foo=1)
+
 
 class TestItemAttributeView(ViewTestBase):
     view_cls = views.ItemAttributeView
     request_kwargs = dict(
         method='GET',
         accept=[''],
-        path='user/1/settings'
+        path='user/1/settings',
+        params={},
+        matchdict={},
     )
 
     def test_init(self):
@@ -518,19 +2109,248 @@ class TestItemAttributeView(ViewTestBase):
         assert view.value_type is None
         assert view.unique
         assert view.attr == 'settings'
+        assert view.key is None
+
+    def _key_view(self, key='theme', method='GET', **kwargs):
+        class View(self.view_cls, BaseView):
+            _json_encoder = 'foo'
+            _resource = Mock(id_name='settings_key')
+        View._resource.parent.id_name = 'user_id'
+        View._resource.parent.parent = None
+        request_kwargs = dict(
+            self.request_kwargs, method=method,
+            path='user/1/settings/' + key,
+            matchdict={'user_id': '1', 'settings_key': key}, **kwargs)
+        request = Mock(**request_kwargs)
+        view = View(request=request, **self.view_kwargs)
+        view.Model = Mock(__name__='User')
+        return view
+
+    def test_init_key(self):
+        view = self._key_view()
+        assert view.attr == 'settings'
+        assert view.key == 'theme'
+        assert view._es_fields() == ['settings.theme']
+
+    def test_prepare_request_params_key(self):
+        view = self._key_view(
+            method='PUT', content_type='application/json', json='dark')
+        assert view._key_value == 'dark'
+        assert view._json_params == {}
+        assert view._query_params == {'foo': 'bar'}
+
+    @patch('ramses.views.get_keys')
+    def test_show(self, mock_keys):
+        mock_keys.return_value = {'theme': 'dark'}
+        view = self._key_view()
+        assert view.show(user_id='1', settings_key='theme') == 'dark'
+        mock_keys.assert_called_once_with(
+            view.Model, '1', 'settings', ['theme'])
+
+    @patch('ramses.views.get_keys')
+    def test_show_missing(self, mock_keys):
+        mock_keys.return_value = {}
+        view = self._key_view()
+        with pytest.raises(JHTTPNotFound):
+            view.show(user_id='1', settings_key='theme')
+
+    @patch('ramses.views.get_keys')
+    def test_show_es(self, mock_keys):
+        view = self._key_view()
+        view._es_reads = True
+        view.get_item_es = Mock(return_value=dict2obj({
+            '_type': 'User', 'settings': {'theme': {'color': 'dark'}}}))
+        value = view.show(user_id='1', settings_key='theme')
+        assert value == {'color': 'dark'}
+        assert not mock_keys.called
+
+    def test_show_invalid_key(self):
+        view = self._key_view(key='-theme')
+        with pytest.raises(JHTTPBadRequest):
+            view.show(user_id='1', settings_key='-theme')
+
+    def test_setup_default_wrappers_key(self):
+        view = self._key_view()
+        for meth in ('replace', 'update', 'delete'):
+            assert view._before_calls[meth][0] == view._prepare_key_write
+        view = self._test_view()
+        assert view._before_calls['replace'] == []
+
+    def test_key_writes_trigger_update_events(self):
+        for meth in ('replace', 'update', 'delete'):
+            method = getattr(self.view_cls, meth)
+            assert method._event_action == 'update'
+
+    def test_prepare_key_write(self):
+        view = self._key_view(method='PUT')
+        view._auth_enabled = False
+        view._key_value = 'dark'
+        view.get_item = Mock()
+        view.get_item().settings = {'lang': 'en', 'theme': 'light'}
+        view._prepare_key_write(request=view.request)
+        view.get_item.assert_called_with(user_id='1', settings_key='theme')
+        assert view._key_item == view.get_item()
+        assert view._json_params == {
+            'settings': {'lang': 'en', 'theme': 'dark'}}
+        assert view.get_item().settings == {'lang': 'en', 'theme': 'light'}
+
+    def test_prepare_key_write_delete(self):
+        view = self._key_view(method='DELETE')
+        view._auth_enabled = False
+        view.get_item = Mock()
+        view.get_item().settings = {'lang': 'en', 'theme': 'light'}
+        view._prepare_key_write()
+        assert view._json_params['settings'] == {'lang': 'en'}
+
+    @patch('ramses.views.wrappers')
+    def test_prepare_key_write_privacy(self, mock_wrap):
+        view = self._key_view(method='PUT')
+        view._auth_enabled = True
+        view._key_value = 'dark'
+        view.get_item = Mock()
+        view.get_item().settings = None
+        view._prepare_key_write()
+        mock_wrap.apply_request_privacy.assert_called_once_with(
+            view.Model, {'settings': {'theme': 'dark'}})
+        mock_wrap.apply_request_privacy().assert_called_once_with(
+            request=view.request)
+
+    def test_prepare_key_write_invalid_key(self):
+        view = self._key_view(key='-theme', method='DELETE')
+        with pytest.raises(JHTTPBadRequest):
+            view._prepare_key_write()
+
+    def test_replace(self):
+        view = self._key_view(method='PUT')
+        view._key_item = Mock(settings={'theme': 'dark'})
+        view._json_params = {'settings': {'theme': 'dark'}}
+        assert view.replace(user_id='1') == 'dark'
+        view._key_item.update.assert_called_once_with(
+            {'settings': {'theme': 'dark'}}, view.request)
+
+    def test_delete(self):
+        view = self._key_view(method='DELETE')
+        view._auth_enabled = False
+        view.get_item = Mock()
+        view.get_item().settings = {'theme': 'dark'}
+        view.delete(user_id='1')
+        view.get_item().update.assert_called_once_with(
+            {'foo2': 'bar2', 'settings': {}}, view.request)
 
     def test_index(self):
         view = self._test_view()
         view.get_item = Mock()
+        view.get_item().settings = {'a': 1}
         resp = view.index(foo=1)
-        view.get_item.assert_called_once_with(foo=1)
-        assert resp == view.get_item().settings
+        view.get_item.assert_called_with(foo=1)
+        assert resp == {'a': 1}
 
-    def test_create(self):
+    def test_index_paged(self):
         view = self._test_view()
+        view.request.params = {'_limit': '2'}
+        view.get_slice = Mock()
         view.get_item = Mock()
-        resp = view.create(foo=1)
-        view.get_item.assert_called_once_with(foo=1)
+        resp = view.index(foo=1)
+        view.get_slice.assert_called_once_with(foo=1)
+        assert resp == view.get_slice()
+        assert not view.get_item.called
+
+    def test_index_es(self):
+        view = self._test_view()
+        view._es_reads = True
+        view.get_item_es = Mock(
+            return_value=dict2obj({'settings': {'a': {'b': 1}}}))
+        resp = view.index(foo=1)
+        view.get_item_es.assert_called_once_with(foo=1)
+        assert resp == {'a': {'b': 1}}
+        assert not hasattr(resp, 'to_dict')
+        assert view._es_fields() == ['settings']
+
+    def _slice_view(self, **params):
+        view = self._test_view()
+        view._query_params = dictset(params)
+        view._resource = Mock()
+        view._resource.parent.id_name = 'user_id'
+        view._resource.parent.parent = None
+        view.Model = Mock()
+        view.get_item = Mock()
+        return view
+
+    @patch('ramses.views.get_slice')
+    def test_get_slice(self, mock_slice):
+        mock_slice.return_value = ['c', 'd', 'e']
+        view = self._slice_view(_limit=2, _start=2)
+        result = view.get_slice(user_id=1)
+        mock_slice.assert_called_once_with(view.Model, '1', 'settings', 2, 3)
+        assert result == ['c', 'd']
+        assert result._nefertari_meta == {
+            'start': 2, 'next_cursor': views.encode_cursor([4])}
+        assert not view.get_item.called
+
+    @patch('ramses.views.get_slice')
+    def test_get_slice_cursor_last_page(self, mock_slice):
+        mock_slice.return_value = ['e']
+        view = self._slice_view(
+            _limit=2, _cursor=views.encode_cursor([4]))
+        result = view.get_slice(user_id=1)
+        mock_slice.assert_called_once_with(view.Model, '1', 'settings', 4, 3)
+        assert result == ['e']
+        assert result._nefertari_meta == {'start': 4, 'next_cursor': None}
+
+    def test_get_slice_invalid_cursor(self):
+        view = self._slice_view(_limit=2, _cursor=views.encode_cursor(['a']))
+        with pytest.raises(JHTTPBadRequest):
+            view.get_slice(user_id=1)
+
+    def test_get_slice_invalid_limit(self):
+        view = self._slice_view(_limit=-2)
+        with pytest.raises(JHTTPBadRequest):
+            view.get_slice(user_id=1)
+
+    @patch('ramses.views.get_slice')
+    def test_get_slice_not_supported(self, mock_slice):
+        mock_slice.return_value = None
+        view = self._slice_view(_limit=2, _page=1)
+        view.get_item.return_value = Mock(settings=['a', 'b', 'c'])
+        result = view.get_slice(user_id=1)
+        view.get_item.assert_called_once_with(user_id=1)
+        assert result == ['c']
+        assert result._nefertari_meta['next_cursor'] is None
+
+    @patch('ramses.views.get_slice')
+    def test_get_slice_es(self, mock_slice):
+        view = self._slice_view(_limit=2)
+        view._es_reads = True
+        view.get_item_es = Mock()
+        view.get_item_es.return_value = Mock(settings=['a', 'b', 'c'])
+        result = view.get_slice(user_id=1)
+        assert not mock_slice.called
+        view.get_item_es.assert_called_once_with(user_id=1)
+        assert result == ['a', 'b']
+        assert result._nefertari_meta['next_cursor'] == \
+            views.encode_cursor([2])
+
+    @patch('ramses.views.get_slice')
+    def test_get_slice_dict(self, mock_slice):
+        mock_slice.return_value = None
+        view = self._slice_view(_limit=2)
+        view.get_item.return_value = Mock(settings={'a': 1})
+        assert view.get_slice(user_id=1) == {'a': 1}
+
+    @patch('ramses.views.update_iterable')
+    def test_create(self, mock_update):
+        mock_update.return_value = None
+        view = self._test_view()
+        view._resource = Mock()
+        view._resource.parent.id_name = 'user_id'
+        view._resource.parent.parent = None
+        view.Model = Mock()
+        view.get_item = Mock()
+        resp = view.create(foo=1, user_id=1)
+        mock_update.assert_called_once_with(
+            view.Model, '1', 'settings', {'foo2': 'bar2'},
+            unique=True, request=view.request)
+        view.get_item.assert_called_once_with(foo=1, user_id=1)
         obj = view.get_item()
         obj.update_iterables.assert_called_once_with(
             {'foo2': 'bar2'}, 'settings',
@@ -538,6 +2358,49 @@ class TestItemAttributeView(ViewTestBase):
             request=view.request)
         assert resp == obj.settings
 
+    @patch('ramses.views.update_iterable')
+    def test_create_atomic(self, mock_update):
+        view = self._test_view()
+        view._resource = Mock()
+        view._resource.parent.id_name = 'user_username'
+        view._resource.parent.parent = None
+        view.context = Mock(spec=acl.BaseACL)
+        view.context.item_db_id.return_value = 'user12'
+        view.Model = Mock()
+        view.get_item = Mock()
+        resp = view.create(foo=1, user_username='self')
+        view.context.item_db_id.assert_called_once_with('self')
+        mock_update.assert_called_once_with(
+            view.Model, 'user12', 'settings', {'foo2': 'bar2'},
+            unique=True, request=view.request)
+        assert resp == mock_update()
+        assert not view.get_item.called
+
+    @patch('ramses.views.update_iterable')
+    def test_create_nested(self, mock_update):
+        view = self._test_view()
+        view._resource = Mock()
+        view._resource.parent.id_name = 'story_id'
+        view.context = Mock(spec=acl.BaseACL)
+        view.Model = Mock()
+        view.get_item = Mock()
+        resp = view.create(story_id=42)
+        assert not view.context.item_db_id.called
+        assert not mock_update.called
+        view.get_item.assert_called_once_with(story_id=42)
+        assert resp == view.get_item().settings
+
+    @patch('ramses.views.update_iterable')
+    def test_create_unresolved_self(self, mock_update):
+        view = self._test_view()
+        view._resource = Mock()
+        view._resource.parent.id_name = 'user_username'
+        view._resource.parent.parent = None
+        view.get_item = Mock()
+        resp = view.create(user_username='self')
+        assert not mock_update.called
+        assert resp == view.get_item().settings
+
 
 class TestItemSingularView(ViewTestBase):
     view_cls = views.ItemSingularView
@@ -552,6 +2415,27 @@ class TestItemSingularView(ViewTestBase):
         view = self._test_view()
         assert view.attr == 'profile'
 
+    def test_get_item(self):
+        class Factory(object):
+            item_model = None
+
+            def __init__(self, request):
+                pass
+
+            def __getitem__(self, key):
+                return self.item_model, key
+
+        view = self._test_view()
+        view._parent_model = Mock(__name__='User')
+        view.Model = Mock(__name__='Profile')
+        view._factory = Factory
+        view._resource = Mock()
+        view._resource.parent.id_name = 'user_id'
+        view._resource.parent.parent = None
+        view._parent_queryset = Mock(return_value=None)
+        assert view.get_item(user_id=1) == (view._parent_model, '1')
+        assert view.Model.__name__ == 'Profile'
+
     def test_show(self):
         view = self._test_view()
         view.get_item = Mock()
@@ -559,6 +2443,72 @@ class TestItemSingularView(ViewTestBase):
         view.get_item.assert_called_once_with(foo=1)
         assert resp == view.get_item().profile
 
+    def test_show_es(self):
+        view = self._test_view()
+        view._es_reads = True
+        view.get_singular_es = Mock()
+        assert view.show(foo=1) == view.get_singular_es()
+        view.get_singular_es.assert_any_call(foo=1)
+        assert view._es_fields() == ['profile']
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_singular_es_nested(self, mock_es):
+        view = self._test_view()
+        profile = dict2obj({'_type': 'Profile', 'id': 3})
+        view.get_item_es = Mock(return_value=Mock(profile=profile))
+        assert view.get_singular_es(foo=1) is profile
+        view.get_item_es.assert_called_once_with(foo=1)
+        assert not mock_es.called
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_singular_es_id(self, mock_es):
+        view = self._test_view()
+        view.Model = Mock(__name__='Profile')
+        view.get_item_es = Mock(return_value=Mock(profile=3))
+        assert view.get_singular_es(foo=1) == mock_es().get_item()
+        mock_es.assert_any_call('Profile')
+        mock_es().get_item.assert_any_call(id=3)
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_singular_es_missing(self, mock_es):
+        view = self._test_view()
+        view.get_item_es = Mock(return_value=Mock(profile=None))
+        assert view.get_singular_es(foo=1) is None
+        assert not mock_es.called
+
+    def test_show_es(self):
+        view = self._test_view()
+        view._es_reads = True
+        view.get_singular_es = Mock()
+        assert view.show(foo=1) == view.get_singular_es()
+        view.get_singular_es.assert_any_call(foo=1)
+        assert view._es_fields() == ['profile']
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_singular_es_nested(self, mock_es):
+        view = self._test_view()
+        profile = dict2obj({'_type': 'Profile', 'id': 3})
+        view.get_item_es = Mock(return_value=Mock(profile=profile))
+        assert view.get_singular_es(foo=1) is profile
+        view.get_item_es.assert_called_once_with(foo=1)
+        assert not mock_es.called
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_singular_es_id(self, mock_es):
+        view = self._test_view()
+        view.Model = Mock(__name__='Profile')
+        view.get_item_es = Mock(return_value=Mock(profile=3))
+        assert view.get_singular_es(foo=1) == mock_es().get_item()
+        mock_es.assert_any_call('Profile')
+        mock_es().get_item.assert_any_call(id=3)
+
+    @patch('nefertari.elasticsearch.ES')
+    def test_get_singular_es_missing(self, mock_es):
+        view = self._test_view()
+        view.get_item_es = Mock(return_value=Mock(profile=None))
+        assert view.get_singular_es(foo=1) is None
+        assert not mock_es.called
+
     def test_create(self):
         view = self._test_view()
         view.set_object_acl = Mock()
@@ -567,8 +2517,12 @@ class TestItemSingularView(ViewTestBase):
         }
         view.get_item = Mock()
         view.Model = Mock()
+        view._parent_model = Mock()
+        view._parent_model.get_field_params.return_value = {}
         resp = view.create(foo=1)
         view.get_item.assert_called_once_with(foo=1)
+        view._parent_model.get_field_params.assert_called_once_with(
+            'profile')
         view.Model.assert_called_once_with(foo2='bar2')
         child = view.Model()
         child.save.assert_called_once_with(view.request)
@@ -578,6 +2532,23 @@ class TestItemSingularView(ViewTestBase):
         assert view.set_object_acl.call_count == 1
         assert resp == child.save()
 
+    def test_create_backref(self):
+        view = self._test_view()
+        view.set_object_acl = Mock()
+        view.get_item = Mock()
+        view.Model = Mock()
+        view._parent_model = Mock()
+        view._parent_model.get_field_params.return_value = {
+            'backref_name': 'user'}
+        resp = view.create(foo=1)
+        parent = view.get_item()
+        view.Model.assert_called_once_with(foo2='bar2', user=parent)
+        child = view.Model()
+        child.save.assert_called_once_with(view.request)
+        assert not parent.update.called
+        assert view._json_params == {'foo2': 'bar2'}
+        assert resp == child.save()
+
     def test_update(self):
         view = self._test_view()
         view.get_item = Mock()
@@ -681,6 +2652,114 @@ class TestRestViewGeneration(object):
         assert issubclass(view_cls, views.CollectionView)
         assert view_cls.Model == 'foo'
 
+    def test_mget_parents_option(self):
+        config = config_mock()
+        config.registry.mget_parents = True
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], es_based=True)
+        assert view._mget_parents
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], es_based=False)
+        assert not getattr(view, '_mget_parents', False)
+
+    def test_bulk_chunk_size_option(self):
+        config = config_mock()
+        config.registry.bulk_chunk_size = 500
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], es_based=True)
+        assert view._bulk_chunk_size == 500
+
+    def test_set_based_bulk_option(self):
+        config = config_mock()
+        model_cls = Mock(_set_based_bulk=True)
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], es_based=False)
+        assert view._set_based_bulk
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], es_based=False)
+        assert not view._set_based_bulk
+
+    def test_es_refresh_option(self):
+        config = config_mock()
+        model_cls = Mock(_es_refresh='immediate')
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['create'], es_based=True)
+        assert view._es_refresh == 'immediate'
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['create'], es_based=True)
+        assert view._es_refresh is None
+
+    def test_cache_options(self):
+        config = config_mock()
+        model_cls = Mock(
+            _cache_control='max-age=60', _cache_validator='updated_at')
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], es_based=True)
+        assert view._cache_control == 'max-age=60'
+        assert view._cache_validator == 'updated_at'
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], es_based=True)
+        assert view._cache_control is None
+        assert view._cache_validator is None
+
+    def test_collection_cache_option(self):
+        config = config_mock()
+        model_cls = Mock(_collection_cache='cache')
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], es_based=True)
+        assert view._collection_cache == 'cache'
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], es_based=False)
+        assert not hasattr(view, '_collection_cache')
+
+    def test_single_flight_option(self):
+        config = config_mock()
+        model_cls = Mock(_single_flight='flight')
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], es_based=True)
+        assert view._single_flight == 'flight'
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], es_based=True)
+        assert view._single_flight is None
+
+    def test_es_reads_option(self):
+        config = config_mock()
+        model_cls = Mock(_es_reads=True)
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], attr_view=True)
+        assert view._es_reads
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], singular=True)
+        assert view._es_reads
+        view = views.generate_rest_view(
+            config, model_cls=model_cls, attrs=['show'], es_based=False,
+            attr_view=True)
+        assert not view._es_reads
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], attr_view=True)
+        assert not view._es_reads
+        view = views.generate_rest_view(
+            config, model_cls=Mock(spec=['_index_enabled']),
+            attrs=['show'], attr_view=True)
+        assert not view._es_reads
+
+    def test_plain_value(self):
+        doc = dict2obj({
+            'settings': {'a': {'b': 1}},
+            'tags': [{'name': 'a'}, 'b'],
+        })
+        assert views.plain_value(doc.settings) == {'a': {'b': 1}}
+        assert views.plain_value(doc.tags) == [{'name': 'a'}, 'b']
+        assert views.plain_value(1) == 1
+
+    def test_mget_parents_option_database_acls(self):
+        config = config_mock()
+        config.registry.mget_parents = True
+        config.registry.database_acls = True
+        view = views.generate_rest_view(
+            config, model_cls='foo', attrs=['show'], es_based=True)
+        assert not view._mget_parents
+
     def test_database_acls_option(self):
         from nefertari_guards.view import ACLFilterViewMixin
         config = config_mock()